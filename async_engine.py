@@ -0,0 +1,381 @@
+import asyncio
+import functools
+import sqlite3
+import time
+import aiohttp
+from config import (BASE_URL, BASE_DOMAIN, SEARCH_KEYWORD, ASYNC_MAX_CONNECTIONS,
+                    REQUEST_TIMEOUT_SECONDS, PAGE_DELAY_SECONDS, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE,
+                    PDF_CHUNK_SIZE, DEFAULT_HOST_CONCURRENCY, HTTP_KEEPALIVE_SECONDS, RATE_LIMIT_ENABLED)
+from crawl_utils import get_hidden_fields, create_payload
+from crawl_url_pdf import PartialDownload, PdfItem, enqueue_for_conversion
+from progress_store import PDF_DOWNLOADED, PDF_SKIPPED
+from page_parser import parse_listing
+from search_filters import scope_key
+from work_scheduler import NO_WORK_YET, build_scheduler, batch_label
+from session_state import is_state_rejected
+from transport import get_host, get_host_limit
+from rate_limiter import get_rate_limiter, is_overload_status
+from checkpoint_utils import register_page_links
+from metrics import metrics, get_logger, fields
+
+log = get_logger("async")
+
+# Lỗi mạng của aiohttp tương đương RequestException bên engine thread
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# Listing và trang chi tiết: giới hạn thời gian cả request (timeout mặc định của session).
+# PDF lớn có thể tải lâu hơn REQUEST_TIMEOUT_SECONDS nên chỉ giới hạn lúc kết nối và
+# khoảng chờ giữa hai lần nhận dữ liệu, không giới hạn tổng thời gian
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+PDF_STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=REQUEST_TIMEOUT_SECONDS,
+                                           sock_read=REQUEST_TIMEOUT_SECONDS)
+
+# Semaphore giới hạn request đồng thời mỗi host (cùng cấu hình với transport.py);
+# tạo lại cho mỗi lần run_batches vì semaphore gắn với event loop
+_host_slots = {}
+
+
+def host_slot(url):
+    host = get_host(url)
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(get_host_limit(host))
+    return slot
+
+
+class request_slot:
+    """Per-host slot plus the shared adaptive rate limiter around one request.
+
+    The outcome is reported to the limiter on exit: a ClientResponseError with
+    a 5xx/429 status or a network/timeout error counts as overload.
+    """
+
+    def __init__(self, url):
+        self.slot = host_slot(url)
+        self.limiter = get_rate_limiter() if RATE_LIMIT_ENABLED else None
+
+    async def __aenter__(self):
+        await self.slot.acquire()
+        try:
+            while self.limiter is not None:
+                wait = self.limiter.try_acquire()
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.slot.release()
+            raise
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.limiter is not None:
+            if isinstance(exc, aiohttp.ClientResponseError):
+                error = is_overload_status(exc.status)
+            else:
+                error = isinstance(exc, REQUEST_ERRORS)
+            self.limiter.release(time.monotonic() - self.started, error)
+        self.slot.release()
+        return False
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Content-Type": "application/x-www-form-urlencoded"
+}
+
+
+async def initialize_session(connector):
+    """Open a client session on the shared connector and fetch the initial ASP.NET state.
+
+    Each batch gets its own ClientSession (own cookie jar, like the per-batch
+    requests.Session of the thread engine) while all of them share `connector`,
+    which bounds the total number of open connections.
+    """
+    session = aiohttp.ClientSession(
+        connector=connector,
+        connector_owner=False,
+        timeout=REQUEST_TIMEOUT,
+    )
+    try:
+        async with request_slot(BASE_URL), session.get(BASE_URL, ssl=False) as response:
+            response.raise_for_status()
+            html = await response.text()
+    except BaseException:
+        await session.close()
+        raise
+    return session, get_hidden_fields(html)
+
+
+async def crawl_page(session, page, hidden_fields, drop_levels, filters=None):
+    payload = create_payload(hidden_fields, page, drop_levels, SEARCH_KEYWORD, filters)
+    try:
+        with metrics.timer("listing_post"):
+            async with request_slot(BASE_URL), session.post(BASE_URL, data=payload, headers=HEADERS, ssl=False) as response:
+                response.raise_for_status()
+                html = await response.text()
+        with metrics.timer("listing_parse"):
+            page_links, new_hidden_fields = parse_listing(html, BASE_DOMAIN)
+        log.debug(f"📄 Page {page}: {len(page_links)} detail links", extra=fields(page=page, drop_levels=drop_levels))
+        return page_links, new_hidden_fields, True
+    except REQUEST_ERRORS as e:
+        log.warning(f"❌ Error on page {page}: {e}", extra=fields(page=page, drop_levels=drop_levels))
+        return [], hidden_fields, False
+
+
+async def stream_pdf_to_file(session, pdf_url, file_path, chunk_size=PDF_CHUNK_SIZE):
+    """Async counterpart of crawl_url_pdf.stream_pdf_to_file (same PartialDownload: `.part` file, Range resume, hash).
+
+    Disk work (hashing the existing `.part` file, each chunk write, the final
+    rename) runs in the default executor so a slow disk does not stall the
+    other downloads and listing requests on the event loop.
+    """
+    download = await asyncio.to_thread(PartialDownload, file_path, pdf_url)
+    async with request_slot(pdf_url), session.get(pdf_url, headers=download.headers, ssl=False,
+                                                  timeout=PDF_STREAM_TIMEOUT) as pdf_response:
+        restart = download.must_restart(pdf_response.status, pdf_response.headers.get("Content-Range"))
+        if not restart:
+            pdf_response.raise_for_status()
+            await asyncio.to_thread(download.open, pdf_response.status)
+            try:
+                async for chunk in pdf_response.content.iter_chunked(chunk_size):
+                    await asyncio.to_thread(download.write, chunk)
+            finally:
+                await asyncio.to_thread(download.close)
+    if restart:
+        await asyncio.to_thread(download.discard)
+        return await stream_pdf_to_file(session, pdf_url, file_path, chunk_size)
+    return await asyncio.to_thread(download.commit)
+
+
+async def download_pdf(url, session, drop_levels=None, page_num=None, pdf_index=None):
+    """Async counterpart of crawl_url_pdf.download_pdf; returns (and stores) the same item state."""
+    # Các bước của PdfItem đọc/ghi SQLite (dedup, metadata, trạng thái PDF): chạy ngoài event loop
+    item = PdfItem(url, drop_levels, page_num, pdf_index)
+    skipped = await asyncio.to_thread(item.skip_before_fetch)
+    if skipped:
+        return skipped
+    try:
+        with metrics.timer("detail_get"):
+            async with request_slot(url), session.get(url, ssl=False) as response:
+                response.raise_for_status()
+                html = await response.text()
+        if not await asyncio.to_thread(item.read_detail, html):
+            return PDF_SKIPPED
+        with metrics.timer("pdf_get"):
+            content_hash = await stream_pdf_to_file(session, item.pdf_url, item.file_path)
+        status = await asyncio.to_thread(item.finish, content_hash)
+        if status == PDF_DOWNLOADED:
+            # Hàng đợi convert có giới hạn: put() có thể chờ, không được chặn event loop
+            await asyncio.to_thread(enqueue_for_conversion, item.file_path, item.metadata)
+        return status
+    except (*REQUEST_ERRORS, OSError, sqlite3.Error) as e:
+        # Như engine thread: lỗi ghi file / SQLite cũng đánh dấu PDF lỗi để lần chạy sau tải lại
+        return await asyncio.to_thread(item.fail, e)
+
+
+class DownloadPipeline:
+    """asyncio counterpart of download_pipeline.DownloadPipeline.
+
+    Batches push detail links into a bounded asyncio.Queue and move on to the
+    next listing page; `num_workers` consumer tasks drain it. `submit` waits
+    while the queue is full so listing crawl cannot run far ahead of downloads.
+    """
+
+    def __init__(self, num_workers=DOWNLOAD_WORKERS, max_queue_size=DOWNLOAD_QUEUE_SIZE):
+        self.num_workers = num_workers
+        self.jobs = asyncio.Queue(maxsize=max_queue_size)
+        self.workers = []
+
+    def start(self):
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+        metrics.register_gauge("download_queue_depth", self.jobs.qsize)
+        return self
+
+    async def submit(self, link, session, drop_levels, page, index):
+        future = asyncio.get_running_loop().create_future()
+        await self.jobs.put((future, link, session, drop_levels, page, index))
+        return future
+
+    async def _worker(self):
+        while True:
+            future, link, session, drop_levels, page, index = await self.jobs.get()
+            try:
+                future.set_result(await download_pdf(link, session, drop_levels, page, index))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.jobs.task_done()
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        metrics.unregister_gauge("download_queue_depth")
+
+
+class SessionStateCache:
+    """asyncio counterpart of session_state.SessionStateCache.
+
+    Keeps one search-result ViewState (plus cookies) per search scope so every
+    batch jumps straight to its pages; refreshed only when the server rejects it.
+    """
+
+    def __init__(self, connector):
+        self.connector = connector
+        self._states = {}
+        self._level_locks = {}
+
+    async def get(self, drop_levels, filters=None):
+        state = self._states.get(scope_key(drop_levels, filters))
+        if state is None:
+            state = await self.refresh(drop_levels, filters=filters)
+        return state
+
+    async def refresh(self, drop_levels, stale=None, filters=None):
+        scope = scope_key(drop_levels, filters)
+        async with self._level_locks.setdefault(scope, asyncio.Lock()):
+            current = self._states.get(scope)
+            if current is not None and current is not stale:
+                return current
+            log.info(f"🔑 Làm mới ViewState cho {scope}")
+            session, hidden_fields = await initialize_session(self.connector)
+            try:
+                links, result_fields, success = await crawl_page(session, 1, hidden_fields, drop_levels, filters)
+                cookies = {cookie.key: cookie.value for cookie in session.cookie_jar}
+            finally:
+                await session.close()
+            if is_state_rejected(success, result_fields):
+                raise aiohttp.ClientError(
+                    f"Không lấy được ViewState kết quả tìm kiếm cho {scope}")
+            state = (result_fields, cookies)
+            self._states[scope] = state
+            return state
+
+    async def new_session(self, drop_levels, filters=None):
+        hidden_fields, cookies = await self.get(drop_levels, filters)
+        session = aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            cookies=cookies,
+            timeout=REQUEST_TIMEOUT,
+        )
+        return session, hidden_fields
+
+    async def crawl_page(self, session, page, hidden_fields, drop_levels, filters=None):
+        try:
+            state = await self.get(drop_levels, filters)
+        except REQUEST_ERRORS as e:
+            log.warning(f"❌ {e}")
+            return [], hidden_fields, False
+        for attempt in range(2):
+            cached_fields, cookies = state
+            session.cookie_jar.update_cookies(cookies)
+            links, new_fields, success = await crawl_page(session, page, cached_fields, drop_levels, filters)
+            if not is_state_rejected(success, new_fields):
+                return links, cached_fields, True
+            if attempt == 0:
+                try:
+                    state = await self.refresh(drop_levels, stale=state, filters=filters)
+                except REQUEST_ERRORS as e:
+                    log.warning(f"❌ {e}")
+                    break
+        return [], state[0], False
+
+
+async def range_worker(worker_id, scheduler, state_cache, pipeline):
+    """Async counterpart of batch_worker.range_worker: pull pages of every scope from the shared WorkScheduler."""
+    sessions = {}
+    pending_downloads = []
+    current = None
+    try:
+        while True:
+            claimed = scheduler.try_claim(current)
+            if claimed is None:
+                break
+            if claimed is NO_WORK_YET:
+                # Chưa có việc nhưng page khác còn đang chạy (có thể được đưa lại để retry)
+                current = None
+                await asyncio.sleep(0.05)
+                continue
+            current, page = claimed
+            scope, batch = current.scope, current.batch
+            label = batch_label(batch)
+            drop_levels, filters = scheduler.scopes[scope]
+            log.debug(f"[WORKER {worker_id}] --- Batch {label}, page {page} ---")
+            page_links, success = [], False
+            try:
+                if scope not in sessions:
+                    sessions[scope] = await state_cache.new_session(drop_levels, filters)
+                session, hidden_fields = sessions[scope]
+                page_links, hidden_fields, success = await state_cache.crawl_page(
+                    session, page, hidden_fields, drop_levels, filters)
+                sessions[scope] = (session, hidden_fields)
+                if success:
+                    log.info(f"[BATCH {label}] ✅ Page {page} hoàn thành: {len(page_links)} links")
+                    pending_downloads = [f for f in pending_downloads if not f.done()]
+                    for i, link in await asyncio.to_thread(register_page_links, scope, page, page_links):
+                        future = await pipeline.submit(link, session, scope, page, i)
+                        future.add_done_callback(functools.partial(scheduler.count_download, batch))
+                        pending_downloads.append(future)
+                else:
+                    log.warning(f"[BATCH {label}] ❌ Page {page} thất bại")
+            except REQUEST_ERRORS as e:
+                log.warning(f"[BATCH {label}] ❌ Không mở được phiên cho {scope}: {e}")
+            finally:
+                # finish_page lưu checkpoint vào SQLite: chạy ngoài event loop
+                if await asyncio.to_thread(scheduler.finish_page, batch, page, len(page_links), success):
+                    log.info(f"[BATCH {label}] 🔁 Page {page} được đưa lại hàng đợi để thử lại")
+            await asyncio.sleep(PAGE_DELAY_SECONDS)
+        if pending_downloads:
+            await asyncio.wait(pending_downloads)
+    finally:
+        for session, _ in sessions.values():
+            await session.close()
+
+
+async def resume_unfinished_pdfs(scheduler, pipeline, connector):
+    """Download the PDFs of pages crawled in an earlier run that never finished (crash, network error)."""
+    unfinished = await asyncio.to_thread(lambda: list(scheduler.unfinished_pdfs()))
+    if not unfinished:
+        return
+    print(f"♻️ Tải lại {len(unfinished)} PDF chưa xong của các page đã crawl")
+    async with aiohttp.ClientSession(connector=connector, connector_owner=False,
+                                     timeout=REQUEST_TIMEOUT) as session:
+        futures = []
+        for batch, page, i, link in unfinished:
+            future = await pipeline.submit(link, session, batch[0], page, i)
+            future.add_done_callback(functools.partial(scheduler.count_download, batch))
+            futures.append(future)
+        await asyncio.wait(futures)
+
+
+async def run_batches(jobs, num_workers):
+    """Run `num_workers` coroutines that pull pages of every batch of every job from one shared WorkScheduler.
+
+    Args:
+        jobs: list of (drop_levels, filters, max_pages, batch_size), see main_batch.plan_jobs.
+    """
+    _host_slots.clear()
+    scheduler = build_scheduler(jobs)
+    connector = aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS, limit_per_host=DEFAULT_HOST_CONCURRENCY,
+                                     keepalive_timeout=HTTP_KEEPALIVE_SECONDS, ssl=False)
+    pipeline = DownloadPipeline().start()
+    state_cache = SessionStateCache(connector)
+
+    print(f"\n⚡ Engine async: {num_workers} worker crawl, {DOWNLOAD_WORKERS} worker download, "
+          f"tối đa {ASYNC_MAX_CONNECTIONS} kết nối; {len(jobs)} phạm vi, tổng batches: {len(scheduler.checkpoints)}")
+    try:
+        results = await asyncio.gather(
+            resume_unfinished_pdfs(scheduler, pipeline, connector),
+            *(range_worker(worker_id, scheduler, state_cache, pipeline)
+              for worker_id in range(1, num_workers + 1)),
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    finally:
+        await pipeline.stop()
+        await connector.close()
+        await asyncio.to_thread(scheduler.save_all)
@@ -1,32 +1,84 @@
 import time
+import threading
+import functools
+import concurrent.futures
+import requests
 from crawl_url_pdf import download_pdf
 from crawl_utils import crawl_page
 from checkpoint_utils import (
-    create_checkpoint_structure, save_checkpoint, update_checkpoint_progress, load_checkpoint, get_checkpoint_filename
+    create_checkpoint_structure, save_checkpoint, update_checkpoint_progress, get_checkpoint_filename,
+    register_page_links
 )
-from config import PAGE_RETRY_LIMIT, RETRY_DELAY_SECONDS
+from progress_store import PDF_DOWNLOADED
+from config import PAGE_RETRY_LIMIT, RETRY_DELAY_SECONDS, PAGE_DELAY_SECONDS
 from retry_utils import retry_page
+from search_filters import scope_key, describe_scope
+from work_scheduler import batch_label
+from transport import get_transport
+from metrics import get_logger
 
-def batch_worker(drop_levels, batch_num, start_page, end_page, max_pages, batch_size, session, hidden_fields, existing_checkpoint=None, BASE_DOMAIN=None, SEARCH_KEYWORD=None):
-    print(f"\n🚀 [BATCH {batch_num}] Bắt đầu từ page {start_page} đến {end_page} (DROP_LEVELS={drop_levels})")
+log = get_logger("batch")
+
+def batch_worker(drop_levels, batch_num, start_page, end_page, max_pages, batch_size, session, hidden_fields, existing_checkpoint=None, BASE_DOMAIN=None, SEARCH_KEYWORD=None, pipeline=None, state_cache=None, filters=None, stop_event=None):
+    # Checkpoint và tên file theo phạm vi tìm kiếm; không có bộ lọc thì scope == drop_levels
+    scope = scope_key(drop_levels, filters)
+    log.info(f"🚀 [BATCH {batch_num}] Bắt đầu từ page {start_page} đến {end_page} (DROP_LEVELS={scope})")
     if existing_checkpoint:
         checkpoint_data = existing_checkpoint
         if checkpoint_data['last_processed_page'] == 0:
             start_from_page = start_page
         else:
             start_from_page = checkpoint_data['last_processed_page'] + 1
-        print(f"[BATCH {batch_num}] 🔄 Tiếp tục từ page {start_from_page}")
+        log.info(f"[BATCH {batch_num}] 🔄 Tiếp tục từ page {start_from_page}")
     else:
         checkpoint_data = create_checkpoint_structure(
-            drop_levels, batch_num, start_page, end_page, max_pages, batch_size)
+            scope, batch_num, start_page, end_page, max_pages, batch_size, describe_scope(drop_levels, filters))
         save_checkpoint(checkpoint_data)
-        print(f"[BATCH {batch_num}] 🆕 Tạo checkpoint mới: {get_checkpoint_filename(drop_levels, batch_num)}")
+        log.info(f"[BATCH {batch_num}] 🆕 Tạo checkpoint mới: {get_checkpoint_filename(scope, batch_num)}")
         start_from_page = start_page
 
+    # Có cache ViewState thì mỗi page nhảy thẳng từ state đã cache, không cần chuỗi postback
+    base_crawl_fn = state_cache.crawl_page if state_cache is not None else crawl_page
+
+    def crawl_fn(session, page, hidden_fields, _scope, BASE_DOMAIN, SEARCH_KEYWORD):
+        # retry_page truyền scope (để đặt tên file); request vẫn dùng cấp tòa + bộ lọc thật
+        return base_crawl_fn(session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters)
+
+    # Khi có pipeline, link được đẩy sang pool download riêng và batch đi tiếp page kế.
+    # Luồng download dùng session riêng: requests.Session của batch không an toàn khi dùng chung
+    # giữa luồng crawl và luồng download, và trang chi tiết là GET thường, không cần ViewState/cookie
+    pending_downloads = []
+    counter_lock = threading.Lock()
+    download_session = None
+
+    def _count_download(future):
+        error = future.exception()
+        if error is not None:
+            log.warning(f"[BATCH {batch_num}]    ❌ Lỗi download: {error}")
+            return
+        if future.result() == PDF_DOWNLOADED:
+            with counter_lock:
+                checkpoint_data["total_pdfs_downloaded"] += 1
+
+    def download_link(link, page, index, total):
+        nonlocal download_session
+        if pipeline is not None:
+            download_session = download_session or get_transport().new_session()
+            future = pipeline.submit(link, download_session, scope, page, index)
+            future.add_done_callback(_count_download)
+            pending_downloads.append(future)
+            return
+        log.debug(f"[BATCH {batch_num}]    📄 Downloading PDF {index}/{total}: {link}")
+        try:
+            if download_pdf(link, session, scope, page, index) == PDF_DOWNLOADED:
+                checkpoint_data["total_pdfs_downloaded"] += 1
+        except Exception as e:
+            log.warning(f"[BATCH {batch_num}]    ❌ Lỗi download: {e}")
+
     # First, attempt to retry any previously failed pages up to the retry limit
-    failed_pages = list(checkpoint_data.get("failed_pages", []))
+    failed_pages = sorted(checkpoint_data.get("failed_pages", ()))
     if failed_pages:
-        print(f"[BATCH {batch_num}] 🔁 Found failed pages to retry: {failed_pages}")
+        log.info(f"[BATCH {batch_num}] 🔁 Found failed pages to retry: {failed_pages}")
     for fp in failed_pages:
         # Skip if already completed
         if fp in checkpoint_data.get("completed_pages", []):
@@ -36,10 +88,10 @@ def batch_worker(drop_levels, batch_num, start_page, end_page, max_pages, batch_
             page=fp,
             session=session,
             hidden_fields=hidden_fields,
-            drop_levels=drop_levels,
+            drop_levels=scope,
             BASE_DOMAIN=BASE_DOMAIN,
             SEARCH_KEYWORD=SEARCH_KEYWORD,
-            crawl_fn=crawl_page,
+            crawl_fn=crawl_fn,
             download_fn=download_pdf,
             checkpoint_data=checkpoint_data,
             max_retries=PAGE_RETRY_LIMIT,
@@ -47,31 +99,91 @@ def batch_worker(drop_levels, batch_num, start_page, end_page, max_pages, batch_
         )
         save_checkpoint(checkpoint_data)
 
+    def wait_for_downloads():
+        if pending_downloads:
+            log.info(f"[BATCH {batch_num}] ⏳ Đợi {len(pending_downloads)} PDF còn trong pipeline...")
+            concurrent.futures.wait(pending_downloads)
+
     for page in range(start_from_page, end_page + 1):
+        # Chế độ coordinator: lease đã bị node khác nhận thì dừng, để checkpoint dở cho node đó.
+        # PDF đã đưa vào pipeline vẫn được đợi tải xong, để trạng thái của chúng đã ghi trước khi trả về
+        if stop_event is not None and stop_event.is_set():
+            log.warning(f"[BATCH {batch_num}] ⛔ Dừng ở page {page}: lease đã thuộc node khác")
+            wait_for_downloads()
+            save_checkpoint(checkpoint_data)
+            return
         # skip pages already completed (from checkpoint)
         if page in checkpoint_data.get("completed_pages", []):
-            print(f"[BATCH {batch_num}] ⏭️ Skipping already completed page {page}")
+            log.debug(f"[BATCH {batch_num}] ⏭️ Skipping already completed page {page}")
             continue
-        print(f"[BATCH {batch_num}] --- Processing Page {page}/{end_page} ---")
-        page_links, hidden_fields, success = crawl_page(
-            session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD)
+        log.debug(f"[BATCH {batch_num}] --- Processing Page {page}/{end_page} ---")
+        page_links, hidden_fields, success = crawl_fn(
+            session, page, hidden_fields, scope, BASE_DOMAIN, SEARCH_KEYWORD)
         checkpoint_data = update_checkpoint_progress(
             checkpoint_data, page, len(page_links), success)
         if success:
-            print(f"[BATCH {batch_num}] ✅ Page {page} hoàn thành: {len(page_links)} links")
-            for i, link in enumerate(page_links):
-                print(f"[BATCH {batch_num}]    📄 Downloading PDF {i+1}/{len(page_links)}: {link}")
-                try:
-                    download_pdf(link, session, drop_levels, page, i+1)
-                    checkpoint_data["total_pdfs_downloaded"] += 1
-                except Exception as e:
-                    print(f"[BATCH {batch_num}]    ❌ Lỗi download: {e}")
+            log.info(f"[BATCH {batch_num}] ✅ Page {page} hoàn thành: {len(page_links)} links")
+            if pipeline is not None:
+                pending_downloads = [f for f in pending_downloads if not f.done()]
+            for i, link in register_page_links(scope, page, page_links):
+                download_link(link, page, i, len(page_links))
         else:
-            print(f"[BATCH {batch_num}] ❌ Page {page} thất bại")
+            log.warning(f"[BATCH {batch_num}] ❌ Page {page} thất bại")
         save_checkpoint(checkpoint_data)
         progress_percent = ((page - start_page + 1) / (end_page - start_page + 1)) * 100
-        print(f"[BATCH {batch_num}] 📈 Progress: {progress_percent:.1f}% ({page - start_page + 1}/{end_page - start_page + 1} pages)")
-        time.sleep(1)
+        log.debug(f"[BATCH {batch_num}] 📈 Progress: {progress_percent:.1f}% ({page - start_page + 1}/{end_page - start_page + 1} pages)")
+        time.sleep(PAGE_DELAY_SECONDS)
+    wait_for_downloads()
     checkpoint_data["is_completed"] = True
     save_checkpoint(checkpoint_data)
-    print(f"[BATCH {batch_num}] 🎉 HOÀN THÀNH!")
+    log.info(f"[BATCH {batch_num}] 🎉 HOÀN THÀNH!")
+
+
+def range_worker(worker_id, scheduler, state_cache, pipeline, BASE_DOMAIN=None, SEARCH_KEYWORD=None):
+    """Pull pages from the shared WorkScheduler until every batch of every scope is done.
+
+    Pages are requested from the cached search-result state of their scope, so
+    a worker can take any page of any batch of any court level. Returns the
+    download futures still pending.
+    """
+    # Mỗi scope (cấp tòa + bộ lọc) cần cookie/ViewState riêng: mở session lần đầu gặp scope đó
+    sessions = {}
+    # Session riêng cho pipeline download, như batch_worker
+    download_session = None
+    pending_downloads = []
+    current = None
+    while True:
+        claimed = scheduler.claim(current)
+        if claimed is None:
+            break
+        current, page = claimed
+        scope, batch = current.scope, current.batch
+        label = batch_label(batch)
+        drop_levels, filters = scheduler.scopes[scope]
+        log.debug(f"[WORKER {worker_id}] --- Batch {label}, page {page} ---")
+        page_links, success = [], False
+        try:
+            if scope not in sessions:
+                sessions[scope] = state_cache.new_session(drop_levels, filters)
+            session, hidden_fields = sessions[scope]
+            page_links, hidden_fields, success = state_cache.crawl_page(
+                session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters)
+            sessions[scope] = (session, hidden_fields)
+            if success:
+                log.info(f"[BATCH {label}] ✅ Page {page} hoàn thành: {len(page_links)} links")
+                pending_downloads = [f for f in pending_downloads if not f.done()]
+                for i, link in register_page_links(scope, page, page_links):
+                    download_session = download_session or get_transport().new_session()
+                    future = pipeline.submit(link, download_session, scope, page, i)
+                    future.add_done_callback(functools.partial(scheduler.count_download, batch))
+                    pending_downloads.append(future)
+            else:
+                log.warning(f"[BATCH {label}] ❌ Page {page} thất bại")
+        except requests.exceptions.RequestException as e:
+            log.warning(f"[BATCH {label}] ❌ Không mở được phiên cho {scope}: {e}")
+        finally:
+            # Luôn trả page cho scheduler, kể cả khi lỗi bất ngờ, để worker khác không chờ mãi
+            if scheduler.finish_page(batch, page, len(page_links), success):
+                log.info(f"[BATCH {label}] 🔁 Page {page} được đưa lại hàng đợi để thử lại")
+        time.sleep(PAGE_DELAY_SECONDS)
+    return pending_downloads
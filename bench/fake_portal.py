@@ -0,0 +1,284 @@
+"""Local stand-in for congbobanan.toaan.gov.vn used by the benchmarks.
+
+Serves the search form, DropPages listing postbacks (with ASP.NET hidden
+fields), detail pages and PDFs. Pages recorded with `record_portal.py` are
+replayed as-is; anything not recorded is synthesized with the same structure.
+Latency, error rate and PDF size/kind are configurable so engine and
+concurrency settings can be compared without touching the live site.
+
+    python bench/fake_portal.py --port 8765 --latency-ms 80 --error-rate 0.02
+"""
+import os
+import sys
+import time
+import zlib
+import random
+import argparse
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BASE_PATH = "/0tat1cvn/ban-an-quyet-dinh"
+FIELD_PREFIX = "ctl00$Content_home_Public$ctl00$"
+DEFAULT_LEVEL_PAGES = {"TW": 5, "CW": 20, "T": 100, "H": 100}
+
+
+class PortalConfig:
+    """Behaviour of the fake portal (all delays in seconds)."""
+
+    def __init__(self, level_pages=None, links_per_page=20, latency=0.05, jitter=0.02, error_rate=0.0,
+                 pdf_pages=3, scanned_ratio=0.0, recordings_dir=None, seed=0):
+        self.level_pages = dict(level_pages or DEFAULT_LEVEL_PAGES)
+        self.links_per_page = links_per_page
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.pdf_pages = pdf_pages
+        self.scanned_ratio = scanned_ratio
+        self.recordings_dir = recordings_dir
+        self.seed = seed
+
+
+class PortalStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def incr(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def _judgment_id(level, page, index, config):
+    # ID ổn định theo (cấp, page, vị trí): chạy lại cho cùng bộ bản án, các cấp không trùng nhau
+    level_offset = (list(config.level_pages).index(level) + 1) * 10_000_000 if level in config.level_pages else 0
+    return level_offset + page * 1000 + index
+
+
+def _hidden_inputs(page, level):
+    return (f'<input type="hidden" name="__VIEWSTATE" value="fake-vs-{level}-{page}"/>'
+            f'<input type="hidden" name="__VIEWSTATEGENERATOR" value="C1A2B3"/>'
+            f'<input type="hidden" name="__EVENTVALIDATION" value="fake-ev-{level}"/>')
+
+
+def render_listing(level, page, config):
+    total = config.level_pages.get(level, 0)
+    options = "".join(f'<option value="{p}">{p}</option>' for p in range(1, total + 1))
+    links = ""
+    if 1 <= page <= total:
+        links = "".join(
+            f'<div class="list-group-item"><a href="/2ta{_judgment_id(level, page, i, config)}t1cvn/chi-tiet-ban-an">'
+            f'Bản án {_judgment_id(level, page, i, config)}</a></div>'
+            for i in range(config.links_per_page))
+    return (f'<html><body><form method="post" action="{BASE_PATH}">{_hidden_inputs(page, level)}'
+            f'<select name="{FIELD_PREFIX}DropPages">{options}</select>{links}'
+            f'<a href="/tin-tuc">Tin tức</a></form></body></html>')
+
+
+def render_detail(judgment_id, config):
+    rng = random.Random(config.seed * 1_000_003 + judgment_id)
+    year = rng.choice(range(2015, 2025))
+    case_type = rng.choice(("Hình sự", "Dân sự", "Hành chính", "Kinh doanh thương mại", "Lao động"))
+    court = rng.choice(("TAND tỉnh Long An", "TAND TP. Hồ Chí Minh", "TAND huyện Cần Giờ", "TAND cấp cao tại Hà Nội"))
+    return (f'<html><body><div class="detail">'
+            f'<ul><li><label>Bản án số:</label> <span>{judgment_id % 1000}/{year}/HS-ST</span></li>'
+            f'<li><label>Tòa án xét xử:</label> <span>{court}</span></li>'
+            f'<li><label>Ngày ban hành:</label> <span>{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{year}</span></li>'
+            f'<li><label>Loại vụ/việc:</label> <span>{case_type}</span></li>'
+            f'<li><label>Cấp xét xử:</label> <span>Sơ thẩm</span></li></ul>'
+            f'<a href="/5ta{judgment_id}t1cvn/{judgment_id}.pdf">Tải về</a></div></body></html>')
+
+
+class PdfFactory:
+    """Generates (and caches) text-layer or image-only PDFs of `pdf_pages` pages."""
+
+    def __init__(self, config):
+        self.config = config
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, judgment_id):
+        scanned = random.Random(self.config.seed + judgment_id).random() < self.config.scanned_ratio
+        # Dựng một lần cho mỗi loại; comment cuối file chứa ID để các PDF không trùng hash (dedup)
+        with self._lock:
+            template = self._cache.get(scanned)
+            if template is None:
+                template = self._cache[scanned] = self._build(scanned)
+        return template + f"%BANAN-{judgment_id}\n".encode()
+
+    def _build(self, scanned):
+        import fitz
+        text = "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM\n" + "Nội dung bản án mẫu dùng cho benchmark. " * 40
+        doc = fitz.open()
+        for _ in range(self.config.pdf_pages):
+            page = doc.new_page()
+            if scanned:
+                # Trang ảnh không có text layer: converter phải OCR
+                source = fitz.open()
+                source.new_page().insert_textbox(fitz.Rect(72, 72, 520, 770), text)
+                pixmap = source[0].get_pixmap(dpi=100)
+                source.close()
+                page.insert_image(page.rect, pixmap=pixmap)
+            else:
+                page.insert_textbox(fitz.Rect(72, 72, 520, 770), text)
+        data = doc.tobytes(deflate=True)
+        doc.close()
+        return data
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    portal = None  # (config, stats, pdf_factory), gán bởi make_server
+
+    def log_message(self, *args):
+        pass
+
+    def _recorded(self, *parts):
+        config = self.portal[0]
+        if not config.recordings_dir:
+            return None
+        path = os.path.join(config.recordings_dir, *parts)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        return None
+
+    def _delay_or_fail(self):
+        config, stats, _ = self.portal
+        time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+        if random.random() < config.error_rate:
+            stats.incr("errors")
+            self._send(503, b"Service Unavailable")
+            return True
+        return False
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        config, stats, pdf_factory = self.portal
+        if self._delay_or_fail():
+            return
+        path = urllib.parse.urlparse(self.path).path
+        parts = path.strip("/").split("/")
+        if path == BASE_PATH:
+            stats.incr("search_form")
+            return self._send(200, self._recorded("search.html") or render_listing("", 0, config))
+        if len(parts) == 2 and parts[1] == "chi-tiet-ban-an" and parts[0].startswith("2ta"):
+            stats.incr("detail")
+            # Bản ghi lưu theo ID trang chi tiết như dedup_index.get_detail_id ("2ta123t1cvn")
+            body = self._recorded("detail", f"{parts[0]}.html")
+            judgment_id = parts[0][3:-5]
+            if body is None and not judgment_id.isdigit():
+                return self._send(404, "Not Found")
+            return self._send(200, body or render_detail(int(judgment_id), config))
+        if path.endswith(".pdf"):
+            stats.incr("pdf")
+            judgment_id = os.path.basename(path)[:-4]
+            body = self._recorded("pdf", f"{judgment_id}.pdf")
+            if body is None:
+                key = int(judgment_id) if judgment_id.isdigit() else zlib.crc32(judgment_id.encode("utf-8"))
+                body = pdf_factory.get(key)
+            return self._send(200, body, "application/pdf")
+        self._send(404, "Not Found")
+
+    def do_POST(self):
+        config, stats, _ = self.portal
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        if self._delay_or_fail():
+            return
+        # Như ASP.NET: postback không mang ViewState thì trả lỗi 500
+        if not form.get("__VIEWSTATE"):
+            stats.incr("rejected")
+            return self._send(500, "Invalid postback or callback argument")
+        level = form.get(f"{FIELD_PREFIX}Drop_Levels", [""])[0]
+        page = int(form.get(f"{FIELD_PREFIX}DropPages", ["1"])[0] or 1)
+        stats.incr("listing")
+        body = self._recorded("listing", f"{level}_{page}.html")
+        self._send(200, body or render_listing(level, page, config))
+
+
+class PortalServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Client đóng kết nối keep-alive giữa chừng là bình thường khi crawler kết thúc
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(config, host="127.0.0.1", port=0):
+    """Create (not start) the server; returns (server, stats)."""
+    stats = PortalStats()
+    handler = type("BoundPortalHandler", (PortalHandler,), {"portal": (config, stats, PdfFactory(config))})
+    server = PortalServer((host, port), handler)
+    return server, stats
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start the fake portal in a background thread; returns (server, stats, base_domain)."""
+    server, stats = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="fake-portal", daemon=True).start()
+    return server, stats, f"http://{host}:{server.server_address[1]}"
+
+
+def parse_level_pages(value):
+    """"T=100,H=50" -> {"T": 100, "H": 50}."""
+    level_pages = {}
+    for item in value.split(","):
+        level, _, pages = item.partition("=")
+        level_pages[level.strip().upper()] = int(pages)
+    return level_pages
+
+
+def add_portal_arguments(parser):
+    parser.add_argument("--level-pages", type=parse_level_pages, default=DEFAULT_LEVEL_PAGES,
+                        help="số page mỗi cấp tòa, vd. T=100,H=50")
+    parser.add_argument("--links-per-page", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ request trả 503 (0-1)")
+    parser.add_argument("--pdf-pages", type=int, default=3, help="số trang mỗi PDF (kích thước PDF)")
+    parser.add_argument("--scanned-ratio", type=float, default=0.0, help="tỉ lệ PDF scan (cần OCR)")
+    parser.add_argument("--recordings", default=None, help="thư mục ghi bởi record_portal.py")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args):
+    return PortalConfig(level_pages=args.level_pages, links_per_page=args.links_per_page,
+                        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                        error_rate=args.error_rate, pdf_pages=args.pdf_pages,
+                        scanned_ratio=args.scanned_ratio, recordings_dir=args.recordings, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake court portal for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_portal_arguments(parser)
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+    server, stats = make_server(config_from_args(args), args.host, args.port)
+    print(f"🧪 Fake portal: http://{args.host}:{server.server_address[1]}{BASE_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {stats.snapshot()}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Record a small slice of the live portal for `fake_portal.py --recordings`.
+
+Saves the search form, the first listing pages of each court level (the
+DropPages postbacks, with their hidden fields), the detail pages they link to
+and the PDFs of those details. Absolute links to the live site are made
+relative so the fake portal serves them on replay. Keep the limits small:
+this runs against the real site.
+
+    python bench/record_portal.py --out bench/recordings --levels T,H --pages 2 --details 5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BASE_URL, BASE_DOMAIN, SEARCH_KEYWORD  # noqa: E402
+from crawl_utils import initialize_session, create_payload  # noqa: E402
+from page_parser import parse_listing, parse_detail_page  # noqa: E402
+from dedup_index import get_detail_id  # noqa: E402
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Content-Type": "application/x-www-form-urlencoded"}
+
+
+def _save(out_dir, relative_path, body):
+    path = os.path.join(out_dir, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if isinstance(body, str):
+        # Link tuyệt đối tới site thật -> link tương đối để fake portal phục vụ khi replay
+        body = body.replace(BASE_DOMAIN, "").encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(body)
+    return path
+
+
+def record_level(session, hidden_fields, drop_levels, pages, details, out_dir, delay):
+    """Record `pages` listing pages of one level and up to `details` detail pages + PDFs per page."""
+    for page in range(1, pages + 1):
+        payload = create_payload(hidden_fields, page, drop_levels, SEARCH_KEYWORD)
+        response = session.post(BASE_URL, data=payload, headers=HEADERS, verify=False)
+        response.raise_for_status()
+        _save(out_dir, os.path.join("listing", f"{drop_levels}_{page}.html"), response.text)
+        links, hidden_fields = parse_listing(response.text, BASE_DOMAIN)
+        print(f"📄 {drop_levels} page {page}: {len(links)} link")
+        for url in links[:details]:
+            time.sleep(delay)
+            detail = session.get(url, verify=False)
+            detail.raise_for_status()
+            _save(out_dir, os.path.join("detail", f"{get_detail_id(url)}.html"), detail.text)
+            _, pdf_url = parse_detail_page(detail.text, BASE_DOMAIN)
+            if pdf_url:
+                pdf = session.get(pdf_url, verify=False)
+                pdf.raise_for_status()
+                _save(out_dir, os.path.join("pdf", os.path.basename(pdf_url)), pdf.content)
+        time.sleep(delay)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record live portal pages for offline benchmarks")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings"))
+    parser.add_argument("--levels", default="T", help="các cấp tòa, phân cách bằng dấu phẩy")
+    parser.add_argument("--pages", type=int, default=2, help="số page listing mỗi cấp")
+    parser.add_argument("--details", type=int, default=5, help="số trang chi tiết (kèm PDF) mỗi page")
+    parser.add_argument("--delay", type=float, default=1.0, help="nghỉ giữa các request (giây)")
+    args = parser.parse_args(argv)
+
+    session, hidden_fields = initialize_session()
+    _save(args.out, "search.html", session.get(BASE_URL, verify=False).text)
+    for drop_levels in [level.strip().upper() for level in args.levels.split(",") if level.strip()]:
+        record_level(session, hidden_fields, drop_levels, args.pages, args.details, args.out, args.delay)
+    print(f"✅ Đã ghi vào {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
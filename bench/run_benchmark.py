@@ -0,0 +1,200 @@
+"""End-to-end benchmark of `main_batch.main` against the local fake portal.
+
+Starts `fake_portal.py` in this process, then runs every combination of
+engine x crawl threads (x repeat) in a fresh child process with its own
+temporary dataset/checkpoint directories, so runs never share dedup or
+progress state. Each run reports wall time, pages/s, PDFs/s, converter
+throughput and peak RSS of the crawler and of the converter processes.
+
+    python bench/run_benchmark.py --engines thread,async --threads 4,16 \\
+        --level-pages T=40,H=40 --latency-ms 80 --error-rate 0.01 --json bench.json
+
+Use `--set KEY=VALUE` to override config.py for every run (e.g. RATE_LIMIT_ENABLED=False,
+DOWNLOAD_WORKERS=16) and compare settings against the same portal.
+"""
+import os
+import sys
+import json
+import time
+import ast
+import shutil
+import argparse
+import tempfile
+import itertools
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_portal import BASE_PATH, add_portal_arguments, config_from_args, start_server  # noqa: E402
+
+RESULT_PREFIX = "BENCH_RESULT "
+COLUMNS = ("engine", "threads", "run", "pages", "pdfs", "converted", "wall_s", "pages_per_s", "pdfs_per_s",
+           "converted_per_s", "convert_avg_s", "errors", "rss_mb", "converter_rss_mb")
+
+
+def _peak_rss_mb(who):
+    try:
+        import resource
+    except ImportError:
+        # Windows không có module resource
+        return None
+    peak = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _configure(root, base_domain, engine, overrides=None):
+    """Point config at the fake portal and a private temp dir; must run before crawler modules are imported."""
+    import config
+    config.BASE_DOMAIN = base_domain
+    config.BASE_URL = base_domain + BASE_PATH
+    config.CRAWL_ENGINE = engine
+    config.DATASET_DIR = os.path.join(root, "crawl")
+    config.DATASET_CLEANING_DIR = os.path.join(root, "cleaning")
+    config.CHECKPOINT_DIR = os.path.join(root, "checkpoints")
+    for directory in (config.DATASET_DIR, config.DATASET_CLEANING_DIR, config.CHECKPOINT_DIR):
+        os.makedirs(directory, exist_ok=True)
+    config.DEDUP_DB_PATH = os.path.join(config.CHECKPOINT_DIR, "dedup_index.sqlite3")
+    config.METADATA_DB_PATH = os.path.join(config.CHECKPOINT_DIR, "metadata_index.sqlite3")
+    config.PROGRESS_DB_PATH = os.path.join(config.CHECKPOINT_DIR, "progress.sqlite3")
+    config.COORDINATOR_DB_PATH = os.path.join(config.CHECKPOINT_DIR, "coordinator.sqlite3")
+    config.SHARD_DIR = os.path.join(config.DATASET_CLEANING_DIR, "shards")
+    config.SHARD_INDEX_PATH = os.path.join(config.SHARD_DIR, "index.sqlite3")
+    config.PAGE_DELAY_SECONDS = 0
+    config.METRICS_SUMMARY_SECONDS = 0
+    config.LOG_LEVEL = "WARNING"
+    for key, value in (overrides or {}).items():
+        if not hasattr(config, key):
+            raise ValueError(f"config không có {key}")
+        setattr(config, key, value)
+
+
+def _ignore_result(file_path, result, error):
+    pass
+
+
+def run_child(spec):
+    """Run one benchmark inside this (child) process and return its result dict."""
+    root = tempfile.mkdtemp(prefix="bench-")
+    try:
+        sys.path.insert(0, REPO_DIR)
+        _configure(root, spec["base_domain"], spec["engine"], spec["overrides"])
+        from metrics import metrics
+        from main_batch import main, plan_jobs
+        from pdf_queue_worker import start_pdf_converter_workers, stop_pdf_converter_workers, pdf_queue
+
+        jobs = plan_jobs(spec["levels"], [{}], spec["max_pages"], spec["threads"], spec["batch_size"])
+        converter_pool = start_pdf_converter_workers(spec["converters"], on_result=_ignore_result)
+        start = time.perf_counter()
+        main(jobs, spec["threads"])
+        pdf_queue.join()
+        stop_pdf_converter_workers(converter_pool)
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    snapshot = metrics.snapshot()
+    pages = metrics.counter("pages", status="ok")
+    pdfs = metrics.counter("pdfs", status="downloaded")
+    converted = sum(c["value"] for c in snapshot["counters"] if c["name"] == "converted")
+    convert_timer = snapshot["timers"].get("convert", {})
+    return {
+        "engine": spec["engine"],
+        "threads": spec["threads"],
+        "run": spec["run"],
+        "pages": pages,
+        "pdfs": pdfs,
+        "converted": converted,
+        "wall_s": round(wall, 2),
+        "pages_per_s": round(pages / wall, 2),
+        "pdfs_per_s": round(pdfs / wall, 2),
+        "converted_per_s": round(converted / wall, 2),
+        "convert_avg_s": convert_timer.get("avg_seconds"),
+        "errors": sum(c["value"] for c in snapshot["counters"] if c["name"] == "errors"),
+        "rss_mb": _peak_rss_mb("RUSAGE_SELF"),
+        # Process convert đã được shutdown (wait) nên RUSAGE_CHILDREN có peak lớn nhất của chúng
+        "converter_rss_mb": _peak_rss_mb("RUSAGE_CHILDREN"),
+        "stages": snapshot["timers"],
+    }
+
+
+def run_one(spec):
+    """Run `spec` in a fresh interpreter so every run starts with empty metrics, caches and memory."""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+                               cwd=REPO_DIR, capture_output=True, text=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"Benchmark {spec['engine']}/{spec['threads']} lỗi (exit {completed.returncode}):\n"
+                       f"{completed.stdout[-2000:]}{completed.stderr[-2000:]}")
+
+
+def print_table(results):
+    widths = {column: max(len(column), *(len(str(r.get(column))) for r in results)) for column in COLUMNS}
+    print("  ".join(column.ljust(widths[column]) for column in COLUMNS))
+    for result in results:
+        print("  ".join(str(result.get(column)).ljust(widths[column]) for column in COLUMNS))
+
+
+def _override(value):
+    """"RATE_LIMIT_ENABLED=False" -> ("RATE_LIMIT_ENABLED", False); non-literals are kept as strings."""
+    key, _, raw = value.partition("=")
+    try:
+        return key.strip(), ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return key.strip(), raw
+
+
+def _csv(value, cast=str):
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of main_batch.main")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--engines", type=_csv, default=["thread", "async"])
+    parser.add_argument("--threads", type=lambda v: _csv(v, int), default=[4, 16], help="số luồng crawl, vd. 4,16")
+    parser.add_argument("--levels", type=_csv, default=None, help="cấp tòa cần crawl (mặc định: mọi cấp của portal)")
+    parser.add_argument("--max-pages", type=int, default=None, help="giới hạn page mỗi cấp (mặc định: đọc từ DropPages)")
+    parser.add_argument("--batch-size", type=int, default=None, help="mặc định: tự động như main.py")
+    parser.add_argument("--converters", type=int, default=2, help="số process convert PDF")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--set", type=_override, action="append", default=[], metavar="KEY=VALUE",
+                        help="ghi đè config.py trong mỗi lần chạy, vd. --set RATE_LIMIT_ENABLED=False")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    add_portal_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(run_child(json.loads(args.child))), flush=True)
+        return 0
+
+    portal_config = config_from_args(args)
+    server, stats, base_domain = start_server(portal_config)
+    levels = args.levels or list(portal_config.level_pages)
+    print(f"🧪 Fake portal {base_domain} — cấp {levels}, latency {args.latency_ms}ms, lỗi {args.error_rate:.0%}")
+    results = []
+    try:
+        for engine, threads, run in itertools.product(args.engines, args.threads, range(1, args.repeat + 1)):
+            spec = {"base_domain": base_domain, "engine": engine, "threads": threads, "run": run,
+                    "levels": levels, "max_pages": args.max_pages, "batch_size": args.batch_size,
+                    "converters": args.converters, "overrides": dict(args.set)}
+            print(f"⏱️ {engine} × {threads} luồng (lần {run})...", flush=True)
+            results.append(run_one(spec))
+    finally:
+        server.shutdown()
+        server.server_close()
+    print()
+    print_table(results)
+    print(f"\n📊 Request tới fake portal: {stats.snapshot()}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"portal": vars(portal_config), "overrides": dict(args.set), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
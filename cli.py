@@ -0,0 +1,262 @@
+"""Command-line / config-file options of main.py for unattended runs.
+
+Every option can come from (lowest to highest precedence) its default, a
+JSON or TOML config file (`--config`), a `CRAWLER_<NAME>` environment
+variable or the command line. Lower-case keys are run options (pages,
+levels, filters, mode); upper-case keys are config.py constants such as
+DATASET_DIR or CONVERTER_WORKERS. Config constants are exported as
+`CRAWLER_<NAME>` variables and config.py is reloaded, so they must be
+applied before any crawler module is imported and they also reach
+converter processes started with spawn.
+
+Example config file:
+
+    {"max_pages": 500, "batches": 20, "threads": 8, "levels": "T,H",
+     "date_from": "01/01/2024", "date_to": "31/03/2024", "split_by_month": true,
+     "DATASET_DIR": "/data/pdf", "CONVERTER_WORKERS": 4}
+"""
+import os
+import sys
+import json
+import argparse
+import importlib
+
+import config
+
+ENV_PREFIX = config.ENV_PREFIX
+
+# Tùy chọn chạy và giá trị mặc định (giống mặc định của các câu hỏi input() trong main.py)
+RUN_DEFAULTS = {
+    "max_pages": None,          # None = số page thật đọc từ DropPages
+    "batches": None,            # số batch mỗi cấp tòa / truy vấn
+    "batch_size": None,         # None (và không có batches) = tự động theo tốc độ đo được
+    "threads": 5,
+    "levels": None,             # None = DEFAULT_DROP_LEVELS; "T,H" hoặc "ALL"
+    "courts": None,
+    "date_from": None,
+    "date_to": None,
+    "case_type": None,
+    "keyword": None,
+    "split_by_month": False,
+    "reset": False,
+    "incremental": False,
+    "distributed": False,
+    "node_id": None,
+    "dry_run": False,
+    "interactive": False,
+}
+BOOL_OPTIONS = ("split_by_month", "reset", "incremental", "distributed", "dry_run", "interactive")
+INT_OPTIONS = ("max_pages", "batches", "batch_size", "threads")
+
+
+def _csv(value):
+    if value is None or isinstance(value, list):
+        return value
+    return [item.strip() for item in str(value).split(",") if item.strip()]
+
+
+def _setting(value):
+    """"KEY=VALUE" of --set; the value is parsed like a CRAWLER_<KEY> environment variable."""
+    key, separator, raw = value.partition("=")
+    if not separator or not key.strip().isupper():
+        raise argparse.ArgumentTypeError(f"cần dạng KEY=VALUE với KEY là hằng số trong config.py: {value}")
+    return key.strip(), raw
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Crawl bản án từ congbobanan.toaan.gov.vn. Không có tham số (và chạy trong terminal) "
+                    "thì hỏi cấu hình như trước; có tham số thì chạy không cần nhập gì.")
+    # default=SUPPRESS: chỉ tham số được truyền mới ghi đè file cấu hình / biến môi trường
+    add = parser.add_argument
+    add("--config", help="file cấu hình JSON hoặc TOML")
+    add("--interactive", action="store_true", default=argparse.SUPPRESS,
+        help="vẫn hỏi cấu hình bằng input() (giá trị khác lấy từ tham số / file)")
+    add("--dry-run", action="store_true", default=argparse.SUPPRESS,
+        help="chỉ in kế hoạch page/batch từ checkpoint hiện có, không gửi request")
+
+    crawl = parser.add_argument_group("crawl")
+    crawl.add_argument("--max-pages", type=int, default=argparse.SUPPRESS,
+                       help="giới hạn số page mỗi cấp / truy vấn (mặc định: số page thật đọc từ DropPages)")
+    crawl.add_argument("--batches", type=int, default=argparse.SUPPRESS,
+                       help="số batch mỗi cấp / truy vấn (mặc định: tự động theo tốc độ đo được)")
+    crawl.add_argument("--batch-size", type=int, default=argparse.SUPPRESS, help="số page mỗi batch (thay cho --batches)")
+    crawl.add_argument("--threads", type=int, default=argparse.SUPPRESS, help="số luồng crawl (mặc định 5)")
+    crawl.add_argument("--levels", default=argparse.SUPPRESS, help="cấp tòa TW,CW,T,H (phân cách dấu phẩy) hoặc ALL")
+    crawl.add_argument("--reset", action="store_true", default=argparse.SUPPRESS,
+                       help="xóa toàn bộ checkpoint trước khi chạy")
+    crawl.add_argument("--incremental", action="store_true", default=argparse.SUPPRESS,
+                       help="chỉ tải bản án mới kể từ lần chạy trước")
+    crawl.add_argument("--distributed", action="store_true", default=argparse.SUPPRESS,
+                       help="chạy nhiều máy qua coordinator dùng chung (COORDINATOR_DB_PATH)")
+    crawl.add_argument("--node-id", default=argparse.SUPPRESS, help="tên node ở chế độ nhiều máy (mặc định host-pid)")
+
+    filters = parser.add_argument_group("bộ lọc tìm kiếm")
+    filters.add_argument("--courts", default=argparse.SUPPRESS, help="mã tòa án, nhiều tòa cách nhau dấu phẩy")
+    filters.add_argument("--date-from", default=argparse.SUPPRESS, help="từ ngày dd/mm/yyyy")
+    filters.add_argument("--date-to", default=argparse.SUPPRESS, help="đến ngày dd/mm/yyyy")
+    filters.add_argument("--case-type", default=argparse.SUPPRESS, help="loại vụ/việc")
+    filters.add_argument("--keyword", default=argparse.SUPPRESS, help="từ khóa")
+    filters.add_argument("--split-by-month", action="store_true", default=argparse.SUPPRESS,
+                         help="chia khoảng ngày thành truy vấn theo từng tháng")
+
+    # dest viết hoa = hằng số trong config.py
+    settings = parser.add_argument_group("cấu hình (ghi đè config.py)")
+    settings.add_argument("--dataset-dir", dest="DATASET_DIR", default=argparse.SUPPRESS, help="thư mục lưu PDF")
+    settings.add_argument("--cleaning-dir", dest="DATASET_CLEANING_DIR", default=argparse.SUPPRESS,
+                          help="thư mục lưu text đã convert")
+    settings.add_argument("--checkpoint-dir", dest="CHECKPOINT_DIR", default=argparse.SUPPRESS)
+    settings.add_argument("--engine", dest="CRAWL_ENGINE", choices=("async", "thread"), default=argparse.SUPPRESS)
+    settings.add_argument("--download-workers", dest="DOWNLOAD_WORKERS", type=int, default=argparse.SUPPRESS)
+    settings.add_argument("--max-connections", dest="ASYNC_MAX_CONNECTIONS", type=int, default=argparse.SUPPRESS,
+                          help="số kết nối HTTP tối đa của engine async")
+    settings.add_argument("--converter-workers", dest="CONVERTER_WORKERS", type=int, default=argparse.SUPPRESS,
+                          help="số process convert PDF (mặc định số CPU)")
+    settings.add_argument("--output-format", dest="OUTPUT_FORMAT", choices=("txt", "shards"), default=argparse.SUPPRESS)
+    settings.add_argument("--log-level", dest="LOG_LEVEL", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                          default=argparse.SUPPRESS)
+    settings.add_argument("--log-json", dest="LOG_JSON", action="store_true", default=argparse.SUPPRESS)
+    settings.add_argument("--metrics-port", dest="METRICS_PORT", type=int, default=argparse.SUPPRESS)
+    settings.add_argument("--set", dest="settings", type=_setting, action="append", default=[], metavar="KEY=VALUE",
+                          help="ghi đè hằng số bất kỳ của config.py, vd. --set RATE_MAX_PER_SECOND=10")
+    return parser
+
+
+def load_config_file(path):
+    """Read a JSON or (Python 3.11+) TOML config file into a flat dict."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.lower().endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("File TOML cần Python 3.11+, hãy dùng JSON") from None
+        values = tomllib.loads(data.decode("utf-8"))
+    else:
+        values = json.loads(data.decode("utf-8"))
+    if not isinstance(values, dict):
+        raise ValueError(f"{path}: file cấu hình phải là một object")
+    return values
+
+
+def _split(values, source):
+    """Split a mapping into (run options, config settings) and reject unknown keys."""
+    options, settings = {}, {}
+    for key, value in values.items():
+        if key.isupper():
+            if not hasattr(config, key):
+                raise ValueError(f"{source}: config.py không có {key}")
+            settings[key] = value
+        elif key in RUN_DEFAULTS:
+            options[key] = value
+        else:
+            raise ValueError(f"{source}: tùy chọn không hỗ trợ {key}")
+    return options, settings
+
+
+def _coerce(key, value, source):
+    """Type a run option read as text or JSON/TOML value: booleans and integers like the flags."""
+    if value is None:
+        return None
+    if key in BOOL_OPTIONS:
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "y")
+        return bool(value)
+    if key in INT_OPTIONS:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{source}: cần số nguyên, nhận {value!r}") from None
+    return value
+
+
+def _env_options(environ):
+    """Run options given as CRAWLER_<OPTION> (e.g. CRAWLER_MAX_PAGES=500, CRAWLER_DRY_RUN=true)."""
+    options = {}
+    for key in RUN_DEFAULTS:
+        raw = environ.get(ENV_PREFIX + key.upper())
+        if raw is not None:
+            options[key] = _coerce(key, raw, ENV_PREFIX + key.upper())
+    return options
+
+
+def _encode_setting(value):
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def apply_settings(file_settings, cli_settings, environ=os.environ):
+    """Export config overrides as CRAWLER_* variables and reload config.py.
+
+    Values from the config file do not replace variables already set in the
+    environment; command-line values always win.
+    """
+    for key, value in file_settings.items():
+        environ.setdefault(ENV_PREFIX + key, _encode_setting(value))
+    for key, value in cli_settings.items():
+        environ[ENV_PREFIX + key] = _encode_setting(value)
+    if file_settings or cli_settings:
+        importlib.reload(config)
+
+
+def parse_options(argv=None, environ=os.environ):
+    """Resolve the run options and apply config overrides; call before importing crawler modules.
+
+    Returns:
+        dict: RUN_DEFAULTS keys with resolved values, `levels` as a list and
+        `courts` as a list (or None). `max_pages`, `batches` and `batch_size`
+        stay None unless given (page count and batch size are then decided
+        per court level by main_batch.plan_jobs).
+    Raises:
+        SystemExit: on invalid arguments or config file (argparse style).
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = vars(parser.parse_args(argv))
+    cli_settings = dict(args.pop("settings"))
+    config_path = args.pop("config")
+    try:
+        file_options, file_settings = _split(load_config_file(config_path), config_path) if config_path else ({}, {})
+        # File cấu hình có thể ghi "500" / "true" dạng chuỗi: ép kiểu giống biến môi trường
+        file_options = {key: _coerce(key, value, f"{config_path}: {key}") for key, value in file_options.items()}
+        cli_options, flag_settings = _split(args, "tham số")
+        _split(cli_settings, "--set")
+        apply_settings(file_settings, {**flag_settings, **cli_settings}, environ)
+        env_options = _env_options(environ)
+        options = {**RUN_DEFAULTS, **file_options, **env_options, **cli_options}
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    # Không tham số và đang chạy trong terminal: giữ cách dùng cũ (hỏi bằng input())
+    if not argv and not env_options and sys.stdin.isatty():
+        options["interactive"] = True
+    options["levels"] = resolve_levels(options["levels"], parser)
+    options["courts"] = _csv(options["courts"])
+    for key in INT_OPTIONS:
+        if options[key] is not None and int(options[key]) < 1:
+            parser.error(f"{key} phải >= 1")
+    return options
+
+
+def resolve_levels(levels, parser=None):
+    """ "T,H" / ["T", "H"] / "ALL" / None -> list of valid court levels."""
+    values = [level.upper() for level in _csv(levels) or [config.DEFAULT_DROP_LEVELS]]
+    if "ALL" in values:
+        return list(config.DROP_LEVELS_OPTIONS)
+    invalid = [level for level in values if level not in config.DROP_LEVELS_OPTIONS]
+    if invalid:
+        message = f"cấp tòa không hợp lệ: {', '.join(invalid)} (chọn trong {', '.join(config.DROP_LEVELS_OPTIONS)})"
+        if parser is not None:
+            parser.error(message)
+        raise ValueError(message)
+    return list(dict.fromkeys(values))
+
+
+def build_filter_shards(options):
+    """Search shards of the run: SEARCH_FILTERS from config.py overlaid with the filter options."""
+    from search_filters import iter_filter_shards
+    filters = dict(config.SEARCH_FILTERS)
+    for key in ("date_from", "date_to", "case_type", "keyword"):
+        if options.get(key):
+            filters[key] = options[key]
+    return list(iter_filter_shards(filters, courts=options.get("courts"),
+                                   split_by_month=bool(options.get("split_by_month"))))
@@ -1,18 +1,28 @@
 # config.py
 # Cấu hình chung cho dự án
+# Mọi giá trị có thể ghi đè bằng biến môi trường CRAWLER_<TÊN> (xem cuối file), file cấu hình
+# hoặc tham số dòng lệnh của main.py (xem cli.py)
+import os
+import json
 
 BASE_URL = "https://congbobanan.toaan.gov.vn/0tat1cvn/ban-an-quyet-dinh"
 BASE_DOMAIN = "https://congbobanan.toaan.gov.vn"
-DATASET_DIR = "E:/CRAWL_DATA"
-CHECKPOINT_DIR = "./checkpoints"
+# Thư mục đọc từ môi trường ngay tại đây để các đường dẫn suy ra bên dưới (SQLite, shard) đi theo
+DATASET_DIR = os.environ.get("CRAWLER_DATASET_DIR", "./dataset")
+CHECKPOINT_DIR = os.environ.get("CRAWLER_CHECKPOINT_DIR", "./checkpoints")
 
-DATASET_CLEANING_DIR = "E:/Dataset_Cleaning"
+DATASET_CLEANING_DIR = os.environ.get("CRAWLER_DATASET_CLEANING_DIR", "./dataset_cleaning")
 
 # Cấu hình batch - sẽ được tính toán tự động
-DEFAULT_MAX_PAGES = 100  # Số page tối đa mặc định
-DEFAULT_BATCH_SIZE = 10  # Kích thước batch mặc định
+DEFAULT_MAX_PAGES = 100  # Số page giả định của --dry-run (không gửi request nên không đọc được DropPages)
+DEFAULT_BATCH_SIZE = 10  # Kích thước batch khi chưa đo được thời gian mỗi page
 MIN_BATCH_SIZE = 1       # Kích thước batch tối thiểu
 MAX_BATCH_SIZE = 50      # Kích thước batch tối đa
+# Batch tự động: mỗi batch (đơn vị checkpoint / lease) mất khoảng bấy nhiêu giây của một worker,
+# theo thời gian mỗi page đo được lúc dò số page (POST listing, GET chi tiết)
+BATCH_TARGET_SECONDS = 120
+# ... nhưng luôn có ít nhất bấy nhiêu batch cho mỗi worker để việc được chia đều
+BATCHES_PER_WORKER = 2
 
 # Cấu hình form parameters
 DROP_LEVELS_OPTIONS = {
@@ -23,6 +33,17 @@ DROP_LEVELS_OPTIONS = {
 }
 DEFAULT_DROP_LEVELS = "T"
 SEARCH_KEYWORD = "Nhập tên vụ/việc hoặc số bản án, quyết định"
+# Trường của form tìm kiếm dùng cho bộ lọc (tòa án, khoảng ngày ban hành, loại vụ/việc)
+SEARCH_FORM_FIELDS = {
+    "court": "ctl00$Content_home_Public$ctl00$Ra_Drop_Courts",
+    "date_from": "ctl00$Content_home_Public$ctl00$Rad_DATE_FROM",
+    "date_to": "ctl00$Content_home_Public$ctl00$Rad_DATE_TO",
+    "case_type": "ctl00$Content_home_Public$ctl00$Drop_CASES_STYLES_SEARCH",
+}
+# Định dạng ngày của form (dd/mm/yyyy)
+SEARCH_DATE_FORMAT = "%d/%m/%Y"
+# Bộ lọc tìm kiếm mặc định: court, date_from, date_to, case_type, keyword; rỗng = toàn bộ danh sách
+SEARCH_FILTERS = {}
 
 # Retry configuration for failed pages
 # How many times to retry fetching a page before marking it as permanently failed
@@ -30,5 +51,126 @@ PAGE_RETRY_LIMIT = 3
 # Seconds to wait between retry attempts
 RETRY_DELAY_SECONDS = 5
 
-# Convention đặt tên file checkpoint: checkpoint_{drop_levels}_{batch}.json
-# Ví dụ: checkpoint_T_1.json, checkpoint_H_2.json
\ No newline at end of file
+# Engine crawl: "async" (asyncio + aiohttp, nhiều request song song trên ít kết nối)
+# hoặc "thread" (mỗi batch một luồng với requests như trước)
+CRAWL_ENGINE = "async"
+# Số kết nối HTTP tối đa dùng chung cho toàn bộ engine async
+ASYNC_MAX_CONNECTIONS = 20
+# Timeout (giây) cho mỗi request của engine async
+REQUEST_TIMEOUT_SECONDS = 60
+# Thời gian nghỉ cố định giữa 2 page liên tiếp trong cùng một batch.
+# Mặc định 0 vì tốc độ đã do bộ điều khiển thích ứng bên dưới quyết định.
+PAGE_DELAY_SECONDS = 0
+
+# Bộ điều khiển tốc độ thích ứng (AIMD + token bucket) dùng chung cho mọi worker:
+# tăng dần khi server trả lời nhanh, giảm một nửa khi gặp 5xx/429/timeout
+RATE_LIMIT_ENABLED = True
+RATE_INITIAL_PER_SECOND = 5.0
+RATE_MIN_PER_SECOND = 0.5
+RATE_MAX_PER_SECOND = 50.0
+CONCURRENCY_INITIAL = 4
+CONCURRENCY_MIN = 1
+CONCURRENCY_MAX = 64
+LATENCY_TARGET_SECONDS = 3.0   # chậm hơn mức này thì giữ nguyên, không tăng thêm
+AIMD_BACKOFF_FACTOR = 0.5
+AIMD_COOLDOWN_SECONDS = 2.0    # giảm tối đa một lần trong khoảng này
+
+# Scheduler dùng chung: worker rảnh lấy page từ hàng đợi range, hết thì chia đôi range còn dài nhất
+# của worker khác. Chỉ chia khi range còn ít nhất 2 * WORK_SPLIT_MIN_PAGES page.
+WORK_SPLIT_MIN_PAGES = 2
+
+# Chế độ nhiều máy: các node thuê (lease) từng batch từ bảng SQLite đặt trên ổ dùng chung.
+# Đặt COORDINATOR_DB_PATH trỏ tới thư mục chung (NFS/SMB) giống nhau trên mọi node.
+COORDINATOR_DB_PATH = f"{CHECKPOINT_DIR}/coordinator.sqlite3"
+# Lease hết hạn sau bấy nhiêu giây không gia hạn (node chết) thì batch được giao cho node khác
+LEASE_SECONDS = 300
+# Batch bị lease quá bấy nhiêu lần (lỗi liên tục hoặc node chết giữa chừng) thì đánh dấu failed, không giao lại
+LEASE_MAX_ATTEMPTS = 5
+
+# Pipeline tải PDF: các batch chỉ crawl listing rồi đẩy link vào hàng đợi có giới hạn,
+# một pool download riêng lấy link ra tải. Hàng đợi đầy thì batch phải chờ (backpressure).
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_QUEUE_SIZE = 100
+# Transport HTTP dùng chung: một connection pool keep-alive cho mọi batch
+HTTP_POOL_CONNECTIONS = 10   # số host được giữ pool
+HTTP_POOL_MAXSIZE = 32       # số kết nối tối đa mỗi host
+HTTP_KEEPALIVE_SECONDS = 30  # thời gian giữ kết nối rảnh (engine async)
+# Số request đồng thời tối đa mỗi host; host listing và host PDF có thể khác nhau
+DEFAULT_HOST_CONCURRENCY = 16
+HOST_CONCURRENCY = {
+    # "congbobanan.toaan.gov.vn": 8,
+}
+# Kích thước mỗi chunk (bytes) khi stream PDF xuống đĩa
+PDF_CHUNK_SIZE = 64 * 1024
+
+# Index chống tải trùng (theo ID trang chi tiết và hash nội dung PDF), lưu cạnh checkpoint
+DEDUP_DB_PATH = f"{CHECKPOINT_DIR}/dedup_index.sqlite3"
+
+# Metadata trang chi tiết (số bản án, tòa, ngày, loại vụ việc, cấp xét xử), khóa theo ID trang chi tiết
+METADATA_DB_PATH = f"{CHECKPOINT_DIR}/metadata_index.sqlite3"
+# Chỉ tải PDF của bản án khớp bộ lọc; rỗng = tải tất cả.
+# Key hỗ trợ: court, case_type, judgment_level, legal_relation (chuỗi con), year_from, year_to
+# Ví dụ: DOWNLOAD_FILTER = {"case_type": "Hình sự", "year_from": 2020}
+DOWNLOAD_FILTER = {}
+
+# Chế độ incremental: dừng khi gặp liên tiếp bấy nhiêu page không có bản án mới
+INCREMENTAL_STOP_PAGES = 3
+
+# Tiến độ crawl (checkpoint từng batch, trạng thái từng page/PDF) lưu trong SQLite (WAL)
+PROGRESS_DB_PATH = f"{CHECKPOINT_DIR}/progress.sqlite3"
+
+# Convert PDF -> text chạy trong process pool; None = số CPU / OCR_WORKERS (mỗi process có thể chạy
+# OCR_WORKERS tesseract cùng lúc, tổng số tesseract không vượt số CPU)
+CONVERTER_WORKERS = None
+# Số PDF tối đa chờ convert; đầy thì phía download phải chờ
+CONVERTER_QUEUE_SIZE = 200
+
+# OCR cho bản scan: rasterize từng trang (không giữ cả file trong RAM), OCR song song trong mỗi process convert
+OCR_DPI = 200
+OCR_LANG = "vie"
+# Số trang OCR song song trong một file (tesseract chạy process riêng nên thread là đủ);
+# mỗi tesseract chỉ dùng 1 luồng (OMP_THREAD_LIMIT), song song đến từ đây và CONVERTER_WORKERS
+OCR_WORKERS = 2
+# Trang có ít hơn số ký tự này (số trang, watermark...) coi như trang ảnh và được OCR
+MIN_TEXT_CHARS_PER_PAGE = 20
+
+# Định dạng output: "txt" = mỗi bản án một file .txt; "shards" = gộp vào shard JSONL nén + index SQLite
+OUTPUT_FORMAT = "txt"
+SHARD_DIR = f"{DATASET_CLEANING_DIR}/shards"
+SHARD_INDEX_PATH = f"{SHARD_DIR}/index.sqlite3"
+# Mỗi shard tối đa bao nhiêu bytes (đã nén) trước khi mở shard mới
+SHARD_MAX_BYTES = 256 * 1024 * 1024
+# "zstd" (cần cài zstandard, nếu không có sẽ dùng gzip) hoặc "gzip"
+SHARD_COMPRESSION = "zstd"
+
+# Log theo mức DEBUG/INFO/WARNING/ERROR; chi tiết từng PDF / checkpoint chỉ hiện ở DEBUG
+LOG_LEVEL = "INFO"
+# True: mỗi dòng log là một object JSON (kèm các trường như page, drop_levels, file)
+LOG_JSON = False
+# In một dòng tóm tắt (tốc độ page/PDF, KB/s, độ sâu hàng đợi, lỗi, thời gian từng stage) mỗi bấy nhiêu giây; 0 = tắt
+METRICS_SUMMARY_SECONDS = 30
+# Endpoint metrics cục bộ: http://127.0.0.1:{METRICS_PORT}/metrics (Prometheus) và /metrics.json; None = tắt
+METRICS_PORT = None
+
+# Ghi đè bằng biến môi trường: CRAWLER_<TÊN> cho mọi hằng số ở trên,
+# vd. CRAWLER_CRAWL_ENGINE=thread, CRAWLER_CONVERTER_WORKERS=4, CRAWLER_DOWNLOAD_FILTER='{"year_from": 2020}'.
+# Hằng số kiểu chuỗi nhận nguyên giá trị; kiểu khác đọc như JSON (số, true/false, null, object).
+# Process convert khởi động kiểu spawn (Windows) import lại file này nên cũng nhận cùng giá trị.
+ENV_PREFIX = "CRAWLER_"
+
+
+def _env_value(name, current, raw):
+    if isinstance(current, str):
+        return raw
+    try:
+        return json.loads(raw)
+    except ValueError:
+        raise ValueError(f"{ENV_PREFIX}{name}: giá trị không hợp lệ {raw!r} (cần JSON)") from None
+
+
+for _name, _value in list(globals().items()):
+    if _name.isupper() and not _name.startswith("_") and ENV_PREFIX + _name in os.environ:
+        globals()[_name] = _env_value(_name, _value, os.environ[ENV_PREFIX + _name])
+
+# Convention tên checkpoint: checkpoint_{drop_levels}_{batch}
+# Ví dụ: checkpoint_T_1, checkpoint_H_2. File JSON cũ checkpoint_T_1.json được import tự động.
\ No newline at end of file
@@ -1,52 +1,313 @@
-import requests
-from requests.exceptions import RequestException, ChunkedEncodingError
-from bs4 import BeautifulSoup
+import sqlite3
+from requests.exceptions import RequestException
 import urllib3
 import time
 import os
-from config import BASE_DOMAIN, DATASET_DIR
-from pdf_to_text import process_file
+import hashlib
+from config import BASE_DOMAIN, DATASET_DIR, PDF_CHUNK_SIZE
+from dedup_index import get_dedup_index, get_detail_id
+from metadata_index import get_metadata_index, matches_filter
+from page_parser import parse_detail_page
+from progress_store import get_progress_store, PDF_DOWNLOADED, PDF_FAILED, PDF_SKIPPED
+from metrics import metrics, get_logger, fields
+
+log = get_logger("download")
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+if not os.path.exists(DATASET_DIR):
+    os.makedirs(DATASET_DIR, exist_ok=True)
+
+def build_pdf_filename(url, pdf_url, drop_levels=None, page_num=None, pdf_index=None):
+    # Đặt tên file: Droplevel + số page + index.pdf
+    if drop_levels is not None and page_num is not None and pdf_index is not None:
+        return f"{drop_levels}_{page_num}_{pdf_index}.pdf"
+    # fallback cũ
+    url_parts = url.rstrip('/').split('/')
+    if len(url_parts) >= 2:
+        return f"{url_parts[-2]}.pdf"
+    return pdf_url.split("/")[-1]
+
+def get_partial_path(file_path, pdf_url):
+    # File tạm gắn với URL của PDF, để chỉ resume đúng file đã tải dở
+    url_digest = hashlib.sha1(pdf_url.encode("utf-8")).hexdigest()[:12]
+    return f"{file_path}.{url_digest}.part"
+
+def get_resume_headers(partial_path):
+    resume_from = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+    return resume_from, headers
+
+def parse_content_range_start(content_range):
+    # "bytes 1000-4999/5000" -> 1000; None nếu thiếu hoặc sai định dạng
+    unit, _, byte_range = (content_range or "").strip().partition(" ")
+    start = byte_range.partition("-")[0]
+    return int(start) if unit.lower() == "bytes" and start.isdigit() else None
+
+def new_content_hasher(partial_path, append):
+    # Khi resume, hash phải bao gồm cả phần đã có trong file tạm
+    hasher = hashlib.sha256()
+    if append:
+        with open(partial_path, "rb") as f:
+            for chunk in iter(lambda: f.read(PDF_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+    return hasher
+
+class PartialDownload:
+    """Disk side of one resumable PDF download, shared by the requests and aiohttp engines.
+
+    Data goes to a `.part` file first and is renamed into place only once
+    complete, so an interrupted run never leaves a truncated PDF behind. If a
+    `.part` file from an earlier attempt exists, `headers` carries an HTTP
+    Range request; servers that ignore Range simply resend everything. The
+    engines only do the request and feed the body chunks to `write`.
+    """
+
+    def __init__(self, file_path, pdf_url):
+        self.file_path = file_path
+        self.partial_path = get_partial_path(file_path, pdf_url)
+        self.resume_from, self.headers = get_resume_headers(self.partial_path)
+        self.hasher = None
+        self._file = None
+        self._write_seconds = 0.0
+        self._size = 0
+
+    def must_restart(self, status, content_range=None):
+        # Range không hợp lệ (file tạm hỏng/lớn hơn file gốc) hoặc server/proxy trả 206 cho đoạn khác
+        # với đoạn đã xin: nối vào file tạm sẽ làm hỏng PDF, nên tải lại từ đầu
+        if not self.resume_from:
+            return False
+        if status == 416:
+            return True
+        return status == 206 and parse_content_range_start(content_range) != self.resume_from
+
+    def open(self, status):
+        append = bool(self.resume_from) and status == 206
+        self.hasher = new_content_hasher(self.partial_path, append)
+        self._file = open(self.partial_path, "ab" if append else "wb")
+        return self
+
+    def write(self, chunk):
+        start = time.perf_counter()
+        self._file.write(chunk)
+        self._write_seconds += time.perf_counter() - start
+        self._size += len(chunk)
+        self.hasher.update(chunk)
+
+    def __enter__(self):
+        return self
+
+    def close(self):
+        self._file.close()
+        metrics.observe("disk_write", self._write_seconds)
+        metrics.incr("pdf_bytes", self._size)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def discard(self):
+        os.remove(self.partial_path)
+
+    def commit(self):
+        """Move the complete `.part` file into place; returns the SHA-256 hex digest of the file."""
+        os.replace(self.partial_path, self.file_path)
+        return self.hasher.hexdigest()
+
+def stream_pdf_to_file(session, pdf_url, file_path, chunk_size=PDF_CHUNK_SIZE):
+    """Stream `pdf_url` into `file_path` without holding the whole PDF in memory (see PartialDownload).
+
+    Returns the SHA-256 hex digest of the complete file.
+    """
+    download = PartialDownload(file_path, pdf_url)
+    with session.get(pdf_url, headers=download.headers, stream=True, verify=False) as pdf_response:
+        restart = download.must_restart(pdf_response.status_code, pdf_response.headers.get("Content-Range"))
+        if not restart:
+            pdf_response.raise_for_status()
+            with download.open(pdf_response.status_code) as out:
+                for chunk in pdf_response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        out.write(chunk)
+    if restart:
+        # Tải lại sau khi đã đóng response cũ để không giữ 2 slot của cùng host
+        download.discard()
+        return stream_pdf_to_file(session, pdf_url, file_path, chunk_size)
+    return download.commit()
+
+def register_download(url, pdf_url, file_path, content_hash):
+    """Record a finished download in the dedup index.
+
+    Returns the name of an earlier file with identical content, in which case
+    the new copy has been removed and must not be converted again.
+    """
+    index = get_dedup_index()
+    filename = os.path.basename(file_path)
+    duplicate_of = index.find_by_hash(content_hash)
+    index.record(get_detail_id(url), url, pdf_url, content_hash, filename)
+    if duplicate_of and duplicate_of != filename:
+        os.remove(file_path)
+        return duplicate_of
+    return None
+
+def is_excluded_by_filter(detail_id):
+    # Metadata đã có từ lần chạy trước: lọc theo DOWNLOAD_FILTER mà không cần tải lại trang chi tiết
+    known = get_metadata_index().get(detail_id)
+    return known is not None and not matches_filter(known)
+
+def record_detail_metadata(url, html):
+    # Trích metadata và link PDF từ chính trang chi tiết vừa tải (một lần parse, không thêm request),
+    # metadata được lưu vào index; trả về (metadata, pdf_url)
+    details, pdf_url = parse_detail_page(html, BASE_DOMAIN)
+    get_metadata_index().record(get_detail_id(url), url, details)
+    return details, pdf_url
+
+def build_pdf_metadata(url, pdf_url, drop_levels=None, page_num=None, pdf_index=None, details=None):
+    # Metadata đi kèm file qua hàng đợi convert, được lưu cùng text khi OUTPUT_FORMAT = "shards"
+    metadata = {
+        "id": get_detail_id(url),
+        "drop_levels": drop_levels,
+        "page": page_num,
+        "pdf_index": pdf_index,
+        "source_url": url,
+        "pdf_url": pdf_url,
+    }
+    metadata.update(details or {})
+    return metadata
+
+def enqueue_for_conversion(file_path, metadata=None):
+    # Đẩy file vào hàng đợi để convert
+    try:
+        from pdf_queue_worker import pdf_queue
+        pdf_queue.put((file_path, metadata))
+    except ImportError:
+        log.warning("Không thể import pdf_queue_worker để đẩy file vào hàng đợi.")
+
+def requeue_downloaded_pdfs():
+    """Queue again the PDFs an earlier run downloaded but never converted (crash before the converter finished).
+
+    Only files still on disk are queued; their metadata is rebuilt from the
+    dedup and metadata indexes. Returns the number of files queued.
+    """
+    queued = 0
+    for drop_levels, page_num, pdf_index, url, filename in get_progress_store().list_downloaded_pdfs():
+        file_path = os.path.join(DATASET_DIR, filename or "")
+        if not filename or not os.path.exists(file_path):
+            continue
+        detail_id = get_detail_id(url)
+        metadata = build_pdf_metadata(url, get_dedup_index().get_pdf_url(detail_id), drop_levels, page_num,
+                                      pdf_index, get_metadata_index().get(detail_id))
+        enqueue_for_conversion(file_path, metadata)
+        queued += 1
+    if queued:
+        log.info(f"♻️ Đưa lại {queued} PDF đã tải nhưng chưa convert vào hàng đợi")
+    return queued
+
+class PdfItem:
+    """Engine-independent bookkeeping of one detail link.
+
+    Holds the dedup/filter checks, the per-item state in the progress store,
+    the file name and the metadata sent to the converter, so both download_pdf
+    implementations (requests and aiohttp) only do the HTTP calls themselves.
+    Every method that ends the item returns its final state.
+    """
+
+    def __init__(self, url, drop_levels=None, page_num=None, pdf_index=None):
+        self.url = url
+        self.drop_levels = drop_levels
+        self.page_num = page_num
+        self.pdf_index = pdf_index
+        self.detail_id = get_detail_id(url)
+        self.pdf_url = None
+        self.file_path = None
+        self.details = None
+
+    def record(self, status, filename=None):
+        # Trạng thái theo vị trí (phạm vi, page, index); incremental không truyền vị trí nên không ghi
+        if self.page_num is not None and self.pdf_index is not None:
+            get_progress_store().set_pdf_state(self.drop_levels, self.page_num, self.pdf_index, status,
+                                               self.url, filename)
+        return status
+
+    def skip_before_fetch(self):
+        """PDF_SKIPPED if the link needs no request at all (already downloaded, excluded by the filter), else None."""
+        if get_dedup_index().has_detail(self.detail_id):
+            metrics.incr("pdfs", status="skipped_known")
+            log.debug(f"⏭️ Đã tải trước đó, bỏ qua: {self.detail_id}")
+            return self.record(PDF_SKIPPED)
+        if is_excluded_by_filter(self.detail_id):
+            metrics.incr("pdfs", status="filtered")
+            log.debug(f"⏭️ Không khớp bộ lọc, bỏ qua: {self.detail_id}")
+            return self.record(PDF_SKIPPED)
+        return None
+
+    def read_detail(self, html):
+        """Read the fetched detail page; returns the PDF URL to download, or None once the item is skipped."""
+        self.details, pdf_url = record_detail_metadata(self.url, html)
+        if not matches_filter(self.details):
+            metrics.incr("pdfs", status="filtered")
+            log.debug(f"⏭️ Không khớp bộ lọc, bỏ qua: {self.detail_id}")
+            self.record(PDF_SKIPPED)
+            return None
+        self.pdf_url = pdf_url
+        if not self.pdf_url:
+            metrics.incr("pdfs", status="no_pdf")
+            log.warning(f"No PDF link found on the page: {self.url}")
+            self.record(PDF_SKIPPED)
+            return None
+        filename = build_pdf_filename(self.url, self.pdf_url, self.drop_levels, self.page_num, self.pdf_index)
+        self.file_path = os.path.join(DATASET_DIR, filename)
+        return self.pdf_url
+
+    def finish(self, content_hash):
+        """Register the downloaded file; PDF_DOWNLOADED if it must be converted, PDF_SKIPPED for duplicate content."""
+        filename = os.path.basename(self.file_path)
+        duplicate_of = register_download(self.url, self.pdf_url, self.file_path, content_hash)
+        if duplicate_of:
+            metrics.incr("pdfs", status="duplicate")
+            log.debug(f"⏭️ {filename} trùng nội dung với {duplicate_of}, bỏ qua")
+            return self.record(PDF_SKIPPED, duplicate_of)
+        metrics.incr("pdfs", status="downloaded")
+        log.debug(f"Downloaded: {filename}", extra=fields(page=self.page_num, drop_levels=self.drop_levels))
+        # Ghi trạng thái trước khi đưa vào hàng đợi, để converter không bị ghi đè "converted"
+        return self.record(PDF_DOWNLOADED, filename)
+
+    def fail(self, error):
+        log.error(f"Error downloading PDF from {self.url}: {error}",
+                  extra=fields(page=self.page_num, drop_levels=self.drop_levels))
+        return self.record(PDF_FAILED)
+
+    @property
+    def metadata(self):
+        return build_pdf_metadata(self.url, self.pdf_url, self.drop_levels, self.page_num, self.pdf_index,
+                                  self.details)
 
 def download_pdf(url, session, drop_levels=None, page_num=None, pdf_index=None):
+    """Download the PDF of one detail page and queue it for conversion.
+
+    Returns:
+        str: final state of the item, also stored in the progress store:
+             PDF_DOWNLOADED, PDF_SKIPPED (already known, filtered out, duplicate
+             content or no PDF link) or PDF_FAILED (network, disk or
+             index error).
+    """
+    item = PdfItem(url, drop_levels, page_num, pdf_index)
+    skipped = item.skip_before_fetch()
+    if skipped:
+        return skipped
     try:
-        response = session.get(url, verify=False)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        pdf_links = [a for a in soup.find_all("a", href=True) if a["href"].lower().endswith(".pdf")]
-
-        if pdf_links:
-            for pdf_link in pdf_links:
-                pdf_url = pdf_link["href"]
-                if not pdf_url.startswith("http"):
-                    pdf_url = BASE_DOMAIN + pdf_url
-            
-            pdf_response = session.get(pdf_url, verify=False)
-            pdf_response.raise_for_status()
-            
-            # Đặt tên file: Droplevel + số page + index.pdf
-            if drop_levels is not None and page_num is not None and pdf_index is not None:
-                filename = f"{drop_levels}_{page_num}_{pdf_index}.pdf"
-            else:
-                # fallback cũ
-                url_parts = url.rstrip('/').split('/')
-                if len(url_parts) >= 2:
-                    filename = f"{url_parts[-2]}.pdf"
-                else:
-                    filename = pdf_url.split("/")[-1]
-            with open(f"{DATASET_DIR}/{filename}", "wb") as f:
-                f.write(pdf_response.content)
-            print(f"Downloaded: {filename}")
-            # Đẩy file vào hàng đợi để convert
-            try:
-                from pdf_queue_worker import pdf_queue
-                pdf_queue.put(os.path.join(DATASET_DIR, filename))
-            except ImportError:
-                print("[Warning] Không thể import pdf_queue_worker để đẩy file vào hàng đợi.")
-        else:
-            print("No PDF link found on the page.")
-    except RequestException as e:
-        print(f"Error downloading PDF from {url}: {e}")
+        with metrics.timer("detail_get"):
+            response = session.get(url, verify=False)
+            response.raise_for_status()
+        # Server không khai báo charset thì requests mặc định ISO-8859-1, làm hỏng nhãn tiếng Việt
+        if "charset" not in response.headers.get("Content-Type", "").lower():
+            response.encoding = "utf-8"
+        if not item.read_detail(response.text):
+            return PDF_SKIPPED
+        with metrics.timer("pdf_get"):
+            content_hash = stream_pdf_to_file(session, item.pdf_url, item.file_path)
+        status = item.finish(content_hash)
+        if status == PDF_DOWNLOADED:
+            enqueue_for_conversion(item.file_path, item.metadata)
+        return status
+    except (RequestException, OSError, sqlite3.Error) as e:
+        # Đĩa đầy / lỗi ghi file hay lỗi SQLite cũng đánh dấu PDF lỗi, để lần chạy sau tải lại
+        return item.fail(e)
@@ -1,73 +1,106 @@
+import time
 import requests
 from requests.exceptions import RequestException
-from bs4 import BeautifulSoup
 import urllib3
-from config import BASE_URL
+from config import BASE_URL, BASE_DOMAIN, PAGE_RETRY_LIMIT, RETRY_DELAY_SECONDS
+from page_parser import parse_hidden_fields, parse_listing, parse_page_count
+from search_filters import build_search_fields
+from transport import get_transport
+from metrics import metrics, get_logger, fields
+
+log = get_logger("crawl")
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 def get_hidden_fields(response):
     try:
-        soup = BeautifulSoup(response, "html.parser")
-        hidden = {}
-        for input_tag in soup.find_all("input", type="hidden"):
-            if input_tag.get("name") and input_tag.get("value"):
-                hidden[input_tag["name"]] = input_tag["value"]
-        return hidden
+        return parse_hidden_fields(response)
     except RequestException as e:
-        print(f"Error fetching hidden fields: {e}")
+        log.warning(f"Error fetching hidden fields: {e}")
         return {}
 
 def initialize_session():
-    session = requests.Session()
+    session = get_transport().new_session()
     response = session.get(BASE_URL, verify=False)
     response.raise_for_status()
     hidden_fields = get_hidden_fields(response.text)
     return session, hidden_fields
 
-def create_payload(hidden_fields, page, drop_levels, SEARCH_KEYWORD):
+def create_payload(hidden_fields, page, drop_levels, SEARCH_KEYWORD, filters=None):
+    # Bộ lọc phải gửi lại ở mọi postback, nếu không server trả về danh sách không lọc
+    search_fields = build_search_fields(drop_levels, SEARCH_KEYWORD, filters)
     if page == 1:
         return {
             **hidden_fields,
-            "ctl00$Content_home_Public$ctl00$txtKeyword": SEARCH_KEYWORD,
-            "ctl00$Content_home_Public$ctl00$Drop_Levels": drop_levels,
-            "ctl00$Content_home_Public$ctl00$Ra_Drop_Courts": "",
-            "ctl00$Content_home_Public$ctl00$Rad_DATE_FROM": "",
+            **search_fields,
             "ctl00$Content_home_Public$ctl00$cmd_search_banner": "Tìm kiếm"
         }
     else:
         return {
             **hidden_fields,
-            "ctl00$Content_home_Public$ctl00$txtKeyword": SEARCH_KEYWORD,
-            "ctl00$Content_home_Public$ctl00$Drop_Levels": drop_levels,
-            "ctl00$Content_home_Public$ctl00$Ra_Drop_Courts": "",
-            "ctl00$Content_home_Public$ctl00$Rad_DATE_FROM": "",
+            **search_fields,
             "ctl00$Content_home_Public$ctl00$DropPages": str(page),
             "__EVENTTARGET": "ctl00$Content_home_Public$ctl00$DropPages",
             "__EVENTARGUMENT": ""
         }
 
-def crawl_page(session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD):
-    payload = create_payload(hidden_fields, page, drop_levels, SEARCH_KEYWORD)
+def crawl_page(session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters=None):
+    payload = create_payload(hidden_fields, page, drop_levels, SEARCH_KEYWORD, filters)
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Content-Type": "application/x-www-form-urlencoded"
     }
     try:
-        response = session.post(BASE_URL, data=payload, headers=headers, verify=False)
-        response.raise_for_status()
-        print(f"📄 Page {page} (DROP_LEVELS={drop_levels}) fetched successfully.")
-        soup = BeautifulSoup(response.text, "html.parser")
-        links = [a["href"] for a in soup.find_all("a", href=True)]
-        page_links = []
-        for link in links:
-            text_split = link.split("/")
-            if len(text_split) > 2 and text_split[2] == "chi-tiet-ban-an":
-                full_link = BASE_DOMAIN + link
-                page_links.append(full_link)
-        new_hidden_fields = get_hidden_fields(response.text)
-        print(f"✅ Found {len(page_links)} detail links on page {page}")
+        with metrics.timer("listing_post"):
+            response = session.post(BASE_URL, data=payload, headers=headers, verify=False)
+            response.raise_for_status()
+        # Một lần parse lấy cả link chi tiết lẫn hidden fields cho postback kế tiếp
+        with metrics.timer("listing_parse"):
+            page_links, new_hidden_fields = parse_listing(response.text, BASE_DOMAIN)
+        log.debug(f"📄 Page {page}: {len(page_links)} detail links", extra=fields(page=page, drop_levels=drop_levels))
         return page_links, new_hidden_fields, True
     except RequestException as e:
-        print(f"❌ Error on page {page}: {e}")
+        log.warning(f"❌ Error on page {page}: {e}", extra=fields(page=page, drop_levels=drop_levels))
         return [], hidden_fields, False
+
+def probe_search(drop_levels, SEARCH_KEYWORD, filters=None, sample_detail=False):
+    """Run the search once: (page count, detail links on page 1).
+
+    The page count is read from DropPages; a result without DropPages has a
+    single page, or none when page 1 lists nothing. The search is tried up
+    to PAGE_RETRY_LIMIT times, RETRY_DELAY_SECONDS apart; the page count is
+    None only when every attempt failed.
+
+    The POST is timed as listing_post and, with `sample_detail`, the first
+    detail page as detail_get, so batch sizing has real latencies before
+    the crawl starts.
+    """
+    for attempt in range(1, PAGE_RETRY_LIMIT + 1):
+        try:
+            session, hidden_fields = initialize_session()
+            payload = create_payload(hidden_fields, 1, drop_levels, SEARCH_KEYWORD, filters)
+            with metrics.timer("listing_post"):
+                response = session.post(BASE_URL, data=payload, headers={
+                    "User-Agent": "Mozilla/5.0",
+                    "Content-Type": "application/x-www-form-urlencoded"
+                }, verify=False)
+                response.raise_for_status()
+            break
+        except RequestException as e:
+            log.warning(f"❌ Không lấy được số page (DROP_LEVELS={drop_levels}, "
+                        f"lần {attempt}/{PAGE_RETRY_LIMIT}): {e}")
+            if attempt == PAGE_RETRY_LIMIT:
+                return None, 0
+            time.sleep(RETRY_DELAY_SECONDS)
+    page_links, _ = parse_listing(response.text, BASE_DOMAIN)
+    if sample_detail and page_links:
+        try:
+            with metrics.timer("detail_get"):
+                session.get(page_links[0], verify=False).raise_for_status()
+        except RequestException as e:
+            log.debug(f"Không đo được thời gian trang chi tiết: {e}")
+    pages = parse_page_count(response.text)
+    if pages is None:
+        # Server chỉ hiện DropPages khi có nhiều page: không có thì là 1 page (hoặc 0 nếu không có kết quả)
+        pages = 1 if page_links else 0
+    return pages, len(page_links)
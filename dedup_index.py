@@ -0,0 +1,83 @@
+import os
+import time
+import sqlite3
+import threading
+from config import DEDUP_DB_PATH
+
+
+def get_detail_id(url):
+    # Link chi tiết có dạng .../{detail_id}/chi-tiet-ban-an
+    url_parts = url.rstrip('/').split('/')
+    if len(url_parts) >= 2:
+        return url_parts[-2]
+    return url
+
+
+class DedupIndex:
+    """On-disk index of downloaded judgments, keyed by detail ID and PDF content hash.
+
+    Lets `download_pdf` skip a judgment before any network request when its
+    detail ID is already known, and drop a freshly downloaded PDF whose content
+    was already stored under another name (listing pages shift between runs).
+    """
+
+    def __init__(self, db_path=DEDUP_DB_PATH):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                detail_id TEXT PRIMARY KEY,
+                detail_url TEXT,
+                pdf_url TEXT,
+                content_hash TEXT,
+                filename TEXT,
+                downloaded_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_downloads_hash ON downloads(content_hash)")
+        self._conn.commit()
+
+    def has_detail(self, detail_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM downloads WHERE detail_id = ?", (detail_id,)).fetchone()
+        return row is not None
+
+    def find_by_hash(self, content_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM downloads WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def get_pdf_url(self, detail_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pdf_url FROM downloads WHERE detail_id = ?", (detail_id,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, detail_id, detail_url, pdf_url, content_hash, filename):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                (detail_id, detail_url, pdf_url, content_hash, filename, time.time()))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    # Mở lazily để không tạo file DB trước khi main.py kịp xóa checkpoint
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DedupIndex()
+        return _index
@@ -0,0 +1,56 @@
+import queue
+import threading
+import concurrent.futures
+from metrics import metrics
+
+
+class DownloadPipeline:
+    """Bounded queue of detail links drained by a dedicated pool of download threads.
+
+    Listing-page producers call `submit` and keep going; they only block when
+    `max_queue_size` jobs are already waiting, which keeps memory flat when
+    downloads fall behind. Each job returns a Future resolved with the result
+    of `download_fn`.
+    """
+
+    def __init__(self, download_fn, num_workers=8, max_queue_size=100):
+        self.download_fn = download_fn
+        self.num_workers = num_workers
+        self.jobs = queue.Queue(maxsize=max_queue_size)
+        self.threads = []
+
+    def start(self):
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker, name=f"download-{i+1}")
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+        metrics.register_gauge("download_queue_depth", self.jobs.qsize)
+        return self
+
+    def submit(self, link, session, drop_levels, page, index):
+        future = concurrent.futures.Future()
+        self.jobs.put((future, link, session, drop_levels, page, index))
+        return future
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            future, link, session, drop_levels, page, index = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.download_fn(link, session, drop_levels, page, index))
+                except Exception as e:
+                    future.set_exception(e)
+            self.jobs.task_done()
+
+    def stop(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        metrics.unregister_gauge("download_queue_depth")
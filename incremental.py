@@ -0,0 +1,134 @@
+import os
+import time
+import json
+import concurrent.futures
+from config import (CHECKPOINT_DIR, BASE_DOMAIN, SEARCH_KEYWORD, PAGE_RETRY_LIMIT, RETRY_DELAY_SECONDS,
+                    PAGE_DELAY_SECONDS, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE, INCREMENTAL_STOP_PAGES)
+from crawl_utils import initialize_session, crawl_page
+from crawl_url_pdf import download_pdf
+from dedup_index import get_dedup_index, get_detail_id
+from download_pipeline import DownloadPipeline
+from search_filters import scope_key
+from progress_store import PDF_DOWNLOADED, PDF_SKIPPED
+from metrics import metrics, get_logger
+
+# Số ID mới nhất (đầu page 1) được lưu làm high-water mark
+HIGH_WATER_SIZE = 50
+
+log = get_logger("incremental")
+
+
+def is_finished(future):
+    # Chỉ download thành công (hoặc chủ động bỏ qua: lọc, trùng, không có PDF) mới được coi là đã biết
+    if future is None:
+        return True
+    return future.done() and future.exception() is None and future.result() in (PDF_DOWNLOADED, PDF_SKIPPED)
+
+
+def get_state_filepath(drop_levels):
+    if not os.path.exists(CHECKPOINT_DIR):
+        os.makedirs(CHECKPOINT_DIR)
+    return os.path.join(CHECKPOINT_DIR, f"incremental_{drop_levels}.json")
+
+
+def load_incremental_state(drop_levels):
+    filepath = get_state_filepath(drop_levels)
+    if os.path.exists(filepath):
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"drop_levels": drop_levels, "high_water_ids": [], "last_run_at": None}
+
+
+def save_incremental_state(state):
+    filepath = get_state_filepath(state["drop_levels"])
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
+
+
+def crawl_page_with_retry(session, page, hidden_fields, drop_levels, filters=None):
+    for attempt in range(1, PAGE_RETRY_LIMIT + 1):
+        links, hidden_fields, success = crawl_page(
+            session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters)
+        metrics.incr("pages", status="ok" if success else "failed")
+        if success:
+            return links, hidden_fields, True
+        log.warning(f"🔁 Page {page} lỗi (lần {attempt}/{PAGE_RETRY_LIMIT})")
+        time.sleep(RETRY_DELAY_SECONDS)
+    return [], hidden_fields, False
+
+
+def run_incremental(drop_levels, max_pages, stop_after_known_pages=INCREMENTAL_STOP_PAGES, filters=None):
+    """Crawl from page 1 and stop once `stop_after_known_pages` pages in a row contain no new judgment.
+
+    A link is "known" when its detail ID is in the dedup index or in the
+    high-water mark (newest IDs of page 1 that the previous run finished). The
+    listing is newest-first, so a run of fully known pages means the rest is
+    already on disk. A page-1 judgment whose download failed is left out of
+    the high-water mark, so the next run fetches it again.
+    """
+    # High-water mark riêng cho từng phạm vi tìm kiếm (cấp tòa + bộ lọc)
+    scope = scope_key(drop_levels, filters)
+    state = load_incremental_state(scope)
+    high_water_ids = set(state.get("high_water_ids", []))
+    index = get_dedup_index()
+    log.info(f"🆕 INCREMENTAL (DROP_LEVELS={scope}): dừng sau {stop_after_known_pages} page liên tiếp không có bản án mới")
+    if state.get("last_run_at"):
+        log.info(f"🕒 Lần chạy trước: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state['last_run_at']))}")
+
+    session, hidden_fields = initialize_session()
+    pipeline = DownloadPipeline(download_pdf, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE).start()
+    pending_downloads = []
+    newest_ids = None
+    first_page_downloads = {}
+    known_run = 0
+    pages_scanned = 0
+    new_links = 0
+    try:
+        for page in range(1, max_pages + 1):
+            page_links, hidden_fields, success = crawl_page_with_retry(session, page, hidden_fields, drop_levels, filters)
+            if not success:
+                log.warning(f"❌ Page {page} thất bại sau {PAGE_RETRY_LIMIT} lần, dừng incremental")
+                break
+            pages_scanned += 1
+            if not page_links:
+                log.info(f"🏁 Page {page} không còn link, hết danh sách")
+                break
+            detail_ids = [get_detail_id(link) for link in page_links]
+            first_page = newest_ids is None
+            if first_page:
+                newest_ids = detail_ids[:HIGH_WATER_SIZE]
+            new_items = [link for link, detail_id in zip(page_links, detail_ids)
+                         if detail_id not in high_water_ids and not index.has_detail(detail_id)]
+            if not new_items:
+                known_run += 1
+                log.debug(f"⏭️ Page {page}: không có bản án mới ({known_run}/{stop_after_known_pages})")
+                if known_run >= stop_after_known_pages:
+                    log.info(f"🏁 Đã gặp {known_run} page liên tiếp đã biết, dừng ở page {page}")
+                    break
+            else:
+                known_run = 0
+                new_links += len(new_items)
+                log.info(f"✅ Page {page}: {len(new_items)}/{len(page_links)} bản án mới")
+                pending_downloads = [f for f in pending_downloads if not f.done()]
+                # Không truyền page/index: vị trí trên listing thay đổi giữa các lần chạy,
+                # file được đặt tên theo ID chi tiết để không ghi đè kết quả cũ
+                for link in new_items:
+                    future = pipeline.submit(link, session, scope, None, None)
+                    pending_downloads.append(future)
+                    if first_page:
+                        first_page_downloads[get_detail_id(link)] = future
+            time.sleep(PAGE_DELAY_SECONDS)
+        concurrent.futures.wait(pending_downloads)
+    finally:
+        pipeline.stop()
+
+    if newest_ids:
+        state["high_water_ids"] = [detail_id for detail_id in newest_ids
+                                   if is_finished(first_page_downloads.get(detail_id))]
+    state["last_run_at"] = time.time()
+    state["last_pages_scanned"] = pages_scanned
+    state["last_new_links"] = new_links
+    save_incremental_state(state)
+    log.info(f"🎉 INCREMENTAL hoàn thành: quét {pages_scanned} page, {new_links} bản án mới")
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from config import COORDINATOR_DB_PATH, LEASE_SECONDS, LEASE_MAX_ATTEMPTS
+from metrics import get_logger
+from search_filters import scope_key, normalize_filters
+
+LEASE_PENDING = "pending"
+LEASE_LEASED = "leased"
+LEASE_DONE = "done"
+LEASE_FAILED = "failed"
+
+log = get_logger("coordinator")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    scope TEXT NOT NULL,
+    batch_number INTEGER NOT NULL,
+    drop_levels TEXT NOT NULL,
+    filters TEXT,
+    start_page INTEGER NOT NULL,
+    end_page INTEGER NOT NULL,
+    max_pages INTEGER,
+    batch_size INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires_at REAL,
+    attempts INTEGER DEFAULT 0,
+    completed_pages TEXT,
+    updated_at REAL,
+    PRIMARY KEY (scope, batch_number)
+);
+CREATE INDEX IF NOT EXISTS idx_leases_status ON leases(status, lease_expires_at);
+"""
+
+
+def get_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseCoordinator:
+    """Shared work table that lets several crawler processes or machines split a crawl.
+
+    Every batch of every registered scope (court level + search filters) is a
+    row. A node leases one batch at a time for `lease_seconds` and keeps
+    renewing it while working; a lease that is not renewed (dead node)
+    expires and the batch is handed to the next node that asks, seeded with
+    the pages the previous owner reported as completed. A batch leased more
+    than `max_attempts` times is marked failed instead of being handed out again.
+
+    The database is meant to sit on a volume shared by all nodes, so it uses
+    the rollback journal instead of WAL (WAL needs shared memory and does not
+    work across machines).
+    """
+
+    def __init__(self, db_path=COORDINATOR_DB_PATH, lease_seconds=LEASE_SECONDS, max_attempts=LEASE_MAX_ATTEMPTS):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        from progress_store import _Transaction
+        return _Transaction(self._connection())
+
+    def register_batches(self, drop_levels, max_pages, batch_size, filters=None):
+        """Add the batches of a scope; idempotent, so every node may register the same crawl.
+
+        Nodes may compute different adaptive batch sizes; the first node to
+        register a scope fixes it and later nodes reuse that size, so batch
+        numbers map to the same page ranges everywhere. Returns (scope, batch_size).
+        """
+        filters = normalize_filters(filters)
+        scope = scope_key(drop_levels, filters)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT batch_size FROM leases WHERE scope = ? ORDER BY batch_number LIMIT 1",
+                               (scope,)).fetchone()
+            if row is not None and row[0]:
+                batch_size = row[0]
+            rows = []
+            for batch_num in range(1, (max_pages + batch_size - 1) // batch_size + 1):
+                start_page = (batch_num - 1) * batch_size + 1
+                end_page = min(batch_num * batch_size, max_pages)
+                rows.append((scope, batch_num, drop_levels, json.dumps(filters, ensure_ascii=False),
+                             start_page, end_page, max_pages, batch_size, time.time()))
+            conn.executemany(
+                "INSERT OR IGNORE INTO leases (scope, batch_number, drop_levels, filters, start_page, end_page, "
+                "max_pages, batch_size, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # Số page tăng so với lần đăng ký trước: nới batch cuối (bị cắt ngắn) và cho chạy lại phần mới
+            conn.executemany(
+                "UPDATE leases SET end_page = ?, max_pages = ?, "
+                "status = CASE WHEN status = ? THEN ? ELSE status END "
+                "WHERE scope = ? AND batch_number = ? AND end_page < ?",
+                [(row[5], max_pages, LEASE_DONE, LEASE_PENDING, scope, row[1], row[5]) for row in rows])
+        return scope, batch_size
+
+    def acquire(self, node_id):
+        """Lease the next pending (or expired) batch; returns a lease dict or None when nothing is left."""
+        now = time.time()
+        with self._transaction() as conn:
+            # Lease hết hạn mà đã hết lượt thử: node giữ nó chết liên tục, không giao lại nữa
+            conn.execute(
+                "UPDATE leases SET status = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (LEASE_FAILED, now, LEASE_LEASED, now, self.max_attempts))
+            row = conn.execute(
+                "SELECT scope, batch_number, drop_levels, filters, start_page, end_page, max_pages, batch_size, "
+                "owner, completed_pages FROM leases "
+                "WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY status = ?, scope, batch_number LIMIT 1",
+                (LEASE_PENDING, LEASE_LEASED, now, LEASE_LEASED)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE leases SET status = ?, owner = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE scope = ? AND batch_number = ?",
+                (LEASE_LEASED, node_id, now + self.lease_seconds, now, row[0], row[1]))
+        (scope, batch_number, drop_levels, filters, start_page, end_page, max_pages, batch_size,
+         previous_owner, completed_pages) = row
+        return {
+            "scope": scope,
+            "batch_number": batch_number,
+            "drop_levels": drop_levels,
+            "filters": json.loads(filters) if filters else {},
+            "start_page": start_page,
+            "end_page": end_page,
+            "max_pages": max_pages,
+            "batch_size": batch_size,
+            "previous_owner": previous_owner,
+            "completed_pages": json.loads(completed_pages) if completed_pages else [],
+            # Heartbeat bật cờ này khi lease bị node khác nhận; batch_worker dừng ở page kế tiếp
+            "lost": threading.Event(),
+        }
+
+    def renew(self, lease, node_id, completed_pages=None):
+        """Extend a lease and report progress; returns False if the lease was lost to another node."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE leases SET lease_expires_at = ?, completed_pages = COALESCE(?, completed_pages), "
+                "updated_at = ? WHERE scope = ? AND batch_number = ? AND owner = ? AND status = ?",
+                (now + self.lease_seconds,
+                 json.dumps(sorted(completed_pages)) if completed_pages is not None else None,
+                 now, lease["scope"], lease["batch_number"], node_id, LEASE_LEASED))
+            return cursor.rowcount == 1
+
+    def complete(self, lease, node_id, completed_pages=None):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE leases SET status = ?, lease_expires_at = NULL, "
+                "completed_pages = COALESCE(?, completed_pages), updated_at = ? "
+                "WHERE scope = ? AND batch_number = ? AND owner = ?",
+                (LEASE_DONE, json.dumps(sorted(completed_pages)) if completed_pages is not None else None,
+                 time.time(), lease["scope"], lease["batch_number"], node_id))
+            return cursor.rowcount == 1
+
+    def release(self, lease, node_id):
+        """Give a batch back (e.g. after an error) so another node can take it right away.
+
+        Returns True when the batch has used up its attempts and was marked failed instead.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE leases SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_expires_at = NULL, updated_at = ? "
+                "WHERE scope = ? AND batch_number = ? AND owner = ? AND status = ?",
+                (self.max_attempts, LEASE_FAILED, LEASE_PENDING, time.time(), lease["scope"],
+                 lease["batch_number"], node_id, LEASE_LEASED))
+            row = conn.execute("SELECT status FROM leases WHERE scope = ? AND batch_number = ?",
+                               (lease["scope"], lease["batch_number"])).fetchone()
+        return row is not None and row[0] == LEASE_FAILED
+
+    def summary(self):
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM leases GROUP BY status").fetchall())
+
+
+class LeaseHeartbeat:
+    """Background thread renewing the leases held by this node every lease_seconds / 3."""
+
+    def __init__(self, coordinator, node_id, progress_fn):
+        self.coordinator = coordinator
+        self.node_id = node_id
+        self.progress_fn = progress_fn
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, lease):
+        with self._lock:
+            self._leases[(lease["scope"], lease["batch_number"])] = lease
+
+    def remove(self, lease):
+        with self._lock:
+            self._leases.pop((lease["scope"], lease["batch_number"]), None)
+
+    def _run(self):
+        while not self._stopped.wait(self.coordinator.lease_seconds / 3):
+            with self._lock:
+                leases = list(self._leases.values())
+            for lease in leases:
+                try:
+                    if not self.coordinator.renew(lease, self.node_id, self.progress_fn(lease)):
+                        log.warning(f"⚠️ Mất lease {lease['scope']} batch {lease['batch_number']} (đã bị node khác nhận)")
+                        lease["lost"].set()
+                        self.remove(lease)
+                except sqlite3.Error as e:
+                    log.warning(f"⚠️ Không gia hạn được lease {lease['scope']} batch {lease['batch_number']}: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
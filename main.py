@@ -1,24 +1,10 @@
-import concurrent.futures
-import json
-import requests
-from requests.exceptions import RequestException
-from bs4 import BeautifulSoup
-import urllib3
-import time
 import os
-from crawl_url_pdf import download_pdf
-from config import (BASE_URL, BASE_DOMAIN, DATASET_DIR, CHECKPOINT_DIR,
-                    DEFAULT_MAX_PAGES, DEFAULT_BATCH_SIZE, MIN_BATCH_SIZE, MAX_BATCH_SIZE,
-                    DROP_LEVELS_OPTIONS, DEFAULT_DROP_LEVELS, SEARCH_KEYWORD)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-
-
-from config import DEFAULT_MAX_PAGES
-from checkpoint_utils import list_all_checkpoints
-from crawl_utils import get_hidden_fields, initialize_session
-from main_batch import main as run_batches
-from pdf_queue_worker import start_pdf_converter_workers, stop_pdf_converter_workers
+import sys
+import shutil
+import threading
+# Chỉ import config/cli ở đây: tham số dòng lệnh, file cấu hình và biến môi trường phải được áp vào
+# config trước khi các module crawl đọc giá trị (from config import ...) lúc được import
+from cli import parse_options, build_filter_shards
 
 def get_user_configuration():
     print("\n" + "="*60)
@@ -26,9 +12,9 @@ def get_user_configuration():
     print("="*60)
     while True:
         try:
-            max_pages_input = input(f"📄 Nhập số pages tối đa để crawl (mặc định {DEFAULT_MAX_PAGES}): ").strip()
+            max_pages_input = input("📄 Nhập số pages tối đa để crawl (Enter = tự đọc số page thật): ").strip()
             if not max_pages_input:
-                max_pages = DEFAULT_MAX_PAGES
+                max_pages = None
             else:
                 max_pages = int(max_pages_input)
                 if max_pages <= 0:
@@ -40,9 +26,9 @@ def get_user_configuration():
 
     while True:
         try:
-            total_batches_input = input(f"🔢 Nhập tổng số batch muốn tạo (ví dụ 100) (mặc định 5): ").strip()
+            total_batches_input = input(f"🔢 Nhập số batch mỗi cấp tòa (Enter = tự động theo tốc độ đo được): ").strip()
             if not total_batches_input:
-                total_batches = 5
+                total_batches = None
             else:
                 total_batches = int(total_batches_input)
                 if total_batches < 1:
@@ -66,22 +52,20 @@ def get_user_configuration():
         except ValueError:
             print("❌ Vui lòng nhập số nguyên hợp lệ")
 
-    # Compute batch size from pages and total batches
-    batch_size = (max_pages + total_batches - 1) // total_batches
+    # Số page thật và batch size được xác định cho từng cấp tòa lúc chạy (main_batch.plan_jobs)
     print(f"\n✅ Cấu hình đã chọn:")
-    print(f"   📄 Max pages: {max_pages}")
-    print(f"   🔢 Tổng batches: {total_batches}")
+    print(f"   📄 Max pages: {max_pages or 'tự động (DropPages)'}")
+    print(f"   🔢 Batches mỗi cấp: {total_batches or 'tự động'}")
     print(f"   🧵 Luồng (threads): {num_threads}")
-    print(f"   📦 Batch size: {batch_size}")
-    print(f"   📊 Pages trong batch cuối: {max_pages - batch_size * (total_batches-1)}")
-    return max_pages, batch_size, total_batches, num_threads
+    return max_pages, total_batches, num_threads
 
-def display_checkpoint_status_and_choose(max_pages, batch_size, total_batches):
+def display_checkpoint_status_and_choose(max_pages, total_batches):
     print("\n" + "="*80)
     print("📊 HỆ THỐNG CHECKPOINT THEO DROP_LEVELS + BATCH")
     print("="*80)
-    print(f"📄 Configuration: {max_pages} pages, batch size {batch_size}, {total_batches} batches")
+    print(f"📄 Configuration: {max_pages or 'auto'} pages, {total_batches or 'auto'} batches")
     from config import DROP_LEVELS_OPTIONS, DEFAULT_DROP_LEVELS
+    from checkpoint_utils import list_all_checkpoints
     print("\n🎯 Các cấp tòa án:")
     for key, name in DROP_LEVELS_OPTIONS.items():
         print(f"  [{key}] {name}")
@@ -93,40 +77,175 @@ def display_checkpoint_status_and_choose(max_pages, batch_size, total_batches):
     else:
         print("\n📋 Chưa có checkpoint nào.")
     print("\n" + "-"*50)
-    drop_levels = input(f"Chọn cấp tòa án (TW/CW/T/H hoặc Enter cho {DEFAULT_DROP_LEVELS}): ").strip().upper()
-    if not drop_levels:
-        drop_levels = DEFAULT_DROP_LEVELS
-    if drop_levels not in DROP_LEVELS_OPTIONS:
-        print(f"❌ Cấp '{drop_levels}' không hợp lệ, sử dụng mặc định '{DEFAULT_DROP_LEVELS}'")
-        drop_levels = DEFAULT_DROP_LEVELS
-    print(f"\n✅ Sẽ tạo batch đa luồng cho cấp tòa án: {drop_levels} ({DROP_LEVELS_OPTIONS[drop_levels]})")
-    return drop_levels
+    answer = input(f"Chọn cấp tòa án (TW/CW/T/H, nhiều cấp cách nhau dấu phẩy, ALL = tất cả, "
+                   f"Enter cho {DEFAULT_DROP_LEVELS}): ").strip().upper()
+    if answer == "ALL":
+        levels = list(DROP_LEVELS_OPTIONS)
+    else:
+        levels = []
+        for drop_levels in (level.strip() for level in answer.split(",")):
+            if not drop_levels:
+                continue
+            if drop_levels not in DROP_LEVELS_OPTIONS:
+                print(f"❌ Cấp '{drop_levels}' không hợp lệ, bỏ qua")
+            elif drop_levels not in levels:
+                levels.append(drop_levels)
+    if not levels:
+        levels = [DEFAULT_DROP_LEVELS]
+    print(f"\n✅ Sẽ tạo batch đa luồng cho cấp tòa án: "
+          f"{', '.join(f'{level} ({DROP_LEVELS_OPTIONS[level]})' for level in levels)}")
+    return levels
 
-import shutil
-import os
+def get_search_filters():
+    """Ask for search filters; returns the list of filter dicts to run (one per shard)."""
+    from config import SEARCH_FILTERS
+    from search_filters import normalize_filters, iter_filter_shards
+    print("\n🔎 Bộ lọc tìm kiếm (Enter để bỏ qua, mặc định lấy từ SEARCH_FILTERS trong config.py):")
+    while True:
+        filters = dict(SEARCH_FILTERS)
+        courts = [c.strip() for c in input("  Mã tòa án (nhiều tòa cách nhau dấu phẩy): ").split(",") if c.strip()]
+        for key, label in (("date_from", "Từ ngày (dd/mm/yyyy)"), ("date_to", "Đến ngày (dd/mm/yyyy)"),
+                           ("case_type", "Loại vụ/việc"), ("keyword", "Từ khóa")):
+            value = input(f"  {label}: ").strip()
+            if value:
+                filters[key] = value
+        try:
+            filters = normalize_filters(filters)
+            split_by_month = False
+            if "date_from" in filters and "date_to" in filters:
+                split_by_month = input("  Chia thành các truy vấn nhỏ theo từng tháng? (y/N): ").strip().lower() == 'y'
+            shards = list(iter_filter_shards(filters, courts=courts, split_by_month=split_by_month))
+            break
+        except ValueError as e:
+            print(f"❌ {e}")
+    if len(shards) > 1:
+        print(f"✅ Chia thành {len(shards)} truy vấn độc lập (theo tòa án / tháng)")
+    return shards
 
-if __name__ == "__main__":
+def reset_checkpoints():
+    from config import CHECKPOINT_DIR
+    if os.path.exists(CHECKPOINT_DIR):
+        shutil.rmtree(CHECKPOINT_DIR)
+        print(f"✅ Đã xóa toàn bộ checkpoint trong {CHECKPOINT_DIR}")
+    else:
+        print("Không có thư mục checkpoint để xóa.")
+
+def ask_options(options):
+    """Interactive mode: fill the run options through input() prompts, as before the CLI existed."""
+    max_pages, total_batches, num_threads = get_user_configuration()
+    # Hỏi user có muốn xóa toàn bộ checkpoint không
+    reset = input("\nBạn có muốn tải lại từ đầu và xóa toàn bộ checkpoint? (y/N): ").strip().lower()
+    if reset == 'y':
+        reset_checkpoints()
+    levels = display_checkpoint_status_and_choose(max_pages, total_batches)
+    filter_shards = get_search_filters()
+    incremental = input("Chỉ tải bản án mới kể từ lần chạy trước (incremental)? (y/N): ").strip().lower() == 'y'
+    distributed = False
+    if not incremental:
+        distributed = input("Chạy nhiều máy qua coordinator dùng chung (COORDINATOR_DB_PATH)? (y/N): ").strip().lower() == 'y'
+    return dict(options, max_pages=max_pages, batches=total_batches, threads=num_threads, levels=levels,
+                filter_shards=filter_shards, reset=False, incremental=incremental, distributed=distributed)
+
+def print_dry_run(options, filter_shards):
+    """Print the batches and pending pages a run would crawl, from the existing checkpoints only."""
+    import config
+    from search_filters import describe_scope, scope_key
+    from work_scheduler import plan_batches, compress_pages, resolve_batch_size
+    from progress_store import open_read_only_progress_store
+    # Chỉ đọc checkpoint: không tạo progress.sqlite3, không import JSON cũ
+    open_read_only_progress_store()
+    # Không gửi request nên chưa biết số page thật: dùng max_pages (hoặc DEFAULT_MAX_PAGES)
+    pages = options["max_pages"] or config.DEFAULT_MAX_PAGES
+    print("\n🧪 DRY RUN - không gửi request, không ghi checkpoint")
+    print(f"   Engine {config.CRAWL_ENGINE}, {options['threads']} luồng, "
+          f"{pages} page mỗi truy vấn{'' if options['max_pages'] else ' (mặc định)'}"
+          f"{', incremental' if options['incremental'] else ''}{', nhiều máy' if options['distributed'] else ''}")
+    print(f"   PDF: {config.DATASET_DIR} | text: {config.DATASET_CLEANING_DIR} | checkpoint: {config.CHECKPOINT_DIR}")
+    if options["reset"]:
+        print("   ⚠️ --reset: checkpoint sẽ bị xóa, mọi page sẽ crawl lại từ đầu (kế hoạch dưới đây chưa tính)")
+    total_pending = 0
+    for drop_levels in options["levels"]:
+        for filters in filter_shards:
+            batch_size = resolve_batch_size(scope_key(drop_levels, filters), pages, options["threads"],
+                                            batch_size=options["batch_size"], total_batches=options["batches"])
+            print(f"\n🔎 {describe_scope(drop_levels, filters)} - batch size {batch_size}")
+            for batch in plan_batches([(drop_levels, filters, pages, batch_size)]):
+                total_pending += len(batch["pending"])
+                status = "có checkpoint" if batch["exists"] else "mới"
+                line = (f"   [BATCH {batch['scope']}/{batch['batch_number']}] page {batch['start_page']}-"
+                        f"{batch['end_page']} ({status}): {len(batch['completed'])} đã xong")
+                if batch["failed"]:
+                    line += f", {len(batch['failed'])} hết lượt retry ({compress_pages(batch['failed'])})"
+                line += f", cần crawl: {compress_pages(batch['pending']) or 'không'}"
+                print(line)
+    print(f"\n📋 Tổng cộng {total_pending} page cần crawl. Khi chạy thật, số page của mỗi cấp đọc từ DropPages "
+          f"và batch size mới tính theo tốc độ đo được (checkpoint đã có giữ batch size cũ).")
+
+def run(options):
+    """Run one crawl from resolved options (command line, config file or prompts)."""
+    max_pages, num_threads = options["max_pages"], options["threads"]
+    levels = options["levels"]
+    filter_shards = options.get("filter_shards") or build_filter_shards(options)
+    if options["dry_run"]:
+        print_dry_run(options, filter_shards)
+        return
+    if options["reset"]:
+        reset_checkpoints()
+
+    from main_batch import main as run_batches, run_node, plan_jobs
+    from lease_coordinator import LeaseCoordinator
+    from incremental import run_incremental
+    from search_filters import describe_scope
+    from pdf_queue_worker import start_pdf_converter_workers, stop_pdf_converter_workers, pdf_queue
+    from crawl_url_pdf import requeue_downloaded_pdfs
+    from metrics import start_monitoring, stop_monitoring
+
+    # Khởi động process pool convert PDF (số process theo CONVERTER_WORKERS / số CPU chia OCR_WORKERS)
+    converter_pool = start_pdf_converter_workers()
+    # PDF đã tải nhưng chưa convert ở lần chạy trước: đưa lại vào hàng đợi từ luồng riêng,
+    # hàng đợi convert có giới hạn nên không để crawl phải chờ
+    requeue = threading.Thread(target=requeue_downloaded_pdfs, name="pdf-requeue", daemon=True)
+    requeue.start()
+    # Dòng tóm tắt metrics định kỳ + endpoint /metrics (nếu đặt METRICS_PORT)
+    monitoring = start_monitoring()
     try:
-        print("🚀 CRAWL DỮ LIỆU BẢN ÁN - ĐA LUỒNG THEO BATCH")
-        # Lấy cấu hình trước để lấy số luồng
-        max_pages, batch_size, total_batches, num_threads = get_user_configuration()
-        # Khởi động các worker converter với số worker bằng số luồng crawl
-        converter_threads = start_pdf_converter_workers(num_workers=num_threads)
-        # Hỏi user có muốn xóa toàn bộ checkpoint không
-        reset = input("\nBạn có muốn tải lại từ đầu và xóa toàn bộ checkpoint? (y/N): ").strip().lower()
-        if reset == 'y':
-            from config import CHECKPOINT_DIR
-            if os.path.exists(CHECKPOINT_DIR):
-                shutil.rmtree(CHECKPOINT_DIR)
-                print(f"✅ Đã xóa toàn bộ checkpoint trong {CHECKPOINT_DIR}")
-            else:
-                print("Không có thư mục checkpoint để xóa.")
-        # max_pages, batch_size, total_batches, num_threads đã lấy ở trên
-        drop_levels = display_checkpoint_status_and_choose(max_pages, batch_size, total_batches)
-        run_batches(max_pages, batch_size, total_batches, num_threads, drop_levels)
+        # Số page của từng cấp tòa / truy vấn đọc từ DropPages (tối đa max_pages nếu có), batch size theo
+        # thời gian mỗi page đo được lúc dò và số luồng
+        jobs = plan_jobs(levels, filter_shards, max_pages, num_threads, options["batch_size"], options["batches"])
+        if options["incremental"]:
+            for drop_levels, filters, pages, _ in jobs:
+                print(f"\n🔎 Truy vấn: {describe_scope(drop_levels, filters)}")
+                run_incremental(drop_levels, pages, filters=filters)
+        elif options["distributed"]:
+            # Mọi node đăng ký cùng các batch (không tạo trùng; batch size do node đăng ký đầu tiên quyết định)
+            # rồi thuê batch cho tới khi hết
+            coordinator = LeaseCoordinator()
+            for drop_levels, filters, pages, batch_size in jobs:
+                coordinator.register_batches(drop_levels, pages, batch_size, filters)
+            run_node(num_threads, node_id=options["node_id"], coordinator=coordinator)
+        else:
+            # Mọi cấp tòa chạy chung một pool luồng, một scheduler và một pipeline download/convert
+            run_batches(jobs, num_threads)
         # Đợi xử lý hết hàng đợi PDF
-        from pdf_queue_worker import pdf_queue
+        requeue.join()
         pdf_queue.join()
-        stop_pdf_converter_workers(converter_threads)
+    finally:
+        # Cả khi crawl lỗi / Ctrl+C: đợi luồng pdf-requeue (converter vẫn chạy nên nó không kẹt ở put())
+        # rồi mới dừng process pool, để không bỏ lại process convert hay luồng đang ghi hàng đợi
+        try:
+            requeue.join()
+            stop_pdf_converter_workers(converter_pool)
+        finally:
+            stop_monitoring(monitoring)
+
+if __name__ == "__main__":
+    # Tham số dòng lệnh / --config / biến môi trường CRAWLER_*; không có gì thì hỏi bằng input() như cũ
+    options = parse_options()
+    try:
+        print("🚀 CRAWL DỮ LIỆU BẢN ÁN - ĐA LUỒNG THEO BATCH")
+        if options["interactive"]:
+            options = ask_options(options)
+        run(options)
     except KeyboardInterrupt:
         print("\n⏹️ Đã dừng chương trình (Ctrl+C)")
+        sys.exit(130)
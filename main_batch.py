@@ -1,55 +1,249 @@
+import asyncio
+import time
+import functools
 import concurrent.futures
-from config import (BASE_DOMAIN, SEARCH_KEYWORD)
-from crawl_utils import initialize_session
-from checkpoint_utils import list_all_checkpoints, load_checkpoint
-from batch_worker import batch_worker
-def main(max_pages, batch_size, total_batches, num_threads, drop_levels):
-    checkpoints = list_all_checkpoints()
-    batch_ckpt_map = {}
-    for ckpt in checkpoints:
-        if ckpt["drop_levels"] == drop_levels:
-            batch_ckpt_map[ckpt["batch_number"]] = load_checkpoint(drop_levels, ckpt["batch_number"])
-    # create list of batch numbers
-    batch_numbers = list(range(1, total_batches + 1))
-
-    # Map batches round-robin to threads: thread i gets batches i, i+num_threads, i+2*num_threads, ...
-    assignments = {i: [] for i in range(1, num_threads + 1)}
-    for idx, batch_num in enumerate(batch_numbers):
-        thread_id = (idx % num_threads) + 1
-        assignments[thread_id].append(batch_num)
-
-    print(f"\n🧵 Sử dụng {num_threads} luồng; tổng batches: {total_batches}")
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = []
-        for thread_id in range(1, num_threads + 1):
-            assigned = assignments.get(thread_id, [])
-            if not assigned:
+from config import (BASE_DOMAIN, SEARCH_KEYWORD, CRAWL_ENGINE, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE,
+                    PAGE_RETRY_LIMIT, RETRY_DELAY_SECONDS)
+from session_state import get_state_cache
+from transport import get_transport
+from crawl_utils import probe_search
+from crawl_url_pdf import download_pdf
+from download_pipeline import DownloadPipeline
+from batch_worker import batch_worker, range_worker
+from checkpoint_utils import create_checkpoint_structure, get_unfinished_pdfs, load_checkpoint, save_checkpoint
+from progress_store import get_progress_store, PDF_DOWNLOADED
+from lease_coordinator import LeaseCoordinator, LeaseHeartbeat, get_node_id
+from search_filters import describe_scope, scope_key
+from metrics import metrics
+from work_scheduler import build_scheduler, resolve_batch_size
+
+# Số link mỗi page khi page 1 không đọc được (trang kết quả của cổng thường có 20 bản án)
+DEFAULT_LINKS_PER_PAGE = 20
+
+
+def estimate_page_seconds(links_per_page, num_workers):
+    """Seconds one crawl worker spends per listing page, from the stage timers recorded so far.
+
+    Workers only POST listings, but the download pool (DOWNLOAD_WORKERS) must
+    fetch a detail page and a PDF for every link, so with many workers the
+    pool is the limit: per worker a page costs
+    max(listing_post, num_workers * links * (detail_get + pdf_get) / DOWNLOAD_WORKERS).
+    A PDF is assumed to cost as much as a detail page until one was timed.
+    Returns None when nothing has been measured yet.
+    """
+    timers = metrics.snapshot()["timers"]
+    if "listing_post" not in timers:
+        return None
+    listing = timers["listing_post"]["avg_seconds"]
+    detail = timers.get("detail_get", {}).get("avg_seconds", listing)
+    pdf = timers.get("pdf_get", {}).get("avg_seconds", detail)
+    downloads = num_workers * links_per_page * (detail + pdf) / max(DOWNLOAD_WORKERS, 1)
+    return max(listing, downloads)
+
+
+def plan_jobs(levels, filter_shards, max_pages=None, num_workers=1, batch_size=None, total_batches=None):
+    """One (drop_levels, filters, pages, batch_size) job per court level and search shard.
+
+    The page count of every job is read from the DropPages options of its
+    first result page, so no request is wasted past the last page; `max_pages`
+    (optional) only caps it. A scope whose page count cannot be read (the
+    probe failed on every retry) is left out of the run with a warning instead
+    of being crawled blind; running again picks it up. The batch size of each job comes from
+    work_scheduler.resolve_batch_size: existing checkpoints keep theirs,
+    an explicit `batch_size` / `total_batches` is honoured, otherwise it is
+    derived from the latencies measured by the probe and `num_workers`.
+    """
+    jobs = []
+    for drop_levels in levels:
+        for filters in filter_shards:
+            # Đo thêm một trang chi tiết ở lần dò đầu tiên để ước lượng chi phí tải mỗi page
+            pages, links = probe_search(drop_levels, SEARCH_KEYWORD, filters,
+                                        sample_detail="detail_get" not in metrics.snapshot()["timers"])
+            name = describe_scope(drop_levels, filters)
+            if pages is None:
+                # Đoán số page sẽ crawl hàng loạt page rỗng và đánh dấu chúng đã xong: bỏ qua, lần chạy sau làm tiếp
+                print(f"⚠️ {name}: không đọc được số page sau {PAGE_RETRY_LIMIT} lần thử, bỏ qua lần chạy này")
+                continue
+            print(f"🔎 {name}: {pages} page")
+            if max_pages:
+                pages = min(pages, max_pages)
+            if pages <= 0:
+                print(f"   ⏭️ {name}: không có kết quả, bỏ qua")
                 continue
-            futures.append(executor.submit(worker_thread_runner, thread_id, assigned, max_pages, batch_size, drop_levels))
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
+            page_seconds = estimate_page_seconds(links or DEFAULT_LINKS_PER_PAGE, num_workers)
+            size = resolve_batch_size(scope_key(drop_levels, filters), pages, num_workers, page_seconds,
+                                      batch_size, total_batches)
+            print(f"   📦 Batch size {size} ({-(-pages // size)} batch"
+                  f"{f', ~{page_seconds:.2f}s/page mỗi worker' if page_seconds else ''})")
+            jobs.append((drop_levels, filters, pages, size))
+    return jobs
+
+
+def resume_unfinished_pdfs(scheduler, pipeline):
+    """Queue the PDFs of pages crawled in an earlier run that never finished (crash, network error).
+
+    Runs next to the crawl workers, so their listing pages are not held up
+    while the bounded pipeline drains. Returns the download futures; the
+    listing pages themselves are not fetched again.
+    """
+    futures = []
+    session = None
+    for batch, page, pdf_index, link in scheduler.unfinished_pdfs():
+        # Trang chi tiết là GET thường, không cần ViewState/cookie của phạm vi tìm kiếm
+        session = session or get_transport().new_session()
+        future = pipeline.submit(link, session, batch[0], page, pdf_index)
+        future.add_done_callback(functools.partial(scheduler.count_download, batch))
+        futures.append(future)
+    if futures:
+        print(f"♻️ Tải lại {len(futures)} PDF chưa xong của các page đã crawl")
+    return futures
+
+
+def main(jobs, num_threads):
+    """Crawl every job (court level / search shard) with one worker pool, one scheduler and one download pipeline.
+
+    Args:
+        jobs: list of (drop_levels, filters, max_pages, batch_size), see plan_jobs.
+        num_threads: crawl workers shared by all jobs.
+    """
+    if CRAWL_ENGINE == "async":
+        from async_engine import run_batches
+        asyncio.run(run_batches(jobs, num_threads))
+        print("\n🎉 TẤT CẢ BATCH ĐÃ HOÀN THÀNH!")
+        return
+    # Hàng đợi page dùng chung cho mọi cấp tòa: luồng nào rảnh lấy việc tiếp, không chia batch cố định theo luồng
+    scheduler = build_scheduler(jobs)
+    state_cache = get_state_cache()
+
+    print(f"\n🧵 Sử dụng {num_threads} luồng; {len(jobs)} phạm vi, tổng batches: {len(scheduler.checkpoints)}; "
+          f"{DOWNLOAD_WORKERS} luồng download")
+
+    pipeline = DownloadPipeline(download_pdf, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE).start()
+    try:
+        pending_downloads = []
+        # Thêm một luồng đẩy PDF chưa xong của lần trước, song song với các worker crawl
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads + 1) as executor:
+            futures = [executor.submit(resume_unfinished_pdfs, scheduler, pipeline)] + [
+                executor.submit(range_worker, worker_id, scheduler, state_cache, pipeline,
+                                BASE_DOMAIN, SEARCH_KEYWORD)
+                for worker_id in range(1, num_threads + 1)
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                pending_downloads += future.result()
+        if pending_downloads:
+            print(f"⏳ Đợi {len(pending_downloads)} PDF còn trong pipeline...")
+            concurrent.futures.wait(pending_downloads)
+    finally:
+        pipeline.stop()
+        scheduler.save_all()
 
     print("\n🎉 TẤT CẢ BATCH ĐÃ HOÀN THÀNH!")
 
-def worker_thread_runner(thread_id: int, assigned_batches: list, max_pages: int, batch_size: int, drop_levels: str):
-    """Run assigned batch numbers sequentially for this thread."""
-    for batch_num in assigned_batches:
-        start_page = (batch_num - 1) * batch_size + 1
-        end_page = min(batch_num * batch_size, max_pages)
-        session, hidden_fields = initialize_session()
-        existing_ckpt = load_checkpoint(drop_levels, batch_num)
-        print(f"\n[THREAD {thread_id}] Starting assigned batch {batch_num} (pages {start_page}-{end_page})")
-        batch_worker(
-            drop_levels,
-            batch_num,
-            start_page,
-            end_page,
-            max_pages,
-            batch_size,
-            session,
-            hidden_fields,
-            existing_ckpt,
-            BASE_DOMAIN,
-            SEARCH_KEYWORD
-        )
+
+def _count_resumed_download(scope, page, future):
+    error = future.exception()
+    if error is not None:
+        print(f"[{scope}] ❌ Lỗi download (page {page}): {error}")
+        return
+    if future.result() == PDF_DOWNLOADED:
+        get_progress_store().add_downloaded(scope, page)
+
+
+def resume_node_pdfs(pipeline):
+    """Coordinator-mode counterpart of resume_unfinished_pdfs, over every scope and page of this node.
+
+    Batches finished on the coordinator are never leased again, so their
+    unfinished PDFs are queued here. Each download is counted in the batch
+    holding its page. Returns the download futures.
+    """
+    futures = []
+    session = None
+    for scope, page, pdf_index, link in get_unfinished_pdfs():
+        session = session or get_transport().new_session()
+        future = pipeline.submit(link, session, scope, page, pdf_index)
+        future.add_done_callback(functools.partial(_count_resumed_download, scope, page))
+        futures.append(future)
+    if futures:
+        print(f"♻️ Tải lại {len(futures)} PDF chưa xong của các page đã crawl")
+    return futures
+
+
+def _completed_pages(lease):
+    checkpoint_data = get_progress_store().load_batch(lease["scope"], lease["batch_number"])
+    return sorted(checkpoint_data.get("completed_pages", ())) if checkpoint_data else None
+
+
+def _run_lease(lease, state_cache, pipeline):
+    """Run the existing batch_worker on one leased batch, resuming from the local or reported progress."""
+    drop_levels, filters = lease["drop_levels"], lease["filters"]
+    batch_num = lease["batch_number"]
+    checkpoint_data = load_checkpoint(lease["scope"], batch_num)
+    if checkpoint_data is None and lease["completed_pages"]:
+        # Batch lấy lại từ node đã chết: bỏ qua các page node đó báo đã xong
+        checkpoint_data = create_checkpoint_structure(
+            lease["scope"], batch_num, lease["start_page"], lease["end_page"], lease["max_pages"],
+            lease["batch_size"], describe_scope(drop_levels, filters))
+        checkpoint_data["completed_pages"] = set(lease["completed_pages"])
+        save_checkpoint(checkpoint_data)
+        print(f"[BATCH {batch_num}] ♻️ Nhận lại từ {lease['previous_owner']}: "
+              f"{len(lease['completed_pages'])} page đã xong")
+    session, hidden_fields = state_cache.new_session(drop_levels, filters)
+    batch_worker(drop_levels, batch_num, lease["start_page"], lease["end_page"], lease["max_pages"],
+                 lease["batch_size"], session, hidden_fields, checkpoint_data, BASE_DOMAIN, SEARCH_KEYWORD,
+                 pipeline, state_cache, filters, stop_event=lease["lost"])
+
+
+def run_node(num_threads, node_id=None, coordinator=None):
+    """Coordinator mode: lease batches from the shared store until none is left.
+
+    Every node registers the scopes it was asked to crawl (see
+    LeaseCoordinator.register_batches) and then runs this loop; each thread
+    holds one lease at a time and runs the normal batch_worker on it. Leases
+    are renewed in the background with the pages completed so far, so a batch
+    whose node dies is picked up by another node after LEASE_SECONDS.
+    """
+    node_id = node_id or get_node_id()
+    coordinator = coordinator or LeaseCoordinator()
+    state_cache = get_state_cache()
+    heartbeat = LeaseHeartbeat(coordinator, node_id, _completed_pages).start()
+    pipeline = DownloadPipeline(download_pdf, DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE).start()
+    print(f"\n🌐 Node {node_id}: {num_threads} luồng, lease {coordinator.lease_seconds}s, "
+          f"coordinator {coordinator.db_path}")
+
+    def lease_loop(worker_id):
+        while True:
+            lease = coordinator.acquire(node_id)
+            if lease is None:
+                return
+            print(f"[NODE {node_id}/{worker_id}] 🔒 Nhận lease {lease['scope']} batch {lease['batch_number']} "
+                  f"(page {lease['start_page']}-{lease['end_page']})")
+            heartbeat.add(lease)
+            try:
+                _run_lease(lease, state_cache, pipeline)
+            except Exception as e:
+                # Trả batch lại cho node khác thay vì giữ lease tới khi hết hạn, rồi nghỉ trước lease kế tiếp
+                print(f"[NODE {node_id}/{worker_id}] ❌ Lỗi batch {lease['batch_number']}: {e}")
+                if coordinator.release(lease, node_id):
+                    print(f"[NODE {node_id}/{worker_id}] ⛔ Batch {lease['batch_number']} lỗi quá "
+                          f"{coordinator.max_attempts} lần, đánh dấu failed")
+                time.sleep(RETRY_DELAY_SECONDS)
+                continue
+            finally:
+                heartbeat.remove(lease)
+            if lease["lost"].is_set() or not coordinator.complete(lease, node_id, _completed_pages(lease)):
+                print(f"[NODE {node_id}/{worker_id}] ⚠️ Lease batch {lease['batch_number']} đã thuộc node khác")
+
+    try:
+        # Trạng thái PDF là cục bộ của node: PDF chưa tải được được đẩy lại từ một luồng riêng
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads + 1) as executor:
+            resumed = executor.submit(resume_node_pdfs, pipeline)
+            for future in [executor.submit(lease_loop, worker_id) for worker_id in range(1, num_threads + 1)]:
+                future.result()
+            pending_downloads = resumed.result()
+        if pending_downloads:
+            print(f"⏳ Đợi {len(pending_downloads)} PDF tải lại còn trong pipeline...")
+            concurrent.futures.wait(pending_downloads)
+    finally:
+        heartbeat.stop()
+        pipeline.stop()
+    print(f"\n🎉 Node {node_id}: hết batch để nhận. Trạng thái chung: {coordinator.summary()}")
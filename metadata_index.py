@@ -0,0 +1,122 @@
+import os
+import time
+import sqlite3
+import threading
+from config import METADATA_DB_PATH, DOWNLOAD_FILTER
+
+# Cột metadata của một bản án, trùng tên với key metadata trả về bởi page_parser.parse_detail_page
+METADATA_COLUMNS = (
+    "case_number", "title", "court", "judgment_date", "year",
+    "case_type", "judgment_level", "legal_relation",
+)
+# Trường lọc theo chuỗi con (không phân biệt hoa thường)
+TEXT_FILTERS = ("court", "case_type", "judgment_level", "legal_relation")
+
+
+def matches_filter(metadata, filters=None):
+    """Check a judgment's metadata against DOWNLOAD_FILTER-style filters.
+
+    Text filters (court, case_type, judgment_level, legal_relation) match as
+    case-insensitive substrings; year_from/year_to bound `year`. A field that
+    could not be extracted (None) never excludes a judgment.
+    """
+    filters = DOWNLOAD_FILTER if filters is None else filters
+    for key in TEXT_FILTERS:
+        wanted = filters.get(key)
+        value = metadata.get(key)
+        if wanted and value and wanted.lower() not in value.lower():
+            return False
+    year = metadata.get("year")
+    if year is not None:
+        if filters.get("year_from") and year < filters["year_from"]:
+            return False
+        if filters.get("year_to") and year > filters["year_to"]:
+            return False
+    return True
+
+
+class MetadataIndex:
+    """Case metadata of every fetched detail page, keyed by detail ID.
+
+    Filled by `download_pdf` from the detail page it already fetches, so later
+    runs can filter by court, year or case type (and downstream jobs can
+    query the fields) without refetching or re-parsing anything.
+    """
+
+    def __init__(self, db_path=METADATA_DB_PATH):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS judgments (
+                detail_id TEXT PRIMARY KEY,
+                detail_url TEXT,
+                case_number TEXT,
+                title TEXT,
+                court TEXT,
+                judgment_date TEXT,
+                year INTEGER,
+                case_type TEXT,
+                judgment_level TEXT,
+                legal_relation TEXT,
+                extracted_at REAL
+            )
+        """)
+        for column in ("court", "year", "case_type"):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_judgments_{column} ON judgments({column})")
+        self._conn.commit()
+
+    def get(self, detail_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(METADATA_COLUMNS)} FROM judgments WHERE detail_id = ?",
+                (detail_id,)).fetchone()
+        return dict(zip(METADATA_COLUMNS, row)) if row else None
+
+    def record(self, detail_id, detail_url, metadata):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO judgments (detail_id, detail_url, {', '.join(METADATA_COLUMNS)}, extracted_at) "
+                f"VALUES ({', '.join('?' * (len(METADATA_COLUMNS) + 3))})",
+                (detail_id, detail_url, *(metadata.get(column) for column in METADATA_COLUMNS), time.time()))
+
+    def find(self, court=None, year=None, case_type=None, limit=None):
+        """Query judgments by court / case type (substring) and year; returns dicts."""
+        conditions, params = [], []
+        if court:
+            conditions.append("court LIKE ?")
+            params.append(f"%{court}%")
+        if case_type:
+            conditions.append("case_type LIKE ?")
+            params.append(f"%{case_type}%")
+        if year:
+            conditions.append("year = ?")
+            params.append(year)
+        sql = f"SELECT detail_id, detail_url, {', '.join(METADATA_COLUMNS)} FROM judgments"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(("detail_id", "detail_url") + METADATA_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_metadata_index():
+    # Mở lazily như dedup index, sau khi main.py có thể đã xóa checkpoint
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MetadataIndex()
+        return _index
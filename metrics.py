@@ -0,0 +1,271 @@
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import LOG_LEVEL, LOG_JSON, METRICS_SUMMARY_SECONDS, METRICS_PORT
+
+# Stage được đo thời gian (label "stage"): listing_post, listing_parse, detail_get, pdf_get,
+# disk_write, checkpoint_save, convert, ocr
+
+
+class Metrics:
+    """Thread-safe counters, per-stage timers and gauges of one crawler process.
+
+    Counters and timers can carry labels (e.g. `stage`); gauges are callables
+    sampled on read (queue depths). Reading is cheap enough to be polled by the
+    summary thread or the HTTP endpoint while workers keep recording.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timers = {}
+        self._gauges = {}
+        self.started_at = time.time()
+
+    def incr(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            timer = self._timers.get(stage)
+            if timer is None:
+                self._timers[stage] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Time a block as `stage`; an exception also counts as an error of that stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.incr("errors", stage=stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def error(self, stage):
+        self.incr("errors", stage=stage)
+
+    def register_gauge(self, name, fn):
+        with self._lock:
+            self._gauges[name] = fn
+
+    def unregister_gauge(self, name):
+        with self._lock:
+            self._gauges.pop(name, None)
+
+    def drain(self):
+        """Return and reset counters and timers; used to ship a converter process's numbers to the parent."""
+        with self._lock:
+            data = {"counters": self._counters, "timers": self._timers}
+            self._counters, self._timers = {}, {}
+        return data
+
+    def merge(self, data):
+        """Add counters and timers returned by `drain` in another process."""
+        with self._lock:
+            for key, value in data.get("counters", {}).items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for stage, (count, total, maximum) in data.get("timers", {}).items():
+                timer = self._timers.setdefault(stage, [0, 0.0, 0.0])
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], maximum)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {stage: list(values) for stage, values in self._timers.items()}
+            gauges = dict(self._gauges)
+        gauge_values = {}
+        for name, fn in gauges.items():
+            try:
+                gauge_values[name] = fn()
+            except Exception:
+                gauge_values[name] = None
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "timers": {stage: {"count": count, "total_seconds": round(total, 6),
+                               "avg_seconds": round(total / count, 6), "max_seconds": round(maximum, 6)}
+                       for stage, (count, total, maximum) in sorted(timers.items())},
+            "gauges": gauge_values,
+        }
+
+    def render_prometheus(self):
+        snapshot = self.snapshot()
+        lines = [f"crawler_uptime_seconds {snapshot['uptime_seconds']}"]
+        for counter in snapshot["counters"]:
+            labels = ",".join(f'{key}="{value}"' for key, value in counter["labels"].items())
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"crawler_{counter['name']}_total{labels} {counter['value']}")
+        for stage, timer in snapshot["timers"].items():
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {timer["count"]}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {timer["total_seconds"]}')
+            lines.append(f'crawler_stage_seconds_max{{stage="{stage}"}} {timer["max_seconds"]}')
+        for name, value in snapshot["gauges"].items():
+            if value is not None:
+                lines.append(f"crawler_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def get_metrics():
+    return metrics
+
+
+class _Formatter(logging.Formatter):
+    # Trường cấu trúc truyền qua extra=fields(...) được nối dạng key=value (hoặc gộp vào JSON)
+    def format(self, record):
+        extra = getattr(record, "fields", None) or {}
+        if LOG_JSON:
+            entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                     "thread": record.threadName, "msg": record.getMessage(), **extra}
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        line = super().format(record)
+        if extra:
+            line += " " + " ".join(f"{key}={value}" for key, value in extra.items())
+        return line
+
+
+_logging_ready = False
+_logging_lock = threading.Lock()
+
+
+def setup_logging(level=LOG_LEVEL):
+    """Configure the "crawler" logger once per process (also in converter processes)."""
+    global _logging_ready
+    with _logging_lock:
+        if _logging_ready:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_Formatter("%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s", "%H:%M:%S"))
+        root = logging.getLogger("crawler")
+        root.addHandler(handler)
+        root.setLevel(level)
+        root.propagate = False
+        _logging_ready = True
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(f"crawler.{name}")
+
+
+def fields(**values):
+    """`extra` argument carrying structured fields, e.g. log.info("...", extra=fields(page=3))."""
+    return {"fields": values}
+
+
+def _rate(current, previous, elapsed):
+    return (current - previous) / elapsed if elapsed > 0 else 0.0
+
+
+class SummaryReporter:
+    """Background thread logging one summary line (throughput, queues, errors) every `interval` seconds."""
+
+    def __init__(self, registry=metrics, interval=METRICS_SUMMARY_SECONDS):
+        self.registry = registry
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-summary", daemon=True)
+        self._last = (time.time(), 0, 0, 0)
+        self._log = get_logger("metrics")
+
+    def start(self):
+        if self.interval:
+            self._thread.start()
+        return self
+
+    def summary_line(self):
+        registry = self.registry
+        now = time.time()
+        pages = registry.counter("pages", status="ok")
+        pdfs = registry.counter("pdfs", status="downloaded")
+        pdf_bytes = registry.counter("pdf_bytes")
+        last_time, last_pages, last_pdfs, last_bytes = self._last
+        elapsed = now - last_time
+        self._last = (now, pages, pdfs, pdf_bytes)
+        snapshot = registry.snapshot()
+        errors = sum(c["value"] for c in snapshot["counters"] if c["name"] == "errors")
+        timers = " ".join(f"{stage}={timer['avg_seconds'] * 1000:.0f}ms"
+                          for stage, timer in snapshot["timers"].items())
+        gauges = " ".join(f"{name}={value}" for name, value in snapshot["gauges"].items() if value is not None)
+        return (f"📊 pages={pages} ({_rate(pages, last_pages, elapsed):.2f}/s) "
+                f"pdfs={pdfs} ({_rate(pdfs, last_pdfs, elapsed):.2f}/s) "
+                f"{_rate(pdf_bytes, last_bytes, elapsed) / 1024:.0f}KB/s errors={errors} {gauges} | {timers}")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._log.info(self.summary_line())
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        # Dòng cuối: tổng kết từ lúc bắt đầu
+        self._last = (self.registry.started_at, 0, 0, 0)
+        self._log.info(self.summary_line())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = metrics.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /metrics.json on localhost; returns the server or None if disabled."""
+    if port is None:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    get_logger("metrics").info(f"📡 Metrics: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_monitoring():
+    """Start the summary line and (if METRICS_PORT is set) the HTTP endpoint; pass the result to stop_monitoring."""
+    return SummaryReporter().start(), start_metrics_server()
+
+
+def stop_monitoring(handle):
+    reporter, server = handle
+    reporter.stop()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,201 @@
+import re
+import unicodedata
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
+
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    # lxml không bắt buộc: fallback về BeautifulSoup chỉ parse thẻ <a>/<input>
+    lxml_html = None
+
+# Listing, chi tiết và form ASP.NET chỉ cần đúng 2 loại thẻ này
+_ONLY_LINKS_AND_INPUTS = SoupStrainer(["a", "input"])
+
+# Nhãn trên trang chi tiết bản án -> tên trường metadata (so khớp sau khi chuẩn hóa, bỏ dấu ":")
+DETAIL_LABELS = {
+    "bản án số": "case_number",
+    "quyết định số": "case_number",
+    "số bản án": "case_number",
+    "số quyết định": "case_number",
+    "tên bản án": "title",
+    "tên quyết định": "title",
+    "tòa án xét xử": "court",
+    "tòa án": "court",
+    "ngày ban hành": "judgment_date",
+    "ngày tuyên án": "judgment_date",
+    "loại vụ/việc": "case_type",
+    "loại vụ việc": "case_type",
+    "cấp xét xử": "judgment_level",
+    "quan hệ pháp luật": "legal_relation",
+}
+_DATE_PATTERN = re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})")
+_YEAR_IN_CASE_NUMBER = re.compile(r"/((?:19|20)\d{2})/")
+
+
+def _iter_tags(html):
+    """Yield (tag, attrs) for every <a> and <input> of the document in a single parse."""
+    if not html or not html.strip():
+        return
+    if lxml_html is not None:
+        root = lxml_html.fromstring(html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+        for element in root.iter("a", "input"):
+            yield element.tag, element.attrib
+    else:
+        soup = BeautifulSoup(html, "html.parser", parse_only=_ONLY_LINKS_AND_INPUTS)
+        for element in soup.find_all(["a", "input"]):
+            yield element.name, element.attrs
+
+
+def _is_hidden_field(tag, attrs):
+    return (tag == "input" and (attrs.get("type") or "").lower() == "hidden"
+            and attrs.get("name") and attrs.get("value"))
+
+
+def _is_detail_link(href):
+    text_split = href.split("/")
+    return len(text_split) > 2 and text_split[2] == "chi-tiet-ban-an"
+
+
+def parse_hidden_fields(html):
+    return {attrs["name"]: attrs["value"] for tag, attrs in _iter_tags(html) if _is_hidden_field(tag, attrs)}
+
+
+def parse_listing(html, base_domain):
+    """Extract detail links and the ASP.NET hidden fields of a listing page in one pass.
+
+    Returns:
+        (links, hidden_fields): absolute `chi-tiet-ban-an` URLs in page order and
+        the `__VIEWSTATE`-style inputs needed for the next postback.
+    """
+    links = []
+    hidden_fields = {}
+    for tag, attrs in _iter_tags(html):
+        if tag == "a":
+            href = attrs.get("href")
+            if href and _is_detail_link(href):
+                links.append(base_domain + href)
+        elif _is_hidden_field(tag, attrs):
+            hidden_fields[attrs["name"]] = attrs["value"]
+    return links, hidden_fields
+
+
+def parse_page_count(html):
+    """Number of result pages, read from the options of the DropPages <select>; None if absent."""
+    if not html or not html.strip():
+        return None
+    if lxml_html is not None:
+        root = lxml_html.fromstring(html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+        selects = [(select.get("name") or "", [option.get("value") or option.text_content()
+                                                 for option in select.iter("option")])
+                   for select in root.iter("select")]
+    else:
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("select"))
+        selects = [(select.get("name") or "", [option.get("value") or option.get_text()
+                                                 for option in select.find_all("option")])
+                   for select in soup.find_all("select")]
+    for name, values in selects:
+        if name.endswith("DropPages"):
+            pages = [int(value) for value in values if value and value.strip().isdigit()]
+            return max(pages) if pages else None
+    return None
+
+
+def _pdf_href(href, base_domain):
+    if href and href.lower().endswith(".pdf"):
+        return href if href.startswith("http") else base_domain + href
+    return None
+
+
+def _normalize_label(text):
+    text = unicodedata.normalize("NFC", text).strip().rstrip(":").strip().lower()
+    return " ".join(text.replace("toà", "tòa").split())
+
+
+def _iter_detail_nodes(html):
+    """Yield ("text", chunk) for the text nodes and ("href", value) for the <a> links of a document, in order.
+
+    Script/style text is skipped. One parse serves both the metadata labels and the PDF link.
+    """
+    if not html or not html.strip():
+        return
+    if lxml_html is not None:
+        root = lxml_html.fromstring(html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+        for element in root.iter():
+            if isinstance(element.tag, str):
+                if element.tag == "a" and element.get("href"):
+                    yield "href", element.get("href")
+                if element.tag not in ("script", "style") and element.text:
+                    yield "text", element.text
+            if element.tail:
+                yield "text", element.tail
+    else:
+        soup = BeautifulSoup(html, "html.parser")
+        for element in soup(["script", "style"]):
+            element.decompose()
+        for node in soup.descendants:
+            if isinstance(node, NavigableString):
+                yield "text", str(node)
+            elif node.name == "a" and node.get("href"):
+                yield "href", node["href"]
+
+
+def parse_detail_page(html, base_domain):
+    """Extract the case fields and the PDF link of a `chi-tiet-ban-an` page in one parse.
+
+    Fields are found by their Vietnamese label ("Bản án số:", "Tòa án xét xử:",
+    "Ngày ban hành:", "Loại vụ/việc:", "Cấp xét xử:"...); the value is the rest
+    of the label's text node or the next text node. Missing fields are None.
+    The PDF link is the last `.pdf` href of the page.
+
+    Returns:
+        (metadata, pdf_url): metadata is a dict of case_number, title, court,
+        judgment_date (ISO yyyy-mm-dd), year, case_type, judgment_level,
+        legal_relation; pdf_url is absolute, or None without a PDF link.
+    """
+    metadata = dict.fromkeys(sorted(set(DETAIL_LABELS.values())))
+    pdf_url = None
+    pending_field = None
+    # Nhãn không kèm ":" (vd. <b>Loại vụ/việc</b>: ...) chỉ được nhận nếu text kế tiếp bắt đầu bằng ":"
+    label_without_colon = None
+    for kind, chunk in _iter_detail_nodes(html):
+        if kind == "href":
+            pdf_url = _pdf_href(chunk, base_domain) or pdf_url
+            continue
+        chunk = " ".join(chunk.split())
+        if not chunk:
+            continue
+        if label_without_colon is not None:
+            field, label_without_colon = label_without_colon, None
+            if chunk.startswith(":"):
+                chunk = chunk[1:].strip()
+                if chunk:
+                    metadata[field] = chunk
+                else:
+                    pending_field = field
+                continue
+        if pending_field is not None:
+            metadata[pending_field] = chunk
+            pending_field = None
+            continue
+        label, colon, value = chunk.partition(":")
+        field = DETAIL_LABELS.get(_normalize_label(label))
+        if field is None or metadata[field] is not None:
+            continue
+        if not colon:
+            label_without_colon = field
+        elif value.strip():
+            metadata[field] = value.strip()
+        else:
+            pending_field = field
+
+    metadata["year"] = None
+    date_match = _DATE_PATTERN.search(metadata["judgment_date"] or "")
+    if date_match:
+        day, month, year = (int(part) for part in date_match.groups())
+        metadata["judgment_date"] = f"{year:04d}-{month:02d}-{day:02d}"
+        metadata["year"] = year
+    else:
+        year_match = _YEAR_IN_CASE_NUMBER.search(metadata["case_number"] or "")
+        if year_match:
+            metadata["year"] = int(year_match.group(1))
+    return metadata, pdf_url
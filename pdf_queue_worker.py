@@ -1,40 +1,115 @@
 import os
 import threading
 import queue
-from pdf_to_text import process_file
-from config import DATASET_DIR
-
-# Hàng đợi lưu tên file PDF cần convert
-pdf_queue = queue.Queue()
-
-# Worker: lấy file từ hàng đợi và convert
-def pdf_converter_worker():
-    while True:
-        file_path = pdf_queue.get()
-        if file_path is None:
-            break  # Dùng None để báo hiệu dừng thread
+import functools
+import concurrent.futures
+from pdf_to_text import process_file, COMPLETE_TYPES
+from config import DATASET_DIR, CONVERTER_WORKERS, CONVERTER_QUEUE_SIZE, OCR_WORKERS
+from progress_store import get_progress_store, PDF_CONVERTED
+from metrics import metrics, get_logger
+
+log = get_logger("converter")
+
+# Hàng đợi lưu (file PDF, metadata) cần convert. Có giới hạn: khi convert không theo kịp,
+# pdf_queue.put() ở phía download sẽ chờ (backpressure) thay vì dồn file trên đĩa.
+pdf_queue = queue.Queue(maxsize=CONVERTER_QUEUE_SIZE)
+metrics.register_gauge("convert_queue_depth", pdf_queue.qsize)
+
+
+def _init_converter_process():
+    # Tesseract (OpenMP) mặc định dùng mọi core cho mỗi trang; song song đã có ở OCR_WORKERS x CONVERTER_WORKERS.
+    # Chỉ đặt trong process convert, process crawl giữ nguyên môi trường
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def default_converter_workers():
+    # Mỗi process convert chạy tối đa OCR_WORKERS tesseract: chia số CPU để không chạy gấp đôi số core
+    return max(1, (os.cpu_count() or 1) // max(1, OCR_WORKERS))
+
+
+class ConverterPool:
+    """Process pool that converts PDFs taken from `pdf_queue`.
+
+    PyMuPDF extraction and Tesseract OCR are CPU-bound, so each file is handled
+    in a separate process (sized to CPU cores, not to crawl threads). A single
+    dispatcher thread feeds the pool and keeps at most `max_in_flight` files
+    submitted; results and errors come back to the parent through `on_result`.
+    """
+
+    def __init__(self, num_workers=None, on_result=None):
+        self.num_workers = num_workers or CONVERTER_WORKERS or default_converter_workers()
+        self.on_result = on_result or _print_result
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers,
+                                                               initializer=_init_converter_process)
+        self._slots = threading.BoundedSemaphore(self.num_workers * 2)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="pdf-dispatcher")
+        self._dispatcher.daemon = True
+
+    def start(self):
+        self._dispatcher.start()
+        return self
+
+    def _dispatch(self):
+        while True:
+            item = pdf_queue.get()
+            if item is None:
+                pdf_queue.task_done()
+                break
+            file_path, metadata = item
+            self._slots.acquire()
+            try:
+                future = self.executor.submit(process_file, file_path, metadata)
+            except Exception as e:
+                self._finish(file_path, metadata, None, e)
+                continue
+            future.add_done_callback(functools.partial(self._on_done, file_path, metadata))
+
+    def _on_done(self, file_path, metadata, future):
+        error = future.exception()
+        self._finish(file_path, metadata, None if error else future.result(), error)
+
+    def _finish(self, file_path, metadata, result, error):
         try:
-            process_file(file_path)
-            print(f"[Converter] Đã xử lý xong: {file_path}")
+            if error is not None:
+                metrics.error("convert")
+            elif result and "metrics" in result:
+                # Timer convert/OCR đo trong process con, cộng vào metrics của process chính
+                metrics.merge(result.pop("metrics"))
+            if error is None and result and result.get("type") in COMPLETE_TYPES:
+                _mark_converted(metadata)
+            self.on_result(file_path, result, error)
         except Exception as e:
-            print(f"[Converter] Lỗi khi xử lý {file_path}: {e}")
-        pdf_queue.task_done()
-
-def start_pdf_converter_workers(num_workers=4):
-    threads = []
-    for _ in range(num_workers):
-        t = threading.Thread(target=pdf_converter_worker)
-        t.daemon = True
-        t.start()
-        threads.append(t)
-    return threads
-
-def stop_pdf_converter_workers(threads):
-    for _ in threads:
+            log.error(f"[Converter] Lỗi khi xử lý kết quả {file_path}: {e}")
+        finally:
+            self._slots.release()
+            pdf_queue.task_done()
+
+    def stop(self):
         pdf_queue.put(None)
-    for t in threads:
-        t.join()
+        self._dispatcher.join()
+        self.executor.shutdown(wait=True)
+
+
+def _mark_converted(metadata):
+    # PDF có vị trí (phạm vi, page, index) thì đánh dấu converted; file incremental không có vị trí
+    if metadata and metadata.get("page") is not None and metadata.get("pdf_index") is not None:
+        get_progress_store().set_pdf_state(metadata["drop_levels"], metadata["page"], metadata["pdf_index"], PDF_CONVERTED)
+
+
+def _print_result(file_path, result, error):
+    if error is not None:
+        log.error(f"[Converter] Lỗi khi xử lý {file_path}: {error}")
+    else:
+        log.debug(f"[Converter] Đã xử lý xong: {file_path}")
+
+
+def start_pdf_converter_workers(num_workers=None, on_result=None):
+    return ConverterPool(num_workers, on_result).start()
+
+
+def stop_pdf_converter_workers(converter_pool):
+    converter_pool.stop()
 
 # Hàm này sẽ được gọi khi tải xong 1 file PDF
-# Ví dụ: gọi pdf_queue.put(file_path) sau khi download xong
-# Trong main, gọi start_pdf_converter_workers() để khởi động các worker
+# Ví dụ: gọi pdf_queue.put((file_path, metadata)) sau khi download xong
+# Trong main, gọi start_pdf_converter_workers() để khởi động process pool
@@ -1,93 +1,227 @@
 import os
 import sys
 import fitz  # đúng tên module là fitz, không phải PyMuPDF
-from typing import Tuple
+from typing import Optional, Tuple
 import shutil
+import collections
 import concurrent.futures
-import pandas as pd
-from config import DATASET_CLEANING_DIR
+from config import (DATASET_CLEANING_DIR, OCR_DPI, OCR_LANG, OCR_WORKERS,
+                    MIN_TEXT_CHARS_PER_PAGE, OUTPUT_FORMAT)
+from metrics import Metrics, get_logger
+
+log = get_logger("convert")
+# Số liệu convert/OCR của process này; process_file gửi kèm kết quả để process cha cộng vào metrics chung
+file_metrics = Metrics()
+# Loại file đã convert đầy đủ; "partial" (OCR lỗi, chỉ có trang text layer) và "error" thì chưa
+COMPLETE_TYPES = ("text-based", "mixed", "scanned")
 if not os.path.exists(DATASET_CLEANING_DIR):
     os.makedirs(DATASET_CLEANING_DIR)
 
 
-def is_scanned(file_path: str):
+def has_text_layer(page_text: str) -> bool:
+    """
+    Check whether a page's extracted text is usable.
+
+    Args:
+        page_text (str): Text returned by PyMuPDF for one page.
+    Returns:
+        bool: False for image-only pages (no text, or only a page number /
+              watermark shorter than MIN_TEXT_CHARS_PER_PAGE).
+    """
+    return len(page_text.strip()) >= MIN_TEXT_CHARS_PER_PAGE
+
+
+def ocr_page(file_path: str, page_number: int, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> str:
+    """
+    Rasterize a single page and OCR it.
+
+    Only this page is rendered (pdf2image first_page/last_page), so memory is
+    bounded by one image per worker instead of the whole document.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        page_number (int): 0-based page index.
+        dpi (int): Rasterization resolution.
+        lang (str): Tesseract language.
+    Returns:
+        str: Recognized text of the page.
+    """
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    with file_metrics.timer("ocr"):
+        images = convert_from_path(file_path, dpi=dpi, first_page=page_number + 1, last_page=page_number + 1)
+        try:
+            return "".join(pytesseract.image_to_string(image, lang=lang) for image in images)
+        finally:
+            for image in images:
+                image.close()
+
+
+def extract_hybrid_text(file_path: str, num_workers: int = OCR_WORKERS) -> Tuple[str, Optional[str], int]:
     """
-    Check if a PDF file is scanned or text-based.
+    Extract text page by page, OCR'ing only the pages without a text layer.
+
+    The PDF is read once: pages with a usable text layer keep their PyMuPDF
+    text, image-only pages (e.g. scanned signature or appendix pages) go to
+    the OCR pool, and every page is written to the output as soon as it and
+    the pages before it are done. At most `2 * num_workers` OCR pages are in
+    flight, so only the text pages waiting behind them are held in memory.
+    If OCR fails on a mixed document the text-layer pages are still saved,
+    to a `_partial.txt` file with type "partial", so the document can be
+    converted again later.
 
     Args:
         file_path (str): Path to the PDF file.
+        num_workers (int): Number of pages OCR'd concurrently.
     Returns:
-        Tuple[str, str]: A tuple containing the file type ("scanned" or "text-based")
-                         and the extracted text (empty string if scanned).  
+        Tuple[str, Optional[str], int]: File type ("text-based", "mixed",
+                              "scanned", "partial" or "error"), the text file
+                              path (None on error) and the page count.
     """
+    base_name = os.path.basename(file_path).rsplit('.', 1)[0]
+    partial_path = os.path.join(DATASET_CLEANING_DIR, f"{base_name}.txt.part")
+    max_in_flight = max(1, num_workers) * 2
+    # Trang theo thứ tự: text (str) hoặc Future OCR đang chạy
+    pending = collections.deque()
+    page_count = ocr_pages = in_flight = 0
+    ocr_error = None
     try:
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        if text.strip():
-            return "text-based"
-        else:
-            return "scanned"
+        with fitz.open(file_path) as doc, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor, \
+                open(partial_path, "w", encoding="utf-8") as text_file:
+
+            def write_ready(wait):
+                # Ghi các trang đầu hàng đã xong; wait=True thì chờ trang OCR đầu hàng
+                nonlocal in_flight, ocr_error
+                while pending:
+                    item = pending[0]
+                    if isinstance(item, concurrent.futures.Future):
+                        if not (wait or item.done()):
+                            return
+                        pending.popleft()
+                        in_flight -= 1
+                        try:
+                            item = item.result() + "\n"
+                        except Exception as e:
+                            if ocr_error is None:
+                                ocr_error = e
+                                log.warning(f"OCR failed for {file_path}: {e}")
+                            continue
+                        wait = False
+                    else:
+                        pending.popleft()
+                    text_file.write(item)
+
+            for page in doc:
+                page_count += 1
+                page_text = page.get_text()
+                if has_text_layer(page_text):
+                    pending.append(page_text)
+                else:
+                    ocr_pages += 1
+                    if ocr_error is not None:
+                        continue
+                    while in_flight >= max_in_flight:
+                        write_ready(wait=True)
+                    pending.append(executor.submit(ocr_page, file_path, page.number))
+                    in_flight += 1
+                write_ready(wait=False)
+            while pending:
+                write_ready(wait=True)
+        if ocr_pages:
+            log.debug(f"OCR'd {ocr_pages}/{page_count} page(s): {file_path}")
     except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return "error"
+        log.error(f"Error processing {file_path}: {e}")
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return "error", None, 0
+
+    text_pages = page_count - ocr_pages
+    if ocr_error is not None and not text_pages:
+        os.remove(partial_path)
+        return "error", None, page_count
+    if ocr_error is not None:
+        # Thiếu các trang ảnh: không coi là đã convert xong
+        file_type = "partial"
+    elif not ocr_pages:
+        file_type = "text-based"
+    elif text_pages:
+        file_type = "mixed"
+    else:
+        file_type = "scanned"
+    suffix = {"scanned": "_ocr", "partial": "_partial"}.get(file_type, "")
+    text_file_path = os.path.join(DATASET_CLEANING_DIR, f"{base_name}{suffix}.txt")
+    os.replace(partial_path, text_file_path)
+    if file_type != "partial":
+        # Bản thiếu trang của lần convert trước (nếu có) đã được thay bằng bản đầy đủ
+        stale_path = os.path.join(DATASET_CLEANING_DIR, f"{base_name}_partial.txt")
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    return file_type, text_file_path, page_count
 
 
-def ocr_process(file_path: str) -> str:
+def write_to_shard(text_file_path: str, file_type: str, page_count: int, metadata: dict) -> str:
     """
-    Perform OCR on a scanned PDF file and save the extracted text.
+    Move an extracted text file into the compressed shard corpus.
 
     Args:
-        file_path (str): Path to the scanned PDF file.
+        text_file_path (str): Text produced by extract_hybrid_text (deleted afterwards).
+        file_type (str): "text-based", "mixed", "scanned" or "partial".
+        page_count (int): Number of pages of the PDF.
+        metadata (dict): id, drop_levels, page, pdf_index, source_url, pdf_url.
     Returns:
-        str: Path to the text file containing extracted text.
+        str: Shard file name holding the record.
     """
-    try: 
-        import pytesseract
-        from PIL import Image
-        from pdf2image import convert_from_path
-        
-        images = convert_from_path(file_path)
-        
-        text = ""
-        for i, image in enumerate(images):
-            text = text + pytesseract.image_to_string(image, lang='vie') + "\n"
-        base_name = os.path.basename(file_path).rsplit('.', 1)[0]
-        text_file_path = os.path.join(DATASET_CLEANING_DIR, f"{base_name}_ocr.txt")
-        with open(text_file_path, "w", encoding="utf-8") as text_file:
-            text_file.write(text)
-        return text_file_path
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return "error"
-    
+    from shard_sink import get_shard_writer
+
+    with open(text_file_path, "r", encoding="utf-8") as text_file:
+        text = text_file.read()
+    record = dict(metadata, type=file_type, scanned=file_type != "text-based",
+                  page_count=page_count, text=text)
+    shard_name, _, _ = get_shard_writer().append(record)
+    os.remove(text_file_path)
+    return shard_name
+
+
+def process_file(file_path, metadata=None):
+    """
+    Convert one downloaded PDF to text and delete the original (kept when
+    the result is "partial", so it can be converted again).
+
+    With OUTPUT_FORMAT = "shards" the text and its metadata are appended to
+    the compressed shard corpus instead of being left as a .txt file.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        metadata (dict): Optional crawl metadata (id, drop_levels, page,
+                         pdf_index, source_url, pdf_url) stored with the text.
+    Returns:
+        dict: {"file", "type", "output", "metrics"} where output is the text
+              file path or shard name (None when the file could not be
+              processed) and metrics the convert/OCR timings of this file
+              (see Metrics.drain).
+    """
+    with file_metrics.timer("convert"):
+        file_type, output, page_count = extract_hybrid_text(file_path)
+        if file_type == "error":
+            file_metrics.error("convert")
+            log.warning(f"Skipping file due to error: {file_path}")
+        elif OUTPUT_FORMAT == "shards":
+            metadata = metadata or {"id": os.path.basename(file_path).rsplit('.', 1)[0]}
+            output = write_to_shard(output, file_type, page_count, metadata)
+            log.debug(f"File is {file_type}, appended to shard {output}: {file_path}")
+        else:
+            log.debug(f"File is {file_type}, saved as .txt: {file_path}")
+    file_metrics.incr("converted", type=file_type)
 
-def process_file(file_path):
-    file_type = is_scanned(file_path=file_path)
-    if file_type == "scanned":
-        print(f"Performing OCR on scanned file: {file_path}")
-        ocr_process(file_path=file_path)
-    elif file_type == "text-based":
-        print(f"File is text-based, saving as .txt: {file_path}")
-        import fitz
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        base_name = os.path.basename(file_path).rsplit('.', 1)[0]
-        text_file_path = os.path.join(DATASET_CLEANING_DIR, f"{base_name}.txt")
-        with open(text_file_path, "w", encoding="utf-8") as text_file:
-            text_file.write(text)
-    else:   
-        print(f"Skipping file due to error: {file_path}")
-
-    # xoa file goc
-    os.remove(file_path)
+    # xoa file goc; bản "partial" giữ lại PDF để convert lại (OCR) ở lần chạy sau
+    if file_type != "partial":
+        os.remove(file_path)
+    return {"file": file_path, "type": file_type, "output": output, "metrics": file_metrics.drain()}
 
 def main():
+    import pandas as pd  # chỉ cần cho chế độ batch từ CSV, không import trong process convert
     dataset_dir = "./dataset"
     dataframe = pd.read_csv('ban_an.csv')
     file_list = [f for f in os.listdir(dataset_dir) if f.lower().endswith('.pdf')] 
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import sqlite3
+import pathlib
+import threading
+from config import PROGRESS_DB_PATH, CHECKPOINT_DIR
+
+# Cột của bảng batches theo đúng thứ tự, trùng tên với key trong checkpoint dict
+BATCH_COLUMNS = (
+    "drop_levels", "batch_number", "drop_levels_name", "batch_size", "max_pages",
+    "start_page", "end_page", "last_processed_page", "total_links_found",
+    "total_pdfs_downloaded", "created_at", "last_updated", "is_completed",
+)
+
+PAGE_COMPLETED = "completed"
+PAGE_FAILED = "failed"
+
+# Trạng thái từng PDF (bảng pdfs, key = phạm vi + page + vị trí trên page)
+PDF_PENDING = "pending"
+PDF_DOWNLOADED = "downloaded"
+PDF_CONVERTED = "converted"
+PDF_FAILED = "failed"
+# Không cần tải: đã có trong dedup index, không khớp bộ lọc, trùng nội dung hoặc không có link PDF
+PDF_SKIPPED = "skipped"
+PDF_DONE = (PDF_DOWNLOADED, PDF_CONVERTED, PDF_SKIPPED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    drop_levels TEXT NOT NULL,
+    batch_number INTEGER NOT NULL,
+    drop_levels_name TEXT,
+    batch_size INTEGER,
+    max_pages INTEGER,
+    start_page INTEGER,
+    end_page INTEGER,
+    last_processed_page INTEGER DEFAULT 0,
+    total_links_found INTEGER DEFAULT 0,
+    total_pdfs_downloaded INTEGER DEFAULT 0,
+    created_at REAL,
+    last_updated REAL,
+    is_completed INTEGER DEFAULT 0,
+    PRIMARY KEY (drop_levels, batch_number)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    drop_levels TEXT NOT NULL,
+    batch_number INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    status TEXT,
+    retry_count INTEGER DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (drop_levels, batch_number, page)
+);
+CREATE INDEX IF NOT EXISTS idx_pages_status ON pages(drop_levels, status);
+CREATE TABLE IF NOT EXISTS pdfs (
+    drop_levels TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    pdf_index INTEGER NOT NULL,
+    detail_url TEXT,
+    status TEXT NOT NULL,
+    filename TEXT,
+    updated_at REAL,
+    PRIMARY KEY (drop_levels, page, pdf_index)
+);
+CREATE INDEX IF NOT EXISTS idx_pdfs_status ON pdfs(drop_levels, status);
+"""
+
+
+class ProgressStore:
+    """Crash-safe crawl progress in SQLite (WAL), replacing the per-batch JSON files.
+
+    Batch counters, per-page state and per-PDF state live in indexed tables;
+    each save is a single transaction, so a kill mid-write leaves the previous
+    state intact. Every thread gets its own connection and WAL lets them write
+    concurrently (writers wait on the busy timeout instead of failing).
+    """
+
+    def __init__(self, db_path=PROGRESS_DB_PATH, read_only=False):
+        db_dir = os.path.dirname(db_path)
+        if not read_only and db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.read_only = read_only
+        self._local = threading.local()
+        # Trạng thái page đã ghi lần trước của mỗi batch, để chỉ ghi page thay đổi
+        self._saved_pages = {}
+        self._saved_lock = threading.Lock()
+        if not read_only:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                # mode=ro: không tạo file, không đổi journal mode; mọi lệnh ghi đều lỗi
+                uri = pathlib.Path(self.db_path).absolute().as_uri() + "?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, timeout=30, isolation_level=None)
+            else:
+                conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def load_batch(self, drop_levels, batch_number):
+        conn = self._connection()
+        row = conn.execute(
+            f"SELECT {', '.join(BATCH_COLUMNS)} FROM batches WHERE drop_levels = ? AND batch_number = ?",
+            (drop_levels, batch_number)).fetchone()
+        if row is None:
+            return None
+        checkpoint_data = dict(zip(BATCH_COLUMNS, row))
+        checkpoint_data["is_completed"] = bool(checkpoint_data["is_completed"])
+        checkpoint_data["completed_pages"] = set()
+        checkpoint_data["failed_pages"] = set()
+        checkpoint_data["page_retry_counts"] = {}
+        saved = {}
+        for page, status, retry_count in conn.execute(
+                "SELECT page, status, retry_count FROM pages WHERE drop_levels = ? AND batch_number = ?",
+                (drop_levels, batch_number)):
+            if status == PAGE_COMPLETED:
+                checkpoint_data["completed_pages"].add(page)
+            elif status == PAGE_FAILED:
+                checkpoint_data["failed_pages"].add(page)
+            if retry_count:
+                checkpoint_data["page_retry_counts"][str(page)] = retry_count
+            saved[page] = (status, retry_count)
+        with self._saved_lock:
+            self._saved_pages[(drop_levels, batch_number)] = saved
+        return checkpoint_data
+
+    def save_batch(self, checkpoint_data):
+        key = (checkpoint_data["drop_levels"], checkpoint_data["batch_number"])
+        pages = _page_states(checkpoint_data)
+        with self._saved_lock:
+            saved = self._saved_pages.get(key, {})
+        changed = [(page, state) for page, state in pages.items() if saved.get(page) != state]
+        now = time.time()
+        values = [checkpoint_data.get(column) for column in BATCH_COLUMNS]
+        values[BATCH_COLUMNS.index("is_completed")] = int(bool(checkpoint_data.get("is_completed")))
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO batches ({', '.join(BATCH_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(BATCH_COLUMNS))})", values)
+            conn.executemany(
+                "INSERT OR REPLACE INTO pages (drop_levels, batch_number, page, status, retry_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(key[0], key[1], page, status, retry_count, now) for page, (status, retry_count) in changed])
+        with self._saved_lock:
+            self._saved_pages[key] = pages
+
+    def get_batch_size(self, drop_levels):
+        """Batch size the checkpoints of a scope were created with (None if it has none)."""
+        row = self._connection().execute(
+            "SELECT batch_size FROM batches WHERE drop_levels = ? ORDER BY batch_number LIMIT 1",
+            (drop_levels,)).fetchone()
+        return row[0] if row else None
+
+    def list_batches(self):
+        return self._connection().execute(
+            "SELECT drop_levels, batch_number FROM batches ORDER BY drop_levels, batch_number").fetchall()
+
+    def set_pdf_state(self, drop_levels, page, pdf_index, status, detail_url=None, filename=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO pdfs (drop_levels, page, pdf_index, detail_url, status, filename, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(drop_levels, page, pdf_index) DO UPDATE SET "
+                "status = excluded.status, "
+                "detail_url = COALESCE(excluded.detail_url, pdfs.detail_url), "
+                "filename = COALESCE(excluded.filename, pdfs.filename), "
+                "updated_at = excluded.updated_at",
+                (drop_levels, page, pdf_index, detail_url, status, filename, time.time()))
+
+    def add_pdfs(self, drop_levels, page, links):
+        """Register the detail links of a crawled page as pending PDFs.
+
+        A position that already holds the same link keeps its state; a new or
+        shifted link (the listing changed between runs) starts over as pending.
+
+        Returns:
+            list: (pdf_index, link) of the PDFs still to download, 1-based like download_pdf.
+        """
+        with self._transaction() as conn:
+            saved = {pdf_index: (detail_url, status) for pdf_index, detail_url, status in conn.execute(
+                "SELECT pdf_index, detail_url, status FROM pdfs WHERE drop_levels = ? AND page = ?",
+                (drop_levels, page))}
+            new = [(pdf_index, link) for pdf_index, link in enumerate(links, 1)
+                   if saved.get(pdf_index, (None,))[0] != link]
+            now = time.time()
+            # Chỉ vị trí đổi link mới bị đặt lại; điều kiện WHERE giữ nguyên hàng đã tải/convert của đúng link đó
+            conn.executemany(
+                "INSERT INTO pdfs (drop_levels, page, pdf_index, detail_url, status, filename, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, NULL, ?) "
+                "ON CONFLICT(drop_levels, page, pdf_index) DO UPDATE SET "
+                "detail_url = excluded.detail_url, status = excluded.status, filename = NULL, "
+                "updated_at = excluded.updated_at "
+                "WHERE pdfs.detail_url IS NOT excluded.detail_url",
+                [(drop_levels, page, pdf_index, link, PDF_PENDING, now) for pdf_index, link in new])
+        return [(pdf_index, link) for pdf_index, link in enumerate(links, 1)
+                if saved.get(pdf_index, (None,))[0] != link or saved[pdf_index][1] not in PDF_DONE]
+
+    def list_unfinished_pdfs(self, drop_levels=None, start_page=None, end_page=None):
+        """(drop_levels, page, pdf_index, detail_url) of pending/failed PDFs on completed pages.
+
+        Pages that are not completed are left out: crawling them again registers their links anyway.
+        """
+        sql = ("SELECT DISTINCT p.drop_levels, p.page, p.pdf_index, p.detail_url FROM pdfs p "
+               "JOIN pages g ON g.drop_levels = p.drop_levels AND g.page = p.page "
+               "WHERE p.status IN (?, ?) AND g.status = ?")
+        params = [PDF_PENDING, PDF_FAILED, PAGE_COMPLETED]
+        for condition, value in (("p.drop_levels = ?", drop_levels), ("p.page >= ?", start_page),
+                                 ("p.page <= ?", end_page)):
+            if value is not None:
+                sql += f" AND {condition}"
+                params.append(value)
+        return self._connection().execute(
+            sql + " ORDER BY p.drop_levels, p.page, p.pdf_index", params).fetchall()
+
+    def list_downloaded_pdfs(self):
+        """(drop_levels, page, pdf_index, detail_url, filename) of PDFs downloaded but not converted yet."""
+        return self._connection().execute(
+            "SELECT drop_levels, page, pdf_index, detail_url, filename FROM pdfs WHERE status = ? "
+            "ORDER BY drop_levels, page, pdf_index", (PDF_DOWNLOADED,)).fetchall()
+
+    def add_downloaded(self, drop_levels, page, count=1):
+        """Add to total_pdfs_downloaded of the batch holding `page`, for downloads finished outside its worker."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE batches SET total_pdfs_downloaded = total_pdfs_downloaded + ?, last_updated = ? "
+                "WHERE drop_levels = ? AND start_page <= ? AND end_page >= ?",
+                (count, time.time(), drop_levels, page, page))
+
+    def get_pdf_states(self, drop_levels, page):
+        rows = self._connection().execute(
+            "SELECT pdf_index, status FROM pdfs WHERE drop_levels = ? AND page = ?", (drop_levels, page))
+        return {pdf_index: status for pdf_index, status in rows}
+
+    def import_json_checkpoints(self, checkpoint_dir=CHECKPOINT_DIR):
+        """Import legacy checkpoint_{level}_{batch}.json files; each is renamed to *.json.imported."""
+        if not os.path.exists(checkpoint_dir):
+            return 0
+        imported = 0
+        for filename in sorted(os.listdir(checkpoint_dir)):
+            if not (filename.startswith("checkpoint_") and filename.endswith(".json")):
+                continue
+            filepath = os.path.join(checkpoint_dir, filename)
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    checkpoint_data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Bỏ qua checkpoint hỏng {filename}: {e}")
+                continue
+            checkpoint_data["completed_pages"] = set(checkpoint_data.get("completed_pages", []))
+            checkpoint_data["failed_pages"] = set(checkpoint_data.get("failed_pages", []))
+            self.save_batch(checkpoint_data)
+            os.replace(filepath, filepath + ".imported")
+            imported += 1
+            print(f"📥 Đã import checkpoint JSON: {filename}")
+        return imported
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE: giữ khóa ghi ngay từ đầu, tránh deadlock khi nhiều luồng cùng nâng cấp khóa
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _page_states(checkpoint_data):
+    retry_counts = checkpoint_data.get("page_retry_counts", {})
+    pages = {}
+    for page in checkpoint_data.get("failed_pages", ()):
+        pages[page] = (PAGE_FAILED, retry_counts.get(str(page), 0))
+    for page in checkpoint_data.get("completed_pages", ()):
+        pages[page] = (PAGE_COMPLETED, retry_counts.get(str(page), 0))
+    for key, retry_count in retry_counts.items():
+        if int(key) not in pages:
+            pages[int(key)] = (None, retry_count)
+    return pages
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_progress_store():
+    # Mở lazily (sau khi main.py có thể đã xóa thư mục checkpoint) và import JSON cũ một lần
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProgressStore()
+            _store.import_json_checkpoints()
+        return _store
+
+
+def open_read_only_progress_store():
+    """Make get_progress_store() read the saved progress without creating or changing anything (dry runs).
+
+    Without a progress database yet, an empty in-memory store stands in for it;
+    legacy JSON checkpoints are not imported.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if os.path.exists(PROGRESS_DB_PATH):
+                _store = ProgressStore(read_only=True)
+            else:
+                _store = ProgressStore(":memory:")
+        return _store
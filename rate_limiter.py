@@ -0,0 +1,117 @@
+import time
+import threading
+from metrics import metrics, get_logger
+from config import (RATE_INITIAL_PER_SECOND, RATE_MIN_PER_SECOND, RATE_MAX_PER_SECOND,
+                    CONCURRENCY_INITIAL, CONCURRENCY_MIN, CONCURRENCY_MAX,
+                    LATENCY_TARGET_SECONDS, AIMD_BACKOFF_FACTOR, AIMD_COOLDOWN_SECONDS)
+
+log = get_logger("rate")
+
+# Thời gian chờ trước khi thử lại khi đã hết slot đồng thời
+_SLOT_POLL_SECONDS = 0.05
+
+
+def is_overload_status(status_code):
+    # 429 và 5xx là dấu hiệu server quá tải; 4xx khác là lỗi của request, không giảm tốc
+    return status_code == 429 or status_code >= 500
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency controller with a global token bucket, shared by every worker.
+
+    Each request takes a token (request rate) and an in-flight slot
+    (concurrency). While responses are healthy and faster than
+    `latency_target`, both limits grow additively (about +1 per window of
+    `limit` requests); on a 5xx/429/timeout they are multiplied by
+    `backoff_factor`, at most once per `cooldown` so one burst of errors does
+    not collapse the limits to the minimum.
+    """
+
+    def __init__(self,
+                 rate=RATE_INITIAL_PER_SECOND, min_rate=RATE_MIN_PER_SECOND, max_rate=RATE_MAX_PER_SECOND,
+                 concurrency=CONCURRENCY_INITIAL, min_concurrency=CONCURRENCY_MIN, max_concurrency=CONCURRENCY_MAX,
+                 latency_target=LATENCY_TARGET_SECONDS, backoff_factor=AIMD_BACKOFF_FACTOR,
+                 cooldown=AIMD_COOLDOWN_SECONDS):
+        self._lock = threading.Lock()
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.backoff_factor = backoff_factor
+        self.cooldown = cooldown
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.successes = 0
+        self.errors = 0
+        self._last_refill = time.monotonic()
+        self._last_backoff = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self):
+        """Take a token and a slot if possible; otherwise return how long to wait (seconds)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.in_flight >= int(self.limit):
+                return _SLOT_POLL_SECONDS
+            if self.tokens < 1.0:
+                return (1.0 - self.tokens) / self.rate
+            self.tokens -= 1.0
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def release(self, latency, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+                now = time.monotonic()
+                if now - self._last_backoff >= self.cooldown:
+                    self._last_backoff = now
+                    self.limit = max(self.min_concurrency, self.limit * self.backoff_factor)
+                    self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+                    log.warning(f"🐢 Server quá tải, giảm xuống {int(self.limit)} request song song, {self.rate:.1f} req/s")
+                return
+            self.successes += 1
+            if latency <= self.latency_target:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                self.rate = min(self.max_rate, self.rate + 1.0 / self.limit)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "rate_per_second": round(self.rate, 2),
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "errors": self.errors,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+            limiter = _limiter
+            metrics.register_gauge("requests_in_flight", lambda: limiter.in_flight)
+            metrics.register_gauge("rate_limit_concurrency", lambda: int(limiter.limit))
+            metrics.register_gauge("rate_limit_per_second", lambda: round(limiter.rate, 2))
+        return _limiter
@@ -0,0 +1,100 @@
+import json
+import hashlib
+import datetime
+from config import DROP_LEVELS_OPTIONS, SEARCH_FORM_FIELDS, SEARCH_DATE_FORMAT
+
+# Bộ lọc tìm kiếm hỗ trợ; giá trị rỗng/None coi như không lọc
+FILTER_KEYS = ("court", "date_from", "date_to", "case_type", "keyword")
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, SEARCH_DATE_FORMAT).date()
+
+
+def normalize_filters(filters):
+    """Drop empty values and validate dates; raises ValueError on unknown keys or bad dates."""
+    normalized = {}
+    for key, value in (filters or {}).items():
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Bộ lọc không hỗ trợ: {key}")
+        value = str(value).strip() if value is not None else ""
+        if not value:
+            continue
+        if key in ("date_from", "date_to"):
+            parse_date(value)
+        normalized[key] = value
+    if "date_from" in normalized and "date_to" in normalized:
+        if parse_date(normalized["date_from"]) > parse_date(normalized["date_to"]):
+            raise ValueError(f"date_from {normalized['date_from']} sau date_to {normalized['date_to']}")
+    return normalized
+
+
+def scope_key(drop_levels, filters=None):
+    """Key of one search query, used for checkpoints, the ViewState cache and file names.
+
+    Without filters it is just `drop_levels`, so existing checkpoints and
+    `{drop_levels}_{page}_{index}.pdf` names are unchanged; with filters a
+    short digest of the filters is appended (e.g. "T-3f9a1c2b").
+    """
+    filters = normalize_filters(filters)
+    if not filters:
+        return drop_levels
+    canonical = json.dumps(filters, sort_keys=True, ensure_ascii=False)
+    return f"{drop_levels}-{hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:8]}"
+
+
+def describe_scope(drop_levels, filters=None):
+    name = DROP_LEVELS_OPTIONS.get(drop_levels, f"Cấp {drop_levels}")
+    filters = normalize_filters(filters)
+    if not filters:
+        return name
+    return f"{name} ({', '.join(f'{key}={value}' for key, value in filters.items())})"
+
+
+def build_search_fields(drop_levels, search_keyword, filters=None):
+    """Search-form fields of the payload; the same values must be re-sent with every page postback."""
+    filters = normalize_filters(filters)
+    fields = {
+        "ctl00$Content_home_Public$ctl00$txtKeyword": filters.get("keyword", search_keyword),
+        "ctl00$Content_home_Public$ctl00$Drop_Levels": drop_levels,
+    }
+    for key, field_name in SEARCH_FORM_FIELDS.items():
+        # Tòa án và ngày bắt đầu luôn được gửi (rỗng = tất cả) như payload cũ; trường khác chỉ gửi khi có lọc
+        if key in filters or key in ("court", "date_from"):
+            fields[field_name] = filters.get(key, "")
+    return fields
+
+
+def month_ranges(date_from, date_to):
+    """Yield (first_day, last_day) strings for every calendar month overlapping [date_from, date_to]."""
+    start, end = parse_date(date_from), parse_date(date_to)
+    current = start
+    while current <= end:
+        next_month = (current.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        last_day = min(end, next_month - datetime.timedelta(days=1))
+        yield current.strftime(SEARCH_DATE_FORMAT), last_day.strftime(SEARCH_DATE_FORMAT)
+        current = next_month
+
+
+def iter_filter_shards(base_filters=None, courts=None, split_by_month=False):
+    """Split one search into small independent queries: one per court and/or per month.
+
+    Args:
+        base_filters: filters shared by every shard (case_type, keyword, date range...).
+        courts: court IDs to split on (None = keep base_filters' court).
+        split_by_month: split the base date range into calendar months
+            (requires date_from and date_to).
+    Yields:
+        dict: filters of one shard.
+    """
+    base_filters = normalize_filters(base_filters)
+    court_values = list(courts) if courts else [base_filters.get("court")]
+    if split_by_month:
+        if not ("date_from" in base_filters and "date_to" in base_filters):
+            raise ValueError("Chia theo tháng cần cả date_from và date_to")
+        date_ranges = list(month_ranges(base_filters["date_from"], base_filters["date_to"]))
+    else:
+        date_ranges = [(base_filters.get("date_from"), base_filters.get("date_to"))]
+    for court in court_values:
+        for date_from, date_to in date_ranges:
+            yield normalize_filters(dict(base_filters, court=court, date_from=date_from, date_to=date_to))
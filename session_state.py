@@ -0,0 +1,97 @@
+import threading
+import requests
+from config import BASE_DOMAIN, SEARCH_KEYWORD
+from crawl_utils import initialize_session, crawl_page
+from transport import get_transport
+from search_filters import scope_key
+from metrics import get_logger
+
+log = get_logger("session")
+
+
+def is_state_rejected(success, hidden_fields):
+    # ASP.NET trả 500 (ViewState MAC lỗi) hoặc trang lỗi không có form khi state hết hạn
+    return not success or "__VIEWSTATE" not in hidden_fields
+
+
+class SessionStateCache:
+    """Valid search-result ASP.NET state per search scope (drop_levels + filters), shared by every worker.
+
+    A state is the hidden fields of a search-result page plus the cookies of the
+    session that produced it. With it any worker can jump straight to page N
+    with a single DropPages postback instead of opening a session per batch and
+    replaying the chain. The state is only refreshed when the server rejects it.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+        self._level_locks = {}
+
+    def _level_lock(self, drop_levels):
+        with self._lock:
+            return self._level_locks.setdefault(drop_levels, threading.Lock())
+
+    def get(self, drop_levels, filters=None):
+        state = self._states.get(scope_key(drop_levels, filters))
+        if state is None:
+            state = self.refresh(drop_levels, filters=filters)
+        return state
+
+    def refresh(self, drop_levels, stale=None, filters=None):
+        """Fetch a new search-result state; concurrent callers share one refresh."""
+        scope = scope_key(drop_levels, filters)
+        with self._level_lock(scope):
+            current = self._states.get(scope)
+            if current is not None and current is not stale:
+                return current
+            log.info(f"🔑 Làm mới ViewState cho {scope}")
+            session, hidden_fields = initialize_session()
+            links, result_fields, success = crawl_page(
+                session, 1, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters)
+            if is_state_rejected(success, result_fields):
+                raise requests.exceptions.RequestException(
+                    f"Không lấy được ViewState kết quả tìm kiếm cho {scope}")
+            state = (result_fields, requests.utils.dict_from_cookiejar(session.cookies))
+            self._states[scope] = state
+            return state
+
+    def new_session(self, drop_levels, filters=None):
+        """A pooled session carrying the cookies of the cached state (no round trip)."""
+        hidden_fields, cookies = self.get(drop_levels, filters)
+        session = get_transport().new_session()
+        session.cookies.update(cookies)
+        return session, hidden_fields
+
+    def crawl_page(self, session, page, hidden_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters=None):
+        """Drop-in replacement for crawl_utils.crawl_page that ignores the postback chain.
+
+        The page is requested from the cached state; on rejection the state is
+        refreshed once and the request repeated.
+        """
+        try:
+            state = self.get(drop_levels, filters)
+        except requests.exceptions.RequestException as e:
+            log.warning(f"❌ {e}")
+            return [], hidden_fields, False
+        for attempt in range(2):
+            cached_fields, cookies = state
+            session.cookies.update(cookies)
+            links, new_fields, success = crawl_page(
+                session, page, cached_fields, drop_levels, BASE_DOMAIN, SEARCH_KEYWORD, filters)
+            if not is_state_rejected(success, new_fields):
+                return links, cached_fields, True
+            if attempt == 0:
+                try:
+                    state = self.refresh(drop_levels, stale=state, filters=filters)
+                except requests.exceptions.RequestException as e:
+                    log.warning(f"❌ {e}")
+                    break
+        return [], state[0], False
+
+
+_cache = SessionStateCache()
+
+
+def get_state_cache():
+    return _cache
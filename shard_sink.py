@@ -0,0 +1,184 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import threading
+from config import SHARD_DIR, SHARD_INDEX_PATH, SHARD_MAX_BYTES, SHARD_COMPRESSION
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard không bắt buộc: fallback về gzip của thư viện chuẩn
+    zstandard = None
+
+# Cột metadata lưu trong index (ngoài vị trí record trong shard)
+INDEX_COLUMNS = ("drop_levels", "page", "pdf_index", "source_url", "pdf_url", "type", "page_count")
+
+
+def get_compression(compression=SHARD_COMPRESSION):
+    if compression == "zstd" and zstandard is None:
+        return "gzip"
+    return compression
+
+
+def compress_record(record, compression):
+    data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def decompress_record(data, compression):
+    if compression == "zstd":
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+class ShardWriter:
+    """Append-only sink that packs extracted judgments into rolling compressed JSONL shards.
+
+    Every record is compressed as its own gzip member / zstd frame, so a shard
+    is a valid .jsonl.gz / .jsonl.zst stream for sequential readers and any
+    record can be read back alone from its (offset, length). Each converter
+    process writes its own shards (pid in the file name) and the positions go
+    to a shared SQLite index; a record is indexed only after it is flushed,
+    so a crash never leaves the index pointing at a partial record.
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, index_path=SHARD_INDEX_PATH,
+                 max_bytes=SHARD_MAX_BYTES, compression=SHARD_COMPRESSION):
+        if not os.path.exists(shard_dir):
+            os.makedirs(shard_dir, exist_ok=True)
+        self.shard_dir = shard_dir
+        self.max_bytes = max_bytes
+        self.compression = get_compression(compression)
+        self.extension = ".jsonl.zst" if self.compression == "zstd" else ".jsonl.gz"
+        self._lock = threading.Lock()
+        self._file = None
+        self._shard_name = None
+        self._sequence = 0
+        self.pid = os.getpid()
+        self._conn = open_index(index_path)
+
+    def _open_next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        while True:
+            self._sequence += 1
+            name = f"shard_{self.pid}_{self._sequence:05d}{self.extension}"
+            try:
+                # "xb": không ghi đè shard của lần chạy trước trùng pid
+                self._file = open(os.path.join(self.shard_dir, name), "xb")
+                self._shard_name = name
+                return
+            except FileExistsError:
+                continue
+
+    def append(self, record):
+        """Write one record; returns (shard_name, offset, length)."""
+        data = compress_record(record, self.compression)
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.max_bytes:
+                self._open_next_shard()
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            shard_name = self._shard_name
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO records (id, shard, offset, length, compression, "
+                f"{', '.join(INDEX_COLUMNS)}, created_at) "
+                f"VALUES ({', '.join('?' * (len(INDEX_COLUMNS) + 6))})",
+                (record["id"], shard_name, offset, len(data), self.compression,
+                 *(record.get(column) for column in INDEX_COLUMNS), time.time()))
+            self._conn.commit()
+        return shard_name, offset, len(data)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._conn.close()
+
+
+def open_index(index_path=SHARD_INDEX_PATH):
+    index_dir = os.path.dirname(index_path)
+    if index_dir and not os.path.exists(index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+    conn = sqlite3.connect(index_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS records (
+            id TEXT PRIMARY KEY,
+            shard TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            compression TEXT NOT NULL,
+            drop_levels TEXT,
+            page INTEGER,
+            pdf_index INTEGER,
+            source_url TEXT,
+            pdf_url TEXT,
+            type TEXT,
+            page_count INTEGER,
+            created_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_shard ON records(shard, offset)")
+    conn.commit()
+    return conn
+
+
+def read_record(record_id, shard_dir=SHARD_DIR, index_path=SHARD_INDEX_PATH):
+    """Random access: read one record by ID through the index (None if unknown)."""
+    conn = open_index(index_path)
+    try:
+        row = conn.execute(
+            "SELECT shard, offset, length, compression FROM records WHERE id = ?", (record_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    shard, offset, length, compression = row
+    with open(os.path.join(shard_dir, shard), "rb") as f:
+        f.seek(offset)
+        return decompress_record(f.read(length), compression)
+
+
+def iter_records(shard_dir=SHARD_DIR, index_path=SHARD_INDEX_PATH):
+    """Sequential read of every indexed record, shard by shard in file order."""
+    conn = open_index(index_path)
+    try:
+        rows = conn.execute(
+            "SELECT shard, offset, length, compression FROM records ORDER BY shard, offset").fetchall()
+    finally:
+        conn.close()
+    current_shard, f = None, None
+    try:
+        for shard, offset, length, compression in rows:
+            if shard != current_shard:
+                if f is not None:
+                    f.close()
+                f = open(os.path.join(shard_dir, shard), "rb")
+                current_shard = shard
+            f.seek(offset)
+            yield decompress_record(f.read(length), compression)
+    finally:
+        if f is not None:
+            f.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_shard_writer():
+    # Mỗi process convert có writer (và shard) riêng
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = ShardWriter()
+        return _writer
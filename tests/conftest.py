@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Các module nằm phẳng ở thư mục gốc của repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import progress_store  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Progress store on a temp SQLite file, also returned by get_progress_store()."""
+    temp_store = progress_store.ProgressStore(str(tmp_path / "progress.sqlite3"))
+    monkeypatch.setattr(progress_store, "_store", temp_store)
+    return temp_store
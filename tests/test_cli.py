@@ -0,0 +1,67 @@
+import json
+import sqlite3
+
+import pytest
+
+import config
+from checkpoint_utils import create_checkpoint_structure
+from cli import parse_options, resolve_levels
+from progress_store import ProgressStore
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    def write(values):
+        path = tmp_path / "crawl.json"
+        path.write_text(json.dumps(values), encoding="utf-8")
+        return str(path)
+    return write
+
+
+def test_config_file_values_are_coerced_like_flags(config_file):
+    path = config_file({"max_pages": "500", "threads": 8, "dry_run": "true", "split_by_month": 0,
+                        "levels": "t,h", "courts": "12, 13"})
+    options = parse_options(["--config", path], environ={})
+    assert (options["max_pages"], options["threads"]) == (500, 8)
+    assert options["dry_run"] is True and options["split_by_month"] is False
+    assert options["levels"] == ["T", "H"]
+    assert options["courts"] == ["12", "13"]
+    assert options["batches"] is None
+
+
+def test_command_line_beats_environment_beats_config_file(config_file):
+    path = config_file({"max_pages": 100, "threads": 2, "batches": 4})
+    options = parse_options(["--config", path, "--threads", "6"],
+                            environ={"CRAWLER_MAX_PAGES": "200", "CRAWLER_THREADS": "3"})
+    assert (options["max_pages"], options["threads"], options["batches"]) == (200, 6, 4)
+
+
+@pytest.mark.parametrize("values", [{"max_pages": "nhiều"}, {"threads": 0}, {"pages": 5}, {"NOT_A_SETTING": 1},
+                                    {"levels": "X"}])
+def test_invalid_config_file_values_exit(config_file, values):
+    with pytest.raises(SystemExit):
+        parse_options(["--config", config_file(values)], environ={})
+
+
+def test_resolve_levels():
+    assert resolve_levels(None) == [config.DEFAULT_DROP_LEVELS]
+    assert resolve_levels("all") == list(config.DROP_LEVELS_OPTIONS)
+    assert resolve_levels(["H", "h", "T"]) == ["H", "T"]
+    with pytest.raises(ValueError):
+        resolve_levels("T,X")
+
+
+def test_read_only_store_does_not_write(store, tmp_path):
+    checkpoint_data = create_checkpoint_structure("T", 1, 1, 3, 3, 3)
+    checkpoint_data["completed_pages"] = {1}
+    store.save_batch(checkpoint_data)
+    read_only = ProgressStore(store.db_path, read_only=True)
+    assert read_only.load_batch("T", 1)["completed_pages"] == {1}
+    with pytest.raises(sqlite3.OperationalError):
+        read_only.add_pdfs("T", 1, ["https://example.test/a/chi-tiet-ban-an"])
+
+    # --dry-run trên máy chưa chạy lần nào: không tạo thư mục / file DB
+    missing = tmp_path / "missing" / "progress.sqlite3"
+    with pytest.raises(sqlite3.OperationalError):
+        ProgressStore(str(missing), read_only=True).list_batches()
+    assert not missing.parent.exists()
@@ -0,0 +1,37 @@
+from dedup_index import DedupIndex, get_detail_id
+
+DETAIL_URL = "https://congbobanan.test/2ta10001001t1cvn/chi-tiet-ban-an"
+
+
+def test_get_detail_id():
+    assert get_detail_id(DETAIL_URL) == "2ta10001001t1cvn"
+    assert get_detail_id(DETAIL_URL + "/") == "2ta10001001t1cvn"
+    assert get_detail_id("khong-hop-le") == "khong-hop-le"
+
+
+def test_record_and_lookup(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup" / "dedup.sqlite3"))
+    assert not index.has_detail("2ta10001001t1cvn")
+    index.record("2ta10001001t1cvn", DETAIL_URL, "https://cdn.test/a.pdf", "hash-a", "a.pdf")
+
+    assert index.has_detail("2ta10001001t1cvn")
+    assert index.get_pdf_url("2ta10001001t1cvn") == "https://cdn.test/a.pdf"
+    assert index.get_pdf_url("khac") is None
+    assert index.find_by_hash("hash-a") == "a.pdf"
+    assert index.find_by_hash("hash-b") is None
+    index.close()
+
+
+def test_index_survives_reopen(tmp_path):
+    db_path = str(tmp_path / "dedup.sqlite3")
+    index = DedupIndex(db_path)
+    index.record("1", DETAIL_URL, "https://cdn.test/a.pdf", "hash-a", "a.pdf")
+    # Ghi lại cùng detail ID (tải lại) thay bản ghi cũ
+    index.record("1", DETAIL_URL, "https://cdn.test/a2.pdf", "hash-a2", "a2.pdf")
+    index.close()
+
+    reopened = DedupIndex(db_path)
+    assert reopened.get_pdf_url("1") == "https://cdn.test/a2.pdf"
+    assert reopened.find_by_hash("hash-a") is None
+    assert reopened.find_by_hash("hash-a2") == "a2.pdf"
+    reopened.close()
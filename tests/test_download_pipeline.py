@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+import crawl_url_pdf
+from config import BASE_DOMAIN
+from dedup_index import DedupIndex
+from download_pipeline import DownloadPipeline
+from metadata_index import MetadataIndex
+from progress_store import PDF_DOWNLOADED, PDF_FAILED, PDF_SKIPPED
+
+DETAIL_URL = BASE_DOMAIN + "/2ta10001001t1cvn/chi-tiet-ban-an"
+PDF_URL = BASE_DOMAIN + "/files/ban-an.pdf"
+DETAIL_PAGE = '<p>Bản án số: 12/2023/DS-PT</p><a href="/files/ban-an.pdf">Tải bản án</a>'
+PDF_BYTES = b"%PDF-1.4 " + b"x" * 5000
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {"Content-Type": "text/html; charset=utf-8"}
+        self.text = body.decode("utf-8")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RequestsConnectionError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        result = self.pages[url]
+        if isinstance(result, Exception):
+            raise result
+        return FakeResponse(result)
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch, store):
+    """Temp dataset dir and indexes for download_pdf; returns the list of files queued for conversion."""
+    dataset_dir = tmp_path / "dataset"
+    dataset_dir.mkdir()
+    dedup, metadata = DedupIndex(str(tmp_path / "dedup.sqlite3")), MetadataIndex(str(tmp_path / "meta.sqlite3"))
+    monkeypatch.setattr(crawl_url_pdf, "DATASET_DIR", str(dataset_dir))
+    monkeypatch.setattr(crawl_url_pdf, "get_dedup_index", lambda: dedup)
+    monkeypatch.setattr(crawl_url_pdf, "get_metadata_index", lambda: metadata)
+    queued = []
+    monkeypatch.setattr(crawl_url_pdf, "enqueue_for_conversion",
+                        lambda file_path, metadata=None: queued.append((file_path, metadata)))
+    store.add_pdfs("T", 1, [DETAIL_URL])
+    return queued
+
+
+def test_download_pdf_streams_file_and_queues_it(downloads, tmp_path, store):
+    session = FakeSession({DETAIL_URL: DETAIL_PAGE.encode("utf-8"), PDF_URL: PDF_BYTES})
+    assert crawl_url_pdf.download_pdf(DETAIL_URL, session, "T", 1, 1) == PDF_DOWNLOADED
+    file_path, metadata = downloads[0]
+    assert file_path.endswith("T_1_1.pdf")
+    assert open(file_path, "rb").read() == PDF_BYTES
+    assert metadata["case_number"] == "12/2023/DS-PT" and metadata["pdf_url"] == PDF_URL
+    assert store.get_pdf_states("T", 1) == {1: PDF_DOWNLOADED}
+    assert [row[4] for row in store.list_downloaded_pdfs()] == ["T_1_1.pdf"]
+
+    # Lần sau detail ID đã có trong dedup index: không gửi request nào
+    session.requested.clear()
+    assert crawl_url_pdf.download_pdf(DETAIL_URL, session, "T", 1, 1) == PDF_SKIPPED
+    assert session.requested == []
+
+
+def test_detail_page_without_pdf_is_skipped(downloads):
+    session = FakeSession({DETAIL_URL: "<p>Bản án chưa công bố</p>".encode("utf-8")})
+    assert crawl_url_pdf.download_pdf(DETAIL_URL, session, "T", 1, 1) == PDF_SKIPPED
+    assert downloads == []
+
+
+@pytest.mark.parametrize("error", [RequestsConnectionError("reset"), OSError(28, "No space left on device")])
+def test_download_errors_mark_the_pdf_failed(downloads, store, error):
+    session = FakeSession({DETAIL_URL: DETAIL_PAGE.encode("utf-8"), PDF_URL: error})
+    assert crawl_url_pdf.download_pdf(DETAIL_URL, session, "T", 1, 1) == PDF_FAILED
+    assert downloads == []
+    # PDF lỗi được tải lại ở lần chạy sau
+    assert store.get_pdf_states("T", 1) == {1: PDF_FAILED}
+
+
+def test_index_errors_mark_the_pdf_failed(downloads, store, monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(crawl_url_pdf, "record_detail_metadata", locked)
+    session = FakeSession({DETAIL_URL: DETAIL_PAGE.encode("utf-8")})
+    assert crawl_url_pdf.download_pdf(DETAIL_URL, session, "T", 1, 1) == PDF_FAILED
+    assert store.get_pdf_states("T", 1) == {1: PDF_FAILED}
+
+
+def test_pipeline_resolves_futures_and_keeps_errors():
+    def download_fn(link, session, drop_levels, page, index):
+        if link == "bad":
+            raise ValueError("boom")
+        return (link, session, drop_levels, page, index)
+
+    pipeline = DownloadPipeline(download_fn, num_workers=2, max_queue_size=1).start()
+    try:
+        futures = [pipeline.submit(f"link-{i}", "s", "T", 1, i) for i in range(5)]
+        bad = pipeline.submit("bad", "s", "T", 1, 9)
+        assert [future.result(timeout=5) for future in futures] == [(f"link-{i}", "s", "T", 1, i) for i in range(5)]
+        with pytest.raises(ValueError):
+            bad.result(timeout=5)
+    finally:
+        pipeline.stop()
+    assert pipeline.threads == []
+
+
+def test_pipeline_submit_blocks_when_queue_is_full():
+    release = threading.Event()
+    pipeline = DownloadPipeline(lambda *job: release.wait(5), num_workers=1, max_queue_size=1).start()
+    try:
+        pipeline.submit("a", None, "T", 1, 1)
+        pipeline.submit("b", None, "T", 1, 2)
+        blocked = threading.Thread(target=pipeline.submit, args=("c", None, "T", 1, 3))
+        blocked.start()
+        blocked.join(0.2)
+        # Hàng đợi đầy: producer phải chờ, không chạy vượt trước download
+        assert blocked.is_alive()
+        release.set()
+        blocked.join(5)
+        assert not blocked.is_alive()
+    finally:
+        release.set()
+        pipeline.stop()
@@ -0,0 +1,86 @@
+import pytest
+
+from lease_coordinator import LeaseCoordinator, LEASE_DONE, LEASE_FAILED, LEASE_LEASED, LEASE_PENDING
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "coordinator.sqlite3")
+
+
+def lease_rows(coordinator, scope="T"):
+    return coordinator._connection().execute(
+        "SELECT batch_number, start_page, end_page, status FROM leases WHERE scope = ? ORDER BY batch_number",
+        (scope,)).fetchall()
+
+
+def test_register_batches_is_idempotent_and_keeps_first_batch_size(db_path):
+    coordinator = LeaseCoordinator(db_path)
+    assert coordinator.register_batches("T", 10, 4) == ("T", 4)
+    # Node khác tính batch size khác: vẫn dùng batch size của lần đăng ký đầu tiên
+    assert coordinator.register_batches("T", 10, 3) == ("T", 4)
+    assert lease_rows(coordinator) == [(1, 1, 4, LEASE_PENDING), (2, 5, 8, LEASE_PENDING),
+                                       (3, 9, 10, LEASE_PENDING)]
+
+
+def test_register_batches_extends_the_tail(db_path):
+    coordinator = LeaseCoordinator(db_path)
+    coordinator.register_batches("T", 10, 4)
+    for _ in range(3):
+        lease = coordinator.acquire("a")
+        coordinator.complete(lease, "a", [])
+
+    coordinator.register_batches("T", 14, 4)
+    # Batch cuối bị cắt ngắn được nới và chạy lại; batch mới được thêm vào
+    assert lease_rows(coordinator) == [(1, 1, 4, LEASE_DONE), (2, 5, 8, LEASE_DONE),
+                                       (3, 9, 12, LEASE_PENDING), (4, 13, 14, LEASE_PENDING)]
+
+
+def test_acquire_hands_out_pending_batches_in_order(db_path):
+    coordinator = LeaseCoordinator(db_path)
+    coordinator.register_batches("T", 8, 4)
+    first, second = coordinator.acquire("a"), coordinator.acquire("b")
+    assert (first["batch_number"], second["batch_number"]) == (1, 2)
+    assert (first["start_page"], first["end_page"]) == (1, 4)
+    assert coordinator.acquire("c") is None
+    assert coordinator.summary() == {LEASE_LEASED: 2}
+
+
+def test_expired_lease_goes_to_next_node_with_reported_pages(db_path):
+    coordinator = LeaseCoordinator(db_path)
+    coordinator.register_batches("T", 4, 4)
+    lease = coordinator.acquire("a")
+    assert coordinator.renew(lease, "a", [1, 2]) is True
+    assert coordinator.acquire("b") is None
+
+    # Node a chết: lease không được gia hạn nữa và hết hạn
+    coordinator._connection().execute("UPDATE leases SET lease_expires_at = 0")
+    taken = coordinator.acquire("b")
+    assert taken["batch_number"] == 1
+    assert taken["previous_owner"] == "a"
+    assert taken["completed_pages"] == [1, 2]
+    assert coordinator.renew(lease, "a") is False
+    assert coordinator.complete(taken, "b", [1, 2, 3, 4]) is True
+    assert coordinator.summary() == {LEASE_DONE: 1}
+
+
+def test_released_batch_is_leased_again_until_attempts_run_out(db_path):
+    coordinator = LeaseCoordinator(db_path, max_attempts=2)
+    coordinator.register_batches("T", 4, 4)
+
+    assert coordinator.release(coordinator.acquire("a"), "a") is False
+    lease = coordinator.acquire("b")
+    assert lease["batch_number"] == 1
+    assert coordinator.release(lease, "b") is True
+    assert coordinator.acquire("c") is None
+    assert coordinator.summary() == {LEASE_FAILED: 1}
+
+
+def test_expired_lease_without_attempts_left_is_failed(db_path):
+    coordinator = LeaseCoordinator(db_path, max_attempts=1)
+    coordinator.register_batches("T", 4, 4)
+    coordinator.acquire("a")
+    coordinator._connection().execute("UPDATE leases SET lease_expires_at = 0")
+
+    assert coordinator.acquire("b") is None
+    assert coordinator.summary() == {LEASE_FAILED: 1}
@@ -0,0 +1,38 @@
+from metadata_index import MetadataIndex, matches_filter
+
+JUDGMENT = {"case_number": "12/2023/DS-PT", "title": "Tranh chấp hợp đồng vay", "court": "TAND tỉnh Bình Dương",
+            "judgment_date": "2023-03-05", "year": 2023, "case_type": "Dân sự",
+            "judgment_level": "Phúc thẩm", "legal_relation": "Hợp đồng vay"}
+
+
+def test_matches_filter_text_fields_are_case_insensitive_substrings():
+    assert matches_filter(JUDGMENT, {"court": "bình dương", "case_type": "DÂN SỰ"})
+    assert not matches_filter(JUDGMENT, {"court": "Hà Nội"})
+    assert matches_filter(JUDGMENT, {})
+
+
+def test_matches_filter_year_bounds():
+    assert matches_filter(JUDGMENT, {"year_from": 2023, "year_to": 2023})
+    assert not matches_filter(JUDGMENT, {"year_from": 2024})
+    assert not matches_filter(JUDGMENT, {"year_to": 2022})
+
+
+def test_missing_fields_never_exclude():
+    # Trang chi tiết không có trường đó: không loại bản án
+    assert matches_filter({"court": None, "year": None}, {"court": "Hà Nội", "year_from": 2024})
+
+
+def test_record_get_and_find(tmp_path):
+    index = MetadataIndex(str(tmp_path / "meta" / "metadata.sqlite3"))
+    index.record("1001", "https://x.test/1001", JUDGMENT)
+    index.record("1002", "https://x.test/1002", dict(JUDGMENT, court="TAND TP Hà Nội", year=2021))
+    # Ghi lại cùng detail ID thì thay bản cũ
+    index.record("1002", "https://x.test/1002", dict(JUDGMENT, court="TAND TP Hà Nội", year=2022))
+
+    assert index.get("1001") == JUDGMENT
+    assert index.get("404") is None
+    assert [row["detail_id"] for row in index.find(court="Hà Nội")] == ["1002"]
+    assert [row["detail_id"] for row in index.find(year=2022)] == ["1002"]
+    assert len(index.find(case_type="dân sự")) == 2
+    assert len(index.find(limit=1)) == 1
+    index.close()
@@ -0,0 +1,90 @@
+import pytest
+
+import page_parser
+from page_parser import parse_detail_page, parse_hidden_fields, parse_listing
+
+BASE = "https://congbobanan.test"
+
+DETAIL_PAGE = """
+<html><head><script>var label = "Bản án số: giả";</script><style>b { color: red }</style></head>
+<body>
+  <div class="info">
+    <p><b>Bản án số:</b> 12/2023/DS-PT</p>
+    <p>Tên bản án: Tranh chấp hợp đồng vay tài sản</p>
+    <p><span>Toà án xét xử</span>: <span>TAND tỉnh Bình Dương</span></p>
+    <p>Ngày ban hành: 05/03/2023</p>
+    <p><b>Loại vụ/việc</b>: Dân sự</p>
+    <p>Cấp xét xử:</p><p>Phúc thẩm</p>
+    <p>Quan hệ pháp luật: Hợp đồng vay</p>
+  </div>
+  <a href="/3ta1234t1cvn/chi-tiet-ban-an">Bản án khác</a>
+  <a href="/files/phu-luc.pdf">Phụ lục</a>
+  <a href="/files/ban-an-12.pdf">Tải bản án</a>
+</body></html>
+"""
+
+LISTING_PAGE = """
+<form>
+  <input type="hidden" name="__VIEWSTATE" value="vs==" />
+  <input type="HIDDEN" name="__EVENTVALIDATION" value="ev" />
+  <input type="hidden" name="__EVENTTARGET" value="" />
+  <input type="text" name="ctl00$Content_home_Public$ctl00$txtKeyword" value="vay" />
+  <a href="/2ta10001001t1cvn/chi-tiet-ban-an">Bản án 1</a>
+  <a href="/gioi-thieu">Giới thiệu</a>
+  <a>Không có href</a>
+  <a href="/2ta10001002t1cvn/chi-tiet-ban-an">Bản án 2</a>
+</form>
+"""
+
+
+@pytest.fixture(params=["lxml", "bs4"])
+def parser(request, monkeypatch):
+    """Run each test with lxml and with the BeautifulSoup fallback."""
+    if request.param == "bs4":
+        monkeypatch.setattr(page_parser, "lxml_html", None)
+    elif page_parser.lxml_html is None:
+        pytest.skip("lxml không được cài")
+    return request.param
+
+
+def test_listing_links_and_hidden_fields(parser):
+    links, hidden_fields = parse_listing(LISTING_PAGE, BASE)
+    assert links == [BASE + "/2ta10001001t1cvn/chi-tiet-ban-an", BASE + "/2ta10001002t1cvn/chi-tiet-ban-an"]
+    # Input rỗng hoặc không phải hidden không được gửi lại trong postback
+    assert hidden_fields == {"__VIEWSTATE": "vs==", "__EVENTVALIDATION": "ev"}
+    assert parse_hidden_fields(LISTING_PAGE) == hidden_fields
+
+
+def test_empty_listing(parser):
+    assert parse_listing("", BASE) == ([], {})
+    assert parse_listing("<div>Không có kết quả</div>", BASE) == ([], {})
+
+
+def test_detail_page_fields_and_pdf_link(parser):
+    metadata, pdf_url = parse_detail_page(DETAIL_PAGE, BASE)
+    assert metadata == {
+        "case_number": "12/2023/DS-PT",
+        "title": "Tranh chấp hợp đồng vay tài sản",
+        "court": "TAND tỉnh Bình Dương",
+        "judgment_date": "2023-03-05",
+        "year": 2023,
+        "case_type": "Dân sự",
+        "judgment_level": "Phúc thẩm",
+        "legal_relation": "Hợp đồng vay",
+    }
+    # Nhiều link .pdf: lấy link cuối như trước
+    assert pdf_url == BASE + "/files/ban-an-12.pdf"
+
+
+def test_detail_page_year_from_case_number(parser):
+    metadata, pdf_url = parse_detail_page("<p>Quyết định số: 7/2021/QĐ-ST</p>"
+                                          '<a href="https://cdn.test/qd.pdf">PDF</a>', BASE)
+    assert (metadata["case_number"], metadata["year"], metadata["judgment_date"]) == ("7/2021/QĐ-ST", 2021, None)
+    assert pdf_url == "https://cdn.test/qd.pdf"
+
+
+def test_detail_page_without_fields_or_pdf(parser):
+    metadata, pdf_url = parse_detail_page("<p>Không tìm thấy bản án</p>", BASE)
+    assert set(metadata.values()) == {None}
+    assert pdf_url is None
+    assert parse_detail_page("", BASE)[1] is None
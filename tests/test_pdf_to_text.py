@@ -0,0 +1,94 @@
+import random
+import time
+
+import fitz
+import pytest
+
+import pdf_to_text
+
+
+def make_pdf(path, pages):
+    """PDF whose pages are text (str) or blank image-only pages (None)."""
+    with fitz.open() as doc:
+        for text in pages:
+            page = doc.new_page()
+            if text is not None:
+                page.insert_text((72, 72), text)
+        doc.save(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "clean"
+    directory.mkdir()
+    monkeypatch.setattr(pdf_to_text, "DATASET_CLEANING_DIR", str(directory))
+    return directory
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """OCR stand-in: "OCR <page>" after a random delay, so pages finish out of order."""
+    failing = set()
+
+    def ocr_page(file_path, page_number, dpi=None, lang=None):
+        time.sleep(random.uniform(0, 0.02))
+        if page_number in failing:
+            raise RuntimeError("tesseract crashed")
+        return f"OCR {page_number}"
+
+    monkeypatch.setattr(pdf_to_text, "ocr_page", ocr_page)
+    return failing
+
+
+def text_page(number):
+    return f"Trang van ban so {number} " * 3
+
+
+def test_text_based_pdf(tmp_path, output_dir):
+    pdf = make_pdf(tmp_path / "a.pdf", [text_page(0), text_page(1)])
+    file_type, output, page_count = pdf_to_text.extract_hybrid_text(pdf)
+    assert (file_type, page_count) == ("text-based", 2)
+    lines = open(output, encoding="utf-8").read().split()
+    assert lines.count("so") == 6
+    assert not list(output_dir.glob("*.part"))
+
+
+def test_mixed_pdf_keeps_page_order(tmp_path, output_dir, fake_ocr):
+    layout = [None if number % 3 else text_page(number) for number in range(12)]
+    pdf = make_pdf(tmp_path / "b.pdf", layout)
+    file_type, output, page_count = pdf_to_text.extract_hybrid_text(pdf, num_workers=2)
+    assert (file_type, page_count) == ("mixed", 12)
+    text = open(output, encoding="utf-8").read()
+    markers = [f"so {number}" if layout[number] else f"OCR {number}" for number in range(12)]
+    positions = [text.index(marker) for marker in markers]
+    assert positions == sorted(positions)
+
+
+def test_scanned_pdf(tmp_path, output_dir, fake_ocr):
+    pdf = make_pdf(tmp_path / "c.pdf", [None, None, None])
+    file_type, output, _ = pdf_to_text.extract_hybrid_text(pdf)
+    assert file_type == "scanned"
+    assert output.endswith("c_ocr.txt")
+    assert open(output, encoding="utf-8").read().split("\n")[:3] == ["OCR 0", "OCR 1", "OCR 2"]
+
+
+def test_failed_ocr_on_mixed_pdf_is_partial(tmp_path, output_dir, fake_ocr):
+    fake_ocr.add(1)
+    pdf = make_pdf(tmp_path / "d.pdf", [text_page(0), None])
+    file_type, output, _ = pdf_to_text.extract_hybrid_text(pdf)
+    assert file_type == "partial"
+    assert output.endswith("d_partial.txt")
+
+    # Lần convert sau thành công thì bản thiếu trang bị xóa
+    fake_ocr.clear()
+    file_type, output, _ = pdf_to_text.extract_hybrid_text(pdf)
+    assert file_type == "mixed"
+    assert not (output_dir / "d_partial.txt").exists()
+
+
+def test_failed_ocr_on_scanned_pdf_is_error(tmp_path, output_dir, fake_ocr):
+    fake_ocr.add(0)
+    pdf = make_pdf(tmp_path / "e.pdf", [None])
+    assert pdf_to_text.extract_hybrid_text(pdf) == ("error", None, 1)
+    assert not list(output_dir.iterdir())
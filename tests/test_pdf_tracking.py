@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+import crawl_url_pdf
+from checkpoint_utils import create_checkpoint_structure
+from dedup_index import DedupIndex
+from metadata_index import MetadataIndex
+from progress_store import PDF_CONVERTED, PDF_DOWNLOADED, PDF_FAILED, PDF_PENDING, PDF_SKIPPED
+
+LINKS = [f"https://example.test/{detail_id}/chi-tiet-ban-an" for detail_id in ("a", "b", "c")]
+
+
+def save_completed_pages(store, scope, batch_number, start_page, end_page, completed):
+    checkpoint_data = create_checkpoint_structure(scope, batch_number, start_page, end_page, end_page,
+                                                  end_page - start_page + 1)
+    checkpoint_data["completed_pages"] = set(completed)
+    store.save_batch(checkpoint_data)
+
+
+def test_add_pdfs_returns_every_link_of_a_new_page(store):
+    assert store.add_pdfs("T", 1, LINKS) == [(1, LINKS[0]), (2, LINKS[1]), (3, LINKS[2])]
+    assert store.get_pdf_states("T", 1) == {1: PDF_PENDING, 2: PDF_PENDING, 3: PDF_PENDING}
+
+
+def test_add_pdfs_skips_positions_already_done(store):
+    store.add_pdfs("T", 1, LINKS)
+    store.set_pdf_state("T", 1, 1, PDF_DOWNLOADED, filename="a.pdf")
+    store.set_pdf_state("T", 1, 2, PDF_SKIPPED)
+    store.set_pdf_state("T", 1, 3, PDF_FAILED)
+
+    assert store.add_pdfs("T", 1, LINKS) == [(3, LINKS[2])]
+    # Vị trí giữ nguyên link thì giữ nguyên trạng thái
+    assert store.get_pdf_states("T", 1) == {1: PDF_DOWNLOADED, 2: PDF_SKIPPED, 3: PDF_FAILED}
+
+
+def test_add_pdfs_restarts_shifted_positions(store):
+    store.add_pdfs("T", 1, LINKS)
+    for pdf_index in (1, 2, 3):
+        store.set_pdf_state("T", 1, pdf_index, PDF_CONVERTED)
+
+    # Listing thay đổi giữa hai lần chạy: một bản án mới đẩy các link cũ xuống một vị trí
+    shifted = ["https://example.test/new"] + LINKS[:2]
+    assert store.add_pdfs("T", 1, shifted) == [(1, shifted[0]), (2, shifted[1]), (3, shifted[2])]
+    assert set(store.get_pdf_states("T", 1).values()) == {PDF_PENDING}
+
+
+def test_add_pdfs_keeps_scopes_apart(store):
+    store.add_pdfs("T", 1, LINKS)
+    store.set_pdf_state("T", 1, 1, PDF_DOWNLOADED)
+    assert store.add_pdfs("H", 1, LINKS[:1]) == [(1, LINKS[0])]
+
+
+def test_list_unfinished_pdfs_only_covers_completed_pages(store):
+    save_completed_pages(store, "T", 1, 1, 3, completed=[1, 2])
+    for page in (1, 2, 3):
+        store.add_pdfs("T", page, LINKS)
+        store.set_pdf_state("T", page, 1, PDF_DOWNLOADED)
+    store.set_pdf_state("T", 2, 2, PDF_FAILED)
+
+    unfinished = store.list_unfinished_pdfs()
+    # Page 3 chưa xong: crawl lại page đó sẽ đăng ký link của nó
+    assert [(page, pdf_index) for _, page, pdf_index, _ in unfinished] == [(1, 2), (1, 3), (2, 2), (2, 3)]
+    assert [row[1:3] for row in store.list_unfinished_pdfs("T", start_page=2, end_page=2)] == [(2, 2), (2, 3)]
+    assert store.list_unfinished_pdfs("H") == []
+
+
+def test_list_downloaded_pdfs_and_add_downloaded(store):
+    save_completed_pages(store, "T", 1, 1, 5, completed=[1])
+    save_completed_pages(store, "T", 2, 6, 10, completed=[])
+    store.add_pdfs("T", 7, LINKS[:2])
+    store.set_pdf_state("T", 7, 2, PDF_DOWNLOADED, filename="b.pdf")
+
+    assert store.list_downloaded_pdfs() == [("T", 7, 2, LINKS[1], "b.pdf")]
+    store.add_downloaded("T", 7)
+    assert store.load_batch("T", 2)["total_pdfs_downloaded"] == 1
+    assert store.load_batch("T", 1)["total_pdfs_downloaded"] == 0
+
+
+def test_add_pdfs_resets_only_positions_whose_link_changed(store):
+    store.add_pdfs("T", 1, LINKS)
+    store.set_pdf_state("T", 1, 1, PDF_CONVERTED, filename="T_1_1.pdf")
+    store.set_pdf_state("T", 1, 2, PDF_DOWNLOADED, filename="T_1_2.pdf")
+    store.set_pdf_state("T", 1, 3, PDF_DOWNLOADED, filename="T_1_3.pdf")
+
+    changed = LINKS[:2] + ["https://example.test/new/chi-tiet-ban-an"]
+    assert store.add_pdfs("T", 1, changed) == [(3, changed[2])]
+    # Hàng đã tải/convert của đúng link đó giữ nguyên trạng thái và tên file
+    assert store.get_pdf_states("T", 1) == {1: PDF_CONVERTED, 2: PDF_DOWNLOADED, 3: PDF_PENDING}
+    assert store.list_downloaded_pdfs() == [("T", 1, 2, LINKS[1], "T_1_2.pdf")]
+
+
+@pytest.fixture
+def requeue(tmp_path, monkeypatch, store):
+    """Temp dataset dir and indexes for requeue_downloaded_pdfs; returns the list of queued (path, metadata)."""
+    dataset_dir = tmp_path / "dataset"
+    dataset_dir.mkdir()
+    dedup, metadata = DedupIndex(str(tmp_path / "dedup.sqlite3")), MetadataIndex(str(tmp_path / "meta.sqlite3"))
+    monkeypatch.setattr(crawl_url_pdf, "DATASET_DIR", str(dataset_dir))
+    monkeypatch.setattr(crawl_url_pdf, "get_dedup_index", lambda: dedup)
+    monkeypatch.setattr(crawl_url_pdf, "get_metadata_index", lambda: metadata)
+    queued = []
+    monkeypatch.setattr(crawl_url_pdf, "enqueue_for_conversion",
+                        lambda file_path, metadata=None: queued.append((file_path, metadata)))
+    return dataset_dir, dedup, metadata, queued
+
+
+def test_requeue_downloaded_pdfs(store, requeue):
+    dataset_dir, dedup, metadata, queued = requeue
+    store.add_pdfs("T", 1, LINKS)
+    for pdf_index, status in ((1, PDF_DOWNLOADED), (2, PDF_CONVERTED), (3, PDF_DOWNLOADED)):
+        store.set_pdf_state("T", 1, pdf_index, status, filename=f"T_1_{pdf_index}.pdf")
+    (dataset_dir / "T_1_1.pdf").write_bytes(b"%PDF")
+    (dataset_dir / "T_1_2.pdf").write_bytes(b"%PDF")
+    dedup.record("a", LINKS[0], "https://example.test/a.pdf", "hash-a", "T_1_1.pdf")
+    metadata.record("a", LINKS[0], {"court": "TAND tỉnh Bình Dương", "year": 2023})
+
+    # T_1_3.pdf không còn trên đĩa, T_1_2.pdf đã convert: chỉ T_1_1.pdf được đưa lại
+    assert crawl_url_pdf.requeue_downloaded_pdfs() == 1
+    [(file_path, item_metadata)] = queued
+    assert file_path == os.path.join(str(dataset_dir), "T_1_1.pdf")
+    assert item_metadata["id"] == "a"
+    assert (item_metadata["page"], item_metadata["pdf_index"]) == (1, 1)
+    assert item_metadata["pdf_url"] == "https://example.test/a.pdf"
+    assert item_metadata["court"] == "TAND tỉnh Bình Dương"
+
+
+def test_requeue_with_nothing_downloaded(store, requeue):
+    assert crawl_url_pdf.requeue_downloaded_pdfs() == 0
+    assert requeue[3] == []
@@ -0,0 +1,95 @@
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+import crawl_utils
+import main_batch
+from config import PAGE_RETRY_LIMIT
+
+DETAIL_LINK = '<a href="/2ta10001001t1cvn/chi-tiet-ban-an">Bản án</a>'
+DROP_PAGES = ('<select name="ctl00$Content_home_Public$ctl00$DropPages">'
+              '<option value="1">1</option><option value="2">2</option><option value="7">7</option></select>')
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, text):
+        self.text = text
+
+    def post(self, *args, **kwargs):
+        return FakeResponse(self.text)
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(crawl_utils.time, "sleep", lambda seconds: None)
+
+
+def serve(monkeypatch, *results):
+    """initialize_session returns (or raises) the given results in order; returns the call counter."""
+    calls = []
+
+    def initialize_session():
+        result = results[min(len(calls), len(results) - 1)]
+        calls.append(result)
+        if isinstance(result, Exception):
+            raise result
+        return FakeSession(result), {}
+
+    monkeypatch.setattr(crawl_utils, "initialize_session", initialize_session)
+    return calls
+
+
+def test_probe_reads_drop_pages(monkeypatch, no_sleep):
+    serve(monkeypatch, DETAIL_LINK + DROP_PAGES)
+    assert crawl_utils.probe_search("T", "") == (7, 1)
+
+
+def test_probe_without_drop_pages_is_one_page_or_none(monkeypatch, no_sleep):
+    serve(monkeypatch, DETAIL_LINK)
+    assert crawl_utils.probe_search("T", "") == (1, 1)
+    serve(monkeypatch, "<div>Không có kết quả</div>")
+    assert crawl_utils.probe_search("T", "") == (0, 0)
+
+
+def test_probe_retries_request_failures(monkeypatch, no_sleep):
+    calls = serve(monkeypatch, RequestsConnectionError("reset"), DETAIL_LINK + DROP_PAGES)
+    assert crawl_utils.probe_search("T", "") == (7, 1)
+    assert len(calls) == 2
+
+
+def test_probe_gives_up_after_retry_limit(monkeypatch, no_sleep):
+    calls = serve(monkeypatch, RequestsConnectionError("reset"))
+    assert crawl_utils.probe_search("T", "") == (None, 0)
+    assert len(calls) == PAGE_RETRY_LIMIT
+
+
+def probe_results(monkeypatch, results):
+    monkeypatch.setattr(main_batch, "probe_search",
+                        lambda drop_levels, keyword, filters=None, sample_detail=False: results[drop_levels])
+
+
+def test_plan_jobs_skips_scopes_whose_probe_failed(store, monkeypatch):
+    probe_results(monkeypatch, {"T": (None, 0), "H": (6, 20)})
+    jobs = main_batch.plan_jobs(["T", "H"], [{}], max_pages=None, num_workers=2, batch_size=3)
+    # Không đoán số page (DEFAULT_MAX_PAGES) cho cấp dò lỗi
+    assert jobs == [("H", {}, 6, 3)]
+
+
+def test_plan_jobs_caps_pages_and_skips_empty_scopes(store, monkeypatch):
+    probe_results(monkeypatch, {"T": (40, 20), "H": (0, 0)})
+    jobs = main_batch.plan_jobs(["T", "H"], [{}], max_pages=10, num_workers=1, total_batches=2)
+    assert jobs == [("T", {}, 10, 5)]
+
+
+def test_plan_jobs_keeps_batch_size_of_existing_checkpoints(store, monkeypatch):
+    from checkpoint_utils import create_checkpoint_structure
+    store.save_batch(create_checkpoint_structure("T", 1, 1, 4, 12, 4))
+    probe_results(monkeypatch, {"T": (12, 20)})
+    assert main_batch.plan_jobs(["T"], [{}], batch_size=6) == [("T", {}, 12, 4)]
@@ -0,0 +1,61 @@
+import json
+
+from checkpoint_utils import create_checkpoint_structure
+from progress_store import ProgressStore
+
+
+def test_save_and_load_batch_round_trip(store):
+    checkpoint_data = create_checkpoint_structure("T", 1, 1, 5, 5, 5)
+    checkpoint_data["completed_pages"] = {1, 2}
+    checkpoint_data["failed_pages"] = {4}
+    checkpoint_data["page_retry_counts"] = {"4": 2}
+    checkpoint_data["total_links_found"] = 40
+    store.save_batch(checkpoint_data)
+
+    loaded = store.load_batch("T", 1)
+    assert loaded["completed_pages"] == {1, 2}
+    assert loaded["failed_pages"] == {4}
+    assert loaded["page_retry_counts"] == {"4": 2}
+    assert loaded["total_links_found"] == 40
+    assert loaded["is_completed"] is False
+    assert store.get_batch_size("T") == 5
+    assert store.load_batch("T", 2) is None
+
+
+def test_later_saves_update_changed_pages(store):
+    checkpoint_data = create_checkpoint_structure("T", 1, 1, 5, 5, 5)
+    checkpoint_data["failed_pages"] = {3}
+    checkpoint_data["page_retry_counts"] = {"3": 1}
+    store.save_batch(checkpoint_data)
+
+    # Page 3 thành công ở lần retry: chỉ page này được ghi lại
+    checkpoint_data["failed_pages"].discard(3)
+    checkpoint_data["completed_pages"] = {1, 3}
+    checkpoint_data["is_completed"] = True
+    store.save_batch(checkpoint_data)
+
+    loaded = ProgressStore(store.db_path).load_batch("T", 1)
+    assert loaded["completed_pages"] == {1, 3}
+    assert loaded["failed_pages"] == set()
+    assert loaded["is_completed"] is True
+
+
+def test_batches_of_scopes_are_kept_apart(store):
+    for scope in ("T", "H"):
+        store.save_batch(create_checkpoint_structure(scope, 1, 1, 4, 8, 4))
+    store.save_batch(create_checkpoint_structure("T", 2, 5, 8, 8, 4))
+    assert store.list_batches() == [("H", 1), ("T", 1), ("T", 2)]
+
+
+def test_import_json_checkpoints(store, tmp_path):
+    legacy = {"drop_levels": "T", "batch_number": 1, "batch_size": 5, "max_pages": 5, "start_page": 1,
+              "end_page": 5, "last_processed_page": 2, "total_links_found": 40, "total_pdfs_downloaded": 38,
+              "completed_pages": [1, 2], "failed_pages": [], "page_retry_counts": {}, "is_completed": False}
+    (tmp_path / "checkpoint_T_1.json").write_text(json.dumps(legacy), encoding="utf-8")
+    (tmp_path / "checkpoint_H_1.json").write_text("{broken", encoding="utf-8")
+
+    assert store.import_json_checkpoints(str(tmp_path)) == 1
+    assert store.load_batch("T", 1)["completed_pages"] == {1, 2}
+    assert (tmp_path / "checkpoint_T_1.json.imported").exists()
+    # File hỏng được giữ nguyên để kiểm tra bằng tay
+    assert (tmp_path / "checkpoint_H_1.json").exists()
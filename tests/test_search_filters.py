@@ -0,0 +1,58 @@
+import pytest
+
+from config import SEARCH_FORM_FIELDS
+from search_filters import build_search_fields, iter_filter_shards, normalize_filters, scope_key
+
+
+def test_normalize_filters_drops_empty_values():
+    assert normalize_filters({"court": " 12 ", "keyword": "", "case_type": None}) == {"court": "12"}
+    assert normalize_filters(None) == {}
+
+
+@pytest.mark.parametrize("filters", [
+    {"judge": "x"},
+    {"date_from": "2023-01-01"},
+    {"date_from": "02/01/2023", "date_to": "01/01/2023"},
+])
+def test_normalize_filters_rejects_bad_filters(filters):
+    with pytest.raises(ValueError):
+        normalize_filters(filters)
+
+
+def test_scope_key():
+    # Không lọc: giữ tên cũ để checkpoint và tên file không đổi
+    assert scope_key("T") == "T"
+    assert scope_key("T", {"keyword": ""}) == "T"
+    key = scope_key("T", {"court": "12", "case_type": "1"})
+    assert key.startswith("T-") and len(key) == 10
+    assert key == scope_key("T", {"case_type": "1", "court": "12"})
+    assert key != scope_key("H", {"court": "12", "case_type": "1"})
+    assert key != scope_key("T", {"court": "13", "case_type": "1"})
+
+
+def test_build_search_fields():
+    fields = build_search_fields("T", "vay", {"court": "12", "case_type": "1"})
+    assert fields["ctl00$Content_home_Public$ctl00$txtKeyword"] == "vay"
+    assert fields["ctl00$Content_home_Public$ctl00$Drop_Levels"] == "T"
+    assert fields[SEARCH_FORM_FIELDS["court"]] == "12"
+    assert fields[SEARCH_FORM_FIELDS["case_type"]] == "1"
+    assert fields[SEARCH_FORM_FIELDS["date_from"]] == ""
+    assert SEARCH_FORM_FIELDS["date_to"] not in fields
+    # Keyword của bộ lọc thắng keyword truyền vào
+    assert build_search_fields("T", "vay", {"keyword": "thuê"})["ctl00$Content_home_Public$ctl00$txtKeyword"] == "thuê"
+
+
+def test_shards_per_court_and_month():
+    shards = list(iter_filter_shards({"date_from": "15/01/2024", "date_to": "10/03/2024", "case_type": "1"},
+                                     courts=["1", "2"], split_by_month=True))
+    assert len(shards) == 6
+    assert [(shard["date_from"], shard["date_to"]) for shard in shards[:3]] == [
+        ("15/01/2024", "31/01/2024"), ("01/02/2024", "29/02/2024"), ("01/03/2024", "10/03/2024")]
+    assert {shard["court"] for shard in shards} == {"1", "2"}
+    assert all(shard["case_type"] == "1" for shard in shards)
+
+
+def test_shards_without_splitting_keep_base_filters():
+    assert list(iter_filter_shards({"court": "5"})) == [{"court": "5"}]
+    with pytest.raises(ValueError):
+        list(iter_filter_shards({"date_from": "01/01/2024"}, split_by_month=True))
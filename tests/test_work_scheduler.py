@@ -0,0 +1,132 @@
+from checkpoint_utils import create_checkpoint_structure, save_checkpoint
+from work_scheduler import NO_WORK_YET, WorkScheduler, build_scheduler, get_pending_pages, _resize_tail
+
+
+def new_checkpoint(batch_num=1, start_page=1, end_page=8, scope="T"):
+    return create_checkpoint_structure(scope, batch_num, start_page, end_page, end_page, end_page - start_page + 1)
+
+
+def test_claim_walks_a_range_in_order(store):
+    scheduler = WorkScheduler(split_min_pages=2)
+    scheduler.add_batch(new_checkpoint(end_page=3), [1, 2, 3])
+
+    current, page = scheduler.try_claim()
+    pages = [page]
+    while True:
+        claimed = scheduler.try_claim(current)
+        if claimed is NO_WORK_YET or claimed is None:
+            break
+        current, page = claimed
+        pages.append(page)
+    assert pages == [1, 2, 3]
+
+
+def test_pending_pages_are_queued_as_contiguous_ranges(store):
+    scheduler = WorkScheduler(split_min_pages=2)
+    scheduler.add_batch(new_checkpoint(), [1, 2, 5, 6, 7])
+
+    first, page = scheduler.try_claim()
+    assert (page, first.end) == (1, 2)
+    second, page = scheduler.try_claim()
+    assert (page, second.end) == (5, 7)
+
+
+def test_idle_worker_steals_upper_half_of_longest_range(store):
+    scheduler = WorkScheduler(split_min_pages=2)
+    scheduler.add_batch(new_checkpoint(), range(1, 9))
+
+    current, page = scheduler.try_claim()
+    assert page == 1
+    stolen, page = scheduler.try_claim()
+    # Range 2-8 còn 7 page: worker rảnh lấy 5-8, worker đầu giữ 2-4
+    assert page == 5
+    assert (stolen.next_page, stolen.end) == (6, 8)
+    assert (current.next_page, current.end) == (2, 4)
+
+
+def test_short_ranges_are_not_split(store):
+    scheduler = WorkScheduler(split_min_pages=2)
+    scheduler.add_batch(new_checkpoint(end_page=4), range(1, 5))
+
+    scheduler.try_claim()
+    # Còn 3 page < 2 * split_min_pages: không chia, nhưng page đang chạy nên chưa hết việc
+    assert scheduler.try_claim() is NO_WORK_YET
+
+
+def test_failed_page_is_requeued_until_retry_limit(store):
+    scheduler = WorkScheduler(split_min_pages=2, max_retries=2)
+    checkpoint_data = new_checkpoint(end_page=1)
+    scheduler.add_batch(checkpoint_data, [1])
+    batch = ("T", 1)
+
+    current, page = scheduler.try_claim()
+    assert scheduler.finish_page(batch, page, 0, False) is True
+    assert not checkpoint_data["is_completed"]
+    current, page = scheduler.try_claim(current)
+    assert page == 1
+    assert scheduler.finish_page(batch, page, 0, False) is False
+    assert checkpoint_data["is_completed"]
+    assert scheduler.try_claim(current) is None
+    assert store.load_batch("T", 1)["page_retry_counts"] == {"1": 2}
+
+
+def test_batch_completes_when_every_page_is_finished(store):
+    scheduler = WorkScheduler(split_min_pages=2)
+    checkpoint_data = new_checkpoint(end_page=2)
+    scheduler.add_batch(checkpoint_data, [1, 2])
+
+    current, page = scheduler.try_claim()
+    scheduler.finish_page(current.batch, page, 20, True)
+    assert not checkpoint_data["is_completed"]
+    current, page = scheduler.try_claim(current)
+    scheduler.finish_page(current.batch, page, 15, True)
+    assert checkpoint_data["is_completed"]
+    saved = store.load_batch("T", 1)
+    assert saved["completed_pages"] == {1, 2}
+    assert saved["total_links_found"] == 35
+
+
+def test_batch_without_pending_pages_is_completed(store):
+    checkpoint_data = new_checkpoint(end_page=2)
+    WorkScheduler().add_batch(checkpoint_data, [])
+    assert checkpoint_data["is_completed"]
+
+
+def test_resize_tail_grows_and_reopens_the_last_batch():
+    checkpoint_data = new_checkpoint(start_page=9, end_page=10)
+    checkpoint_data["completed_pages"] = {9, 10}
+    checkpoint_data["is_completed"] = True
+
+    assert _resize_tail(checkpoint_data, 12, 12) is True
+    assert (checkpoint_data["end_page"], checkpoint_data["max_pages"]) == (12, 12)
+    assert not checkpoint_data["is_completed"]
+    assert get_pending_pages(checkpoint_data) == [11, 12]
+
+
+def test_resize_tail_shrinks_the_last_batch():
+    checkpoint_data = new_checkpoint(start_page=9, end_page=12)
+    checkpoint_data["completed_pages"] = {9}
+
+    assert _resize_tail(checkpoint_data, 10, 10) is True
+    assert get_pending_pages(checkpoint_data) == [10]
+    assert _resize_tail(checkpoint_data, 10, 10) is False
+
+
+def test_build_scheduler_resumes_from_saved_checkpoints(store):
+    checkpoint_data = new_checkpoint(batch_num=2, start_page=5, end_page=8)
+    checkpoint_data["completed_pages"] = {5, 6}
+    save_checkpoint(checkpoint_data)
+
+    # Số page giảm từ 8 xuống 7: batch cuối được cắt bớt
+    scheduler = build_scheduler([("T", None, 7, 4)])
+    assert set(scheduler.checkpoints) == {("T", 1), ("T", 2)}
+    assert scheduler.checkpoints[("T", 2)]["end_page"] == 7
+    claimed = []
+    current = None
+    while True:
+        result = scheduler.try_claim(current)
+        if result is None or result is NO_WORK_YET:
+            break
+        current, page = result
+        claimed.append(page)
+    assert sorted(claimed) == [1, 2, 3, 4, 7]
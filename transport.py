@@ -0,0 +1,133 @@
+import time
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import (HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HOST_CONCURRENCY, DEFAULT_HOST_CONCURRENCY,
+                    RATE_LIMIT_ENABLED)
+from rate_limiter import get_rate_limiter, is_overload_status
+
+# Lỗi mạng tính là server quá tải (timeout, mất kết nối)
+OVERLOAD_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def get_host(url):
+    return urlsplit(url).netloc
+
+
+def get_host_limit(host):
+    return HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY)
+
+
+class Transport:
+    """HTTP transport shared by crawl_utils and crawl_url_pdf.
+
+    Every session created here mounts the same HTTPAdapter, so all batches draw
+    keep-alive connections from one sized pool instead of repeating TCP/TLS
+    handshakes per batch. Sessions keep their own cookie jar (ASP.NET state),
+    the number of in-flight requests is capped per host, and every request
+    goes through the shared adaptive rate limiter when one is given.
+    """
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, limiter=None):
+        # pool_block: khi pool đầy thì chờ kết nối rảnh thay vì mở thêm kết nối ngoài pool
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.limiter = limiter
+
+    def host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(get_host_limit(host))
+                self._host_slots[host] = slot
+            return slot
+
+    def held_hosts(self):
+        # Host mà luồng hiện tại đang giữ slot (redirect gọi lại send trong cùng luồng)
+        if not hasattr(self._local, "hosts"):
+            self._local.hosts = set()
+        return self._local.hosts
+
+    def new_session(self):
+        return PooledSession(self)
+
+
+class PooledSession(requests.Session):
+    """requests.Session on the shared pool that respects the per-host concurrency cap."""
+
+    def __init__(self, transport):
+        super().__init__()
+        self.transport = transport
+        self.mount("https://", transport.adapter)
+        self.mount("http://", transport.adapter)
+
+    def send(self, request, **kwargs):
+        host = get_host(request.url)
+        held = self.transport.held_hosts()
+        if host in held:
+            return super().send(request, **kwargs)
+        slot = self.transport.host_slot(host)
+        limiter = self.transport.limiter
+        slot.acquire()
+        if limiter is not None:
+            try:
+                limiter.acquire()
+            except BaseException:
+                # Bị ngắt khi đang chờ limiter (Ctrl+C, timeout): trả slot, nếu không host bị khóa vĩnh viễn
+                slot.release()
+                raise
+        held.add(host)
+        started = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except BaseException as e:
+            if limiter is not None:
+                limiter.release(time.monotonic() - started, error=isinstance(e, OVERLOAD_ERRORS))
+            slot.release()
+            raise
+        finally:
+            held.discard(host)
+        latency = time.monotonic() - started
+        error = is_overload_status(response.status_code)
+
+        def release():
+            if limiter is not None:
+                limiter.release(latency, error)
+            slot.release()
+
+        if kwargs.get("stream"):
+            # Response stream còn giữ kết nối: chỉ trả slot khi response được đóng
+            _call_once_on_close(response, release)
+        else:
+            release()
+        return response
+
+
+def _call_once_on_close(response, callback):
+    original_close = response.close
+    called = []
+
+    def close():
+        try:
+            original_close()
+        finally:
+            if not called:
+                called.append(True)
+                callback()
+
+    response.close = close
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport(limiter=get_rate_limiter() if RATE_LIMIT_ENABLED else None)
+        return _transport
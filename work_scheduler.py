@@ -0,0 +1,332 @@
+import itertools
+import threading
+import collections
+from config import (PAGE_RETRY_LIMIT, WORK_SPLIT_MIN_PAGES, DEFAULT_BATCH_SIZE, MIN_BATCH_SIZE, MAX_BATCH_SIZE,
+                    BATCH_TARGET_SECONDS, BATCHES_PER_WORKER)
+from checkpoint_utils import (create_checkpoint_structure, get_checkpoint_filename, get_saved_batch_size,
+                              get_unfinished_pdfs, load_checkpoint, save_checkpoint, update_checkpoint_progress)
+from progress_store import PDF_DOWNLOADED
+from search_filters import scope_key, describe_scope
+from metrics import get_logger
+
+log = get_logger("scheduler")
+
+# try_claim: chưa có việc ngay nhưng còn page đang chạy (có thể sinh retry hoặc range để chia)
+NO_WORK_YET = "wait"
+_WAIT_SECONDS = 0.5
+
+
+class PageRange:
+    """Contiguous pages of one batch of one scope; `end` shrinks when an idle worker steals the tail."""
+
+    __slots__ = ("scope", "batch_num", "next_page", "end")
+
+    def __init__(self, scope, batch_num, start, end):
+        self.scope = scope
+        self.batch_num = batch_num
+        self.next_page = start
+        self.end = end
+
+    @property
+    def batch(self):
+        return self.scope, self.batch_num
+
+    def remaining(self):
+        return self.end - self.next_page + 1
+
+
+class WorkScheduler:
+    """Shared queue of page ranges that idle workers pull from, replacing round-robin batches.
+
+    Each batch contributes ranges of its pending pages; batches of several
+    scopes (court levels / search filters) can share one scheduler, keyed by
+    (scope, batch_num), so one worker pool crawls all of them. A worker claims one
+    page at a time from its current range; when the queue is empty an idle
+    worker splits the range with the most pages left and takes its upper
+    half, so no worker sits idle while another still has a long tail.
+    Failed pages go back into the queue until PAGE_RETRY_LIMIT. Batches keep
+    their own checkpoint (shared by every worker touching the batch) and are
+    marked completed once none of their pages is outstanding.
+    """
+
+    def __init__(self, split_min_pages=WORK_SPLIT_MIN_PAGES, max_retries=PAGE_RETRY_LIMIT):
+        self.split_min_pages = split_min_pages
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._queue = collections.deque()
+        self._active = []
+        self._in_flight = 0
+        self.checkpoints = {}
+        self.scopes = {}
+        self._batch_locks = {}
+        self._outstanding = {}
+
+    def add_scope(self, drop_levels, filters=None):
+        """Remember the court level and filters behind a scope key, so workers can query it."""
+        scope = scope_key(drop_levels, filters)
+        self.scopes[scope] = (drop_levels, filters)
+        return scope
+
+    def add_batch(self, checkpoint_data, pending_pages):
+        """Register a batch (its shared checkpoint dict) and queue its pending pages as contiguous ranges."""
+        scope = checkpoint_data["drop_levels"]
+        batch = (scope, checkpoint_data["batch_number"])
+        pending_pages = sorted(pending_pages)
+        with self._lock:
+            self.checkpoints[batch] = checkpoint_data
+            self._batch_locks[batch] = threading.Lock()
+            self._outstanding[batch] = len(pending_pages)
+            if not pending_pages:
+                # Mọi page đã xong hoặc hết lượt retry: batch coi như hoàn thành như batch_worker cũ
+                checkpoint_data["is_completed"] = True
+            start = previous = None
+            for page in pending_pages:
+                if start is None:
+                    start = previous = page
+                elif page == previous + 1:
+                    previous = page
+                else:
+                    self._queue.append(PageRange(*batch, start, previous))
+                    start = previous = page
+            if start is not None:
+                self._queue.append(PageRange(*batch, start, previous))
+
+    def _take_page(self, page_range):
+        page = page_range.next_page
+        page_range.next_page += 1
+        self._in_flight += 1
+        return page_range, page
+
+    def _steal(self):
+        victim = max(self._active, key=PageRange.remaining, default=None)
+        if victim is None or victim.remaining() < 2 * self.split_min_pages:
+            return None
+        middle = victim.next_page + victim.remaining() // 2
+        stolen = PageRange(victim.scope, victim.batch_num, middle, victim.end)
+        victim.end = middle - 1
+        return stolen
+
+    def _try_claim_locked(self, current):
+        if current is not None:
+            if current.remaining() > 0:
+                return self._take_page(current)
+            if current in self._active:
+                self._active.remove(current)
+        page_range = self._queue.popleft() if self._queue else self._steal()
+        if page_range is not None:
+            self._active.append(page_range)
+            return self._take_page(page_range)
+        if self._in_flight or any(r.remaining() > 0 for r in self._active):
+            return NO_WORK_YET
+        return None
+
+    def try_claim(self, current=None):
+        """Non-blocking claim: (range, page), NO_WORK_YET, or None when every page is done."""
+        with self._lock:
+            return self._try_claim_locked(current)
+
+    def claim(self, current=None):
+        """Blocking claim for worker threads: (range, page) or None when every page is done."""
+        with self._work_available:
+            while True:
+                result = self._try_claim_locked(current)
+                if result is not NO_WORK_YET:
+                    return result
+                current = None
+                self._work_available.wait(_WAIT_SECONDS)
+
+    def finish_page(self, batch, page, links_found, success):
+        """Record a crawled page in its batch checkpoint; failed pages are re-queued until the retry limit.
+
+        Args:
+            batch: (scope, batch_num) key, as in PageRange.batch.
+        Returns:
+            bool: True if the page was queued again for a retry.
+        """
+        checkpoint_data = self.checkpoints[batch]
+        with self._batch_locks[batch]:
+            update_checkpoint_progress(checkpoint_data, page, links_found, success)
+            retries = checkpoint_data.get("page_retry_counts", {}).get(str(page), 0)
+            requeue = not success and retries < self.max_retries
+            with self._lock:
+                if not requeue:
+                    self._outstanding[batch] -= 1
+                checkpoint_data["is_completed"] = self._outstanding[batch] == 0
+            save_checkpoint(checkpoint_data)
+            if checkpoint_data["is_completed"] and not requeue:
+                log.info(f"[BATCH {batch_label(batch)}] 🎉 HOÀN THÀNH!")
+        with self._work_available:
+            if requeue:
+                self._queue.append(PageRange(*batch, page, page))
+            self._in_flight -= 1
+            self._work_available.notify_all()
+        return requeue
+
+    def count_download(self, batch, future):
+        error = future.exception()
+        if error is not None:
+            log.warning(f"[BATCH {batch_label(batch)}]    ❌ Lỗi download: {error}")
+            return
+        if future.result() != PDF_DOWNLOADED:
+            return
+        with self._batch_locks[batch]:
+            checkpoint_data = self.checkpoints[batch]
+            checkpoint_data["total_pdfs_downloaded"] = checkpoint_data.get("total_pdfs_downloaded", 0) + 1
+
+    def unfinished_pdfs(self):
+        """Yield (batch, page, pdf_index, detail_url) of PDFs on already crawled pages that were never downloaded."""
+        for batch, checkpoint_data in self.checkpoints.items():
+            for _, page, pdf_index, detail_url in get_unfinished_pdfs(
+                    batch[0], checkpoint_data["start_page"], checkpoint_data["end_page"]):
+                yield batch, page, pdf_index, detail_url
+
+    def save_all(self):
+        for batch, checkpoint_data in self.checkpoints.items():
+            with self._batch_locks[batch]:
+                save_checkpoint(checkpoint_data)
+
+
+def batch_label(batch):
+    scope, batch_num = batch
+    return f"{scope}/{batch_num}"
+
+
+def get_pending_pages(checkpoint_data, max_retries=PAGE_RETRY_LIMIT):
+    """Pages of a batch still to crawl: not completed and, if failed before, retries left."""
+    retry_counts = checkpoint_data.get("page_retry_counts", {})
+    completed = checkpoint_data.get("completed_pages", set())
+    return [page for page in range(checkpoint_data["start_page"], checkpoint_data["end_page"] + 1)
+            if page not in completed and retry_counts.get(str(page), 0) < max_retries]
+
+
+def batch_ranges(max_pages, batch_size):
+    """Yield (batch_num, start_page, end_page) of the fixed-size batches covering pages 1..max_pages."""
+    total_batches = (max_pages + batch_size - 1) // batch_size
+    for batch_num in range(1, total_batches + 1):
+        yield batch_num, (batch_num - 1) * batch_size + 1, min(batch_num * batch_size, max_pages)
+
+
+def choose_batch_size(pages, num_workers, page_seconds=None):
+    """Batch size for `pages` pages crawled by `num_workers` workers.
+
+    A batch should take about BATCH_TARGET_SECONDS of one worker's time
+    (`page_seconds` per page; DEFAULT_BATCH_SIZE when nothing was measured)
+    while still giving every worker BATCHES_PER_WORKER batches. The result
+    is clamped to MIN/MAX_BATCH_SIZE and evened out so the last batch is not
+    a small remainder.
+    """
+    if pages <= 0:
+        return MIN_BATCH_SIZE
+    size = -(-pages // (max(num_workers, 1) * BATCHES_PER_WORKER))
+    size = min(size, int(BATCH_TARGET_SECONDS / page_seconds) if page_seconds else DEFAULT_BATCH_SIZE)
+    size = max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, size))
+    total_batches = -(-pages // size)
+    return -(-pages // total_batches)
+
+
+def resolve_batch_size(scope, pages, num_workers, page_seconds=None, batch_size=None, total_batches=None):
+    """Batch size of one scope: the one of its existing checkpoints, else the requested one, else choose_batch_size.
+
+    Args:
+        batch_size: explicit size (--batch-size).
+        total_batches: explicit number of batches of this scope (--batches).
+    """
+    saved = get_saved_batch_size(scope)
+    if saved:
+        if batch_size and batch_size != saved:
+            log.info(f"[{scope}] Giữ batch size {saved} của checkpoint hiện có (bỏ qua {batch_size})")
+        return saved
+    if batch_size:
+        return batch_size
+    if total_batches:
+        return -(-pages // total_batches)
+    return choose_batch_size(pages, num_workers, page_seconds)
+
+
+def _resize_tail(checkpoint_data, end_page, max_pages):
+    # Số page thay đổi từ lần chạy trước: tăng thì nới batch cuối (nếu không sẽ sót phần đuôi),
+    # giảm thì cắt bớt (nếu không các page sau page cuối thật vẫn bị crawl như page rỗng)
+    if checkpoint_data["end_page"] == end_page:
+        return False
+    if checkpoint_data["end_page"] < end_page:
+        checkpoint_data["is_completed"] = False
+    checkpoint_data["end_page"] = end_page
+    checkpoint_data["max_pages"] = max_pages
+    return True
+
+
+def compress_pages(pages):
+    """[1, 2, 3, 7, 9, 10] -> "1-3, 7, 9-10"."""
+    parts = []
+    for _, group in itertools.groupby(enumerate(sorted(pages)), lambda item: item[1] - item[0]):
+        group = [page for _, page in group]
+        parts.append(str(group[0]) if len(group) == 1 else f"{group[0]}-{group[-1]}")
+    return ", ".join(parts)
+
+
+def plan_batches(jobs):
+    """Read-only counterpart of build_scheduler for dry runs: nothing is created or saved.
+
+    Yields:
+        dict per batch: scope, batch_number, start_page, end_page, exists
+        (a checkpoint was found), completed, failed (retry limit reached)
+        and pending (pages a real run would crawl).
+    """
+    for drop_levels, filters, max_pages, batch_size in jobs:
+        scope = scope_key(drop_levels, filters)
+        for batch_num, start_page, end_page in batch_ranges(max_pages, batch_size):
+            checkpoint_data = load_checkpoint(scope, batch_num)
+            if checkpoint_data is None:
+                checkpoint_data = create_checkpoint_structure(
+                    scope, batch_num, start_page, end_page, max_pages, batch_size)
+                exists = False
+            else:
+                _resize_tail(checkpoint_data, end_page, max_pages)
+                exists = True
+            pending = get_pending_pages(checkpoint_data)
+            completed = sorted(checkpoint_data.get("completed_pages", ()))
+            failed = sorted(page for page in range(checkpoint_data["start_page"], checkpoint_data["end_page"] + 1)
+                            if page not in pending and page not in completed)
+            yield {"scope": scope, "batch_number": batch_num, "start_page": checkpoint_data["start_page"],
+                   "end_page": checkpoint_data["end_page"], "exists": exists,
+                   "completed": completed, "failed": failed, "pending": pending}
+
+
+def _load_batches(scope, scope_name, max_pages, batch_size):
+    """Load or create the checkpoint of every batch of one scope; yields (checkpoint, pending_pages)."""
+    for batch_num, start_page, end_page in batch_ranges(max_pages, batch_size):
+        checkpoint_data = load_checkpoint(scope, batch_num)
+        if checkpoint_data is None:
+            checkpoint_data = create_checkpoint_structure(
+                scope, batch_num, start_page, end_page, max_pages, batch_size, scope_name)
+            save_checkpoint(checkpoint_data)
+            log.info(f"[BATCH {batch_num}] 🆕 Tạo checkpoint mới: {get_checkpoint_filename(scope, batch_num)}")
+        elif _resize_tail(checkpoint_data, end_page, max_pages):
+            save_checkpoint(checkpoint_data)
+            log.info(f"[BATCH {scope}/{batch_num}] 📏 Số page thay đổi: batch kết thúc ở page {end_page}")
+        pending_pages = get_pending_pages(checkpoint_data)
+        if pending_pages:
+            log.info(f"[BATCH {scope}/{batch_num}] 📋 {len(pending_pages)} page cần crawl ({start_page}-{end_page})")
+        yield checkpoint_data, pending_pages
+
+
+def build_scheduler(jobs):
+    """Load or create the checkpoint of every batch of every job and queue its pending pages.
+
+    Args:
+        jobs: iterable of (drop_levels, filters, max_pages, batch_size), one per court level /
+            search shard (see main_batch.plan_jobs).
+    Batches of different jobs are queued interleaved (batch 1 of each job,
+    then batch 2...) so every level makes progress from the start.
+    """
+    scheduler = WorkScheduler()
+    per_job = []
+    for drop_levels, filters, max_pages, batch_size in jobs:
+        scope = scheduler.add_scope(drop_levels, filters)
+        per_job.append(list(_load_batches(scope, describe_scope(drop_levels, filters), max_pages, batch_size)))
+    for batches in itertools.zip_longest(*per_job):
+        for batch in batches:
+            if batch is not None:
+                scheduler.add_batch(*batch)
+    return scheduler